@@ -28,13 +28,58 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
-from cish.pyenv import from_config
-from cish.pyenv import interpeter_pyenv
-from cish.pyenv import from_interpreter
-from cish.pyenv import from_virtualenv
-from cish.commands import pwd, cd, mkdirs, rm
+# The names are imported on first access (PEP 562), so that `import cish`
+# costs next to nothing for scripts that only need a few of them.
+_exports = {
+    "from_config": "cish.pyenv",
+    "from_interpreter": "cish.pyenv",
+    "from_virtualenv": "cish.pyenv",
+    "from_path": "cish.pyenv",
+    "discover": "cish.discovery",
+    "pwd": "cish.commands",
+    "cd": "cish.commands",
+    "mkdirs": "cish.commands",
+    "mkdirs_many": "cish.commands",
+    "rm": "cish.commands",
+    "rm_many": "cish.commands",
+    "rm_wait": "cish.commands",
+    "sync": "cish.commands",
+    "run_matrix": "cish.matrix",
+    "VenvCache": "cish.venvcache",
+    "VenvPool": "cish.venvpool",
+    "Wheelhouse": "cish.wheelhouse",
+    "step": "cish.steps",
+    "StepCache": "cish.steps",
+    "TaskGraph": "cish.tasks",
+    "run_sharded": "cish.sharding",
+    "Cluster": "cish.remote",
+}
 
-default = interpeter_pyenv()
-del interpeter_pyenv
+_submodules = {"trace", "profiling", "memo"}
 
+#: Environments created on first access, with the factory that creates them.
+_environments = {
+    "default": "interpeter_pyenv",
+    "sh": "from_path",
+}
 
+__all__ = sorted(set(_exports) | _submodules | set(_environments))
+
+
+def __getattr__(name):
+    import importlib
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name]), name)
+    elif name in _submodules:
+        value = importlib.import_module("cish." + name)
+    elif name in _environments:
+        pyenv = importlib.import_module("cish.pyenv")
+        value = getattr(pyenv, _environments[name])()
+    else:
+        raise AttributeError("module 'cish' has no attribute {name!r}".format(name=name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
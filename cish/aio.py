@@ -0,0 +1,126 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import signal
+import asyncio
+import locale
+import collections
+
+from cish import commands
+
+
+AsyncResult = collections.namedtuple("AsyncResult", ["returncode", "output"])
+AsyncResult.__doc__ = """
+Result of an asynchronous invocation: the exit code and the combined
+stdout and stderr output as a string.
+"""
+
+
+class AsyncInvokers(object):
+    """
+    Asynchronous counterpart of the invokers returned by `PyEnv.__getattr__`.
+    Obtained through :attr:`PyEnv.aio`::
+
+        result = await env.aio.pip("install", "nose", timeout=60)
+        if result.returncode != 0:
+            print(result.output)
+
+    The executables are resolved with :meth:`PyEnv.find_executable`.
+    """
+
+    def __init__(self, env):
+        self._env = env
+
+    def __getattr__(self, name):
+        """
+        Returns a coroutine function that invokes an executable of the
+        environment. Arguments passed to it become command line arguments.
+        """
+        executable = self._env.find_executable(name)
+
+        async def invoker(*args, timeout=None, cwd=None):
+            return await run([executable] + list(args), timeout=timeout, cwd=cwd)
+        return invoker
+
+
+async def run(args, timeout=None, cwd=None):
+    """
+    Runs a command without blocking the event loop.
+
+    The command runs in its own process group (POSIX). If the coroutine is
+    cancelled or the timeout expires, the whole group is killed, so that
+    processes started by the command don't linger around.
+
+    :param args: Command line, starting with the executable.
+
+    :param timeout: Seconds after which the command is killed and
+        `asyncio.TimeoutError` is raised. `None` waits forever.
+
+    :param cwd: Working directory of the command. Defaults to :func:`cish.pwd`
+        of the calling task.
+
+    :returns: :class:`AsyncResult` with exit code and output.
+    """
+    kwargs = {}
+    if os.name == "posix":
+        kwargs["start_new_session"] = True
+
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        cwd=commands.abspath(cwd if cwd is not None else "."),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        **kwargs)
+    try:
+        output, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        _kill(process)
+        await process.wait()
+        raise
+
+    encoding = locale.getpreferredencoding(False)
+    return AsyncResult(process.returncode, output.decode(encoding, "replace"))
+
+
+def _kill(process):
+    """
+    Kills the process and, on POSIX, its entire process group.
+
+    The group is killed even if the process itself already exited, as
+    its children might still be running.
+    """
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        elif process.returncode is None:
+            process.kill()
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,191 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import subprocess
+import threading
+import traceback
+
+from cish import capture
+from cish import commands
+from cish import trace
+
+
+#: Options of `pip install` whose values are merged across requests.
+_MERGEABLE = {"-r", "--requirement", "-c", "--constraint", "-e", "--editable"}
+
+#: Other options of `pip install` that take a value.
+_WITH_VALUE = {
+    "-i", "--index-url", "--extra-index-url", "-f", "--find-links",
+    "-t", "--target", "--prefix", "--root", "--src", "--platform",
+    "--python-version", "--implementation", "--abi", "--no-binary",
+    "--only-binary", "--upgrade-strategy", "--progress-bar", "-C",
+    "--config-settings", "--global-option", "--install-option",
+    "--trusted-host", "--cache-dir", "--log", "--proxy", "--timeout",
+    "--retries", "--cert", "--client-cert", "--exists-action", "--report",
+}
+
+
+class BatchError(subprocess.CalledProcessError):
+    """
+    Raised if a batched `pip install` fails. `call_sites` lists the
+    `(filename, lineno, function)` of the calls whose requests were
+    part of the failed invocation.
+    """
+
+    def __init__(self, returncode, cmd, call_sites, output=None):
+        subprocess.CalledProcessError.__init__(self, returncode, cmd, output)
+        self.call_sites = call_sites
+
+    def __str__(self):
+        sites = "".join("\n  {0}:{1} in {2}".format(*site) for site in self.call_sites)
+        return "Batched command {cmd} failed with exit code {code}. Requested at:{sites}".format(
+            cmd=self.cmd, code=self.returncode, sites=sites)
+
+
+class Batch(object):
+    """
+    Queue of `pip install` requests of an environment, see :meth:`PyEnv.batch`.
+
+    Requests with the same options (apart from packages, requirement,
+    constraint and editable files) made in the same working directory
+    are merged into one invocation, which runs in that directory.
+    """
+
+    def __init__(self, env):
+        self._env = env
+        self._lock = threading.Lock()
+        self._groups = []
+        self._depth = 0
+
+    def add(self, args):
+        """
+        Queues `pip install` with the given arguments (without `install`).
+        """
+        options, values = _split(args)
+        key = (options, commands.pwd())
+        site = _call_site()
+        with self._lock:
+            for group_key, group_values, sites in self._groups:
+                if group_key == key:
+                    for value in values:
+                        if value not in group_values:
+                            group_values.append(value)
+                    sites.append(site)
+                    break
+            else:
+                self._groups.append((key, list(values), [site]))
+
+    @property
+    def pending(self):
+        """
+        Number of `pip install` invocations the queued requests need.
+        """
+        with self._lock:
+            return len(self._groups)
+
+    def flush(self):
+        """
+        Runs the queued requests.
+
+        :raises BatchError: if an invocation fails. Requests that were
+            not run yet are dropped.
+        """
+        with self._lock:
+            groups, self._groups = self._groups, []
+        if not groups:
+            return
+        pip = self._env.find_executable("pip")
+        for (options, cwd), values, sites in groups:
+            args = ["install"] + list(options) + [arg for value in values for arg in value]
+            with trace.span("command", "pip", args, self._env), commands.cd(cwd):
+                try:
+                    if self._env.wheelhouse is not None:
+                        self._env.wheelhouse.install(self._env, *args[1:])
+                    else:
+                        capture.call([pip] + args)
+                except subprocess.CalledProcessError as e:
+                    raise BatchError(e.returncode, e.cmd, sites, e.output)
+
+    def discard(self):
+        with self._lock:
+            self._groups = []
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, type_, value, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            self._env._batch = None
+            if type_ is None:
+                self.flush()
+            else:
+                self.discard()
+        return False
+
+
+def _split(args):
+    """
+    Splits `pip install` arguments into a tuple of the options that
+    must match for requests to be merged, and a list of mergeable
+    values, each a tuple of arguments.
+    """
+    options = []
+    values = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in _MERGEABLE and args:
+            values.append((arg, args.pop(0)))
+        elif arg.split("=", 1)[0] in _MERGEABLE and "=" in arg:
+            values.append((arg,))
+        elif arg in _WITH_VALUE and args:
+            options.extend((arg, args.pop(0)))
+        elif arg.startswith("-"):
+            options.append(arg)
+        else:
+            values.append((arg,))
+    return tuple(options), values
+
+
+def _call_site():
+    """
+    Returns `(filename, lineno, function)` of the frame that requested
+    the installation.
+    """
+    package = os.path.dirname(os.path.abspath(__file__))
+    internal = {os.path.join(package, name) for name in ("batch.py", "pyenv.py")}
+    stack = traceback.extract_stack()
+    for frame in reversed(stack):
+        if os.path.abspath(frame.filename) not in internal:
+            return (frame.filename, frame.lineno, frame.name)
+    return (stack[0].filename, stack[0].lineno, stack[0].name)
@@ -0,0 +1,319 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Benchmarks of the operations of cish that take most time in builds.
+
+Run them with `python -m cish.benchmarks` or `python setup.py benchmark`.
+The results are written as JSON and can be compared with a baseline
+from an earlier run::
+
+    python -m cish.benchmarks --output base.json
+    # ... change the code ...
+    python -m cish.benchmarks --baseline base.json
+
+The exit code is 1 if a benchmark regressed.
+"""
+
+import os.path
+import sys
+import json
+import time
+import platform
+import tempfile
+import shutil
+import subprocess
+import argparse
+import statistics
+import collections
+
+from cish import commands
+from cish import pyenv
+
+
+_benchmarks = collections.OrderedDict()
+
+
+def benchmark(name):
+    """
+    Registers a benchmark. The decorated function is called with a
+    :class:`Timer`, an empty temporary directory and the number of files
+    for file system benchmarks. It measures one sample by timing the
+    relevant part with `with timer:`.
+    """
+    def decorator(func):
+        _benchmarks[name] = func
+        return func
+    return decorator
+
+
+class Timer(object):
+    """
+    Measures the duration of the `with` block. Only one block per sample.
+    """
+
+    def __init__(self):
+        self.duration = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.duration = time.perf_counter() - self._start
+        return False
+
+
+Comparison = collections.namedtuple("Comparison", ["name", "baseline", "current", "ratio", "status"])
+Comparison.__doc__ = """
+Result of comparing a benchmark with the baseline. `status` is
+`"regressed"`, `"improved"`, `"unchanged"` or `"new"`.
+"""
+
+
+def run(names=None, repeat=5, files=10**5, report=None):
+    """
+    Runs benchmarks.
+
+    :param names: Names of the benchmarks to run. Defaults to all.
+
+    :param repeat: Number of samples per benchmark.
+
+    :param files: Number of files in the trees of file system benchmarks.
+
+    :param report: Optional callable invoked with the name and result of
+        each benchmark as it completes.
+
+    :returns: `dict` in the format written by :func:`main`.
+    """
+    if names is None:
+        names = list(_benchmarks)
+    unknown = [name for name in names if name not in _benchmarks]
+    if unknown:
+        raise ValueError("Unknown benchmarks: {0}".format(", ".join(unknown)))
+
+    results = collections.OrderedDict()
+    for name in names:
+        samples = []
+        for _ in range(repeat):
+            tmpdir = tempfile.mkdtemp(prefix="cish-bench-")
+            try:
+                timer = Timer()
+                _benchmarks[name](timer, tmpdir, files)
+                samples.append(timer.duration)
+            finally:
+                commands.rm_wait()
+                shutil.rmtree(tmpdir, ignore_errors=True)
+        results[name] = _summarize(samples)
+        if report is not None:
+            report(name, results[name])
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "files": files,
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.1, noise=3.0):
+    """
+    Compares benchmark results with a baseline.
+
+    A benchmark only counts as regressed (or improved) if its median
+    changed by more than `threshold` relative to the baseline, and
+    by more than `noise` times the sum of the standard deviations of
+    both runs. This keeps noisy benchmarks from failing randomly.
+
+    :returns: List of :class:`Comparison`, in the order of `current`.
+    """
+    comparisons = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            comparisons.append(Comparison(name, None, result["median"], None, "new"))
+            continue
+        delta = result["median"] - base["median"]
+        ratio = result["median"] / base["median"] if base["median"] else float("inf")
+        significant = abs(delta) > noise * (result["stdev"] + base["stdev"])
+        if significant and delta > threshold * base["median"]:
+            status = "regressed"
+        elif significant and -delta > threshold * base["median"]:
+            status = "improved"
+        else:
+            status = "unchanged"
+        comparisons.append(Comparison(name, base["median"], result["median"], ratio, status))
+    return comparisons
+
+
+def _summarize(samples):
+    return collections.OrderedDict([
+        ("median", statistics.median(samples)),
+        ("stdev", statistics.stdev(samples) if len(samples) > 1 else 0.0),
+        ("min", min(samples)),
+        ("samples", samples),
+    ])
+
+
+def _make_tree(root, files, per_dir=100):
+    """
+    Creates `files` empty files in directories of `per_dir` files each.
+    """
+    for i in range(files):
+        if i % per_dir == 0:
+            directory = os.path.join(root, "d{0:03d}".format(i // per_dir // 100),
+                                     "d{0:05d}".format(i // per_dir))
+            os.makedirs(directory)
+        open(os.path.join(directory, "f{0}".format(i)), "w").close()
+
+
+@benchmark("invoke.subprocess")
+def _bench_invoke_subprocess(timer, tmpdir, files):
+    python = pyenv.interpeter_pyenv().find_executable("python")
+    with timer:
+        for _ in range(10):
+            subprocess.check_call([python, "-c", "pass"])
+
+
+@benchmark("invoke.cish")
+def _bench_invoke_cish(timer, tmpdir, files):
+    env = pyenv.interpeter_pyenv()
+    with timer:
+        for _ in range(10):
+            env.python("-c", "pass")
+
+
+def _many_paths(tmpdir, count=500):
+    paths = []
+    for i in range(count):
+        path = os.path.join(tmpdir, "p{0}".format(i))
+        os.mkdir(path)
+        for j in range(20):
+            open(os.path.join(path, "tool{0}".format(j)), "w").close()
+        paths.append(path)
+    open(os.path.join(paths[-1], "needle"), "w").close()
+    return paths
+
+
+@benchmark("find_executable.cold")
+def _bench_find_cold(timer, tmpdir, files):
+    env = pyenv.PyEnv(_many_paths(tmpdir))
+    with timer:
+        env.find_executable("needle")
+
+
+@benchmark("find_executable.warm")
+def _bench_find_warm(timer, tmpdir, files):
+    env = pyenv.PyEnv(_many_paths(tmpdir))
+    env.find_executable("needle")
+    with timer:
+        for _ in range(1000):
+            env.find_executable("needle")
+
+
+@benchmark("from_config")
+def _bench_from_config(timer, tmpdir, files):
+    python = pyenv.interpeter_pyenv().find_executable("python")
+    config = {"env{0}".format(i): python for i in range(1000)}
+    path = os.path.join(tmpdir, "cish.json")
+    with open(path, "w") as f:
+        json.dump(config, f)
+    with timer:
+        envs = pyenv.from_config(path)
+        for name in envs:
+            envs[name].find_executable("python")
+
+
+@benchmark("virtualenv")
+def _bench_virtualenv(timer, tmpdir, files):
+    env = pyenv.interpeter_pyenv()
+    with timer:
+        env.virtualenv(os.path.join(tmpdir, "env"))
+
+
+@benchmark("mkdirs")
+def _bench_mkdirs(timer, tmpdir, files):
+    with timer:
+        for i in range(files // 10):
+            commands.mkdirs(os.path.join(tmpdir, "d{0:03d}".format(i // 1000), "d{0:06d}".format(i)))
+
+
+@benchmark("rm")
+def _bench_rm(timer, tmpdir, files):
+    tree = os.path.join(tmpdir, "tree")
+    _make_tree(tree, files)
+    with timer:
+        commands.rm(tree)
+
+
+@benchmark("rm.deferred")
+def _bench_rm_deferred(timer, tmpdir, files):
+    tree = os.path.join(tmpdir, "tree")
+    _make_tree(tree, files)
+    with timer:
+        commands.rm(tree, defer=True)
+        commands.rm_wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cish.benchmarks", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", help="Benchmarks to run, all by default: " + ", ".join(_benchmarks))
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per benchmark.")
+    parser.add_argument("--files", type=int, default=10**5, help="Files in file system benchmarks.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the results in this JSON file.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative change of the median that counts as regression.")
+    args = parser.parse_args(argv)
+
+    def report(name, result):
+        print("{name:<24} {median:10.4f}s  +- {stdev:.4f}s".format(name=name, **result))
+        sys.stdout.flush()
+
+    results = run(args.names or None, args.repeat, args.files, report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparisons = compare(results, baseline, args.threshold)
+        print("")
+        for c in comparisons:
+            ratio = "" if c.ratio is None else "{0:.2f}x".format(c.ratio)
+            print("{c.name:<24} {ratio:>8}  {c.status}".format(c=c, ratio=ratio))
+        if any(c.status == "regressed" for c in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
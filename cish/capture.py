@@ -0,0 +1,264 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import io
+import re
+import mmap
+import locale
+import tempfile
+import weakref
+import subprocess
+
+from cish import commands
+from cish import trace
+
+
+#: Captured output larger than this (in bytes) is kept in a temporary file.
+DEFAULT_SPILL_THRESHOLD = 1024 * 1024
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class CapturedOutput(object):
+    """
+    Output of a command invoked with `capture=True`.
+
+    The output (stdout and stderr combined) is read in chunks while the
+    command is running. Up to `spill_threshold` bytes are kept in memory,
+    beyond that the output is moved to a temporary file, so the memory use
+    is constant no matter how much the command writes. The temporary file
+    is removed by :meth:`close`, or once the object is garbage collected.
+
+    The object is returned once the command exited, so :meth:`lines`,
+    :meth:`read` and :meth:`search` see the complete output. They read
+    what was captured, not the running command. Use `tee` to follow the
+    output while the command runs.
+
+    Example::
+
+        out = env.nosetests("-v", capture=True, check=False)
+        for line in out.lines():
+            if line.startswith("FAIL"):
+                print(line)
+        print(out.search(rb"Ran (\\d+) tests").group(1))
+        out.close()
+    """
+
+    def __init__(self, args, spill_threshold=DEFAULT_SPILL_THRESHOLD):
+        self.args = args
+        self.returncode = None
+        self.size = 0
+        self.spill_threshold = spill_threshold
+        self._buffer = io.BytesIO()
+        self._spillfile = None
+        self._finalizer = None
+        self._mmap = None
+
+
+    def write(self, data):
+        """
+        Appends data to the captured output.
+        """
+        self.size += len(data)
+        if self._spillfile is None and self.size > self.spill_threshold:
+            fd, self._spillfile = tempfile.mkstemp(prefix="cish-capture-")
+            self._finalizer = weakref.finalize(self, _remove_file, self._spillfile)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self._buffer.getvalue())
+            self._buffer = open(self._spillfile, 'ab')
+        self._buffer.write(data)
+
+
+    @property
+    def spilled(self):
+        """
+        `True` if the output was moved to a temporary file.
+        """
+        return self._spillfile is not None
+
+
+    def lines(self, encoding=None):
+        """
+        Iterates over the lines of the captured output without loading
+        all of it.
+
+        :param encoding: Defaults to the preferred encoding of the locale.
+            Undecodable bytes are replaced.
+        """
+        encoding = encoding or locale.getpreferredencoding(False)
+        with io.TextIOWrapper(self._open(), encoding=encoding, errors="replace") as f:
+            for line in f:
+                yield line.rstrip("\r\n")
+
+
+    def read(self):
+        """
+        Returns the entire output as bytes.
+        """
+        with self._open() as f:
+            return f.read()
+
+
+    def search(self, pattern, flags=0):
+        """
+        Searches the output with a regular expression. A spilled output is
+        memory-mapped, so it is not read into memory.
+
+        :param pattern: Pattern as `bytes` or `str`. A `str` is encoded
+            with the preferred encoding of the locale.
+
+        :returns: A `bytes` match object or `None`. The match stays valid
+            until :meth:`close` is called.
+        """
+        if not isinstance(pattern, bytes):
+            pattern = pattern.encode(locale.getpreferredencoding(False))
+        return re.search(pattern, self._data(), flags)
+
+
+    def close(self):
+        """
+        Releases the temporary file.
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._spillfile is not None:
+            self._buffer.close()
+            self._finalizer()
+            self._finalizer = None
+            self._spillfile = None
+        self._buffer = io.BytesIO()
+        self.size = 0
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+        return False
+
+
+    def _open(self):
+        if self._spillfile is None:
+            return io.BytesIO(self._buffer.getvalue())
+        self._buffer.flush()
+        return open(self._spillfile, 'rb')
+
+
+    def _data(self):
+        if self._spillfile is None:
+            return self._buffer.getvalue()
+        if self._mmap is None:
+            self._buffer.flush()
+            with open(self._spillfile, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+
+def _remove_file(path):
+    """
+    Deletes a spilled output, if it still exists.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def call(args, capture=False, tee=None, spill_threshold=DEFAULT_SPILL_THRESHOLD, check=True,
+         cwd=None):
+    """
+    Runs a command.
+
+    :param args: Command line, starting with the executable.
+
+    :param capture: If set, stdout and stderr are captured and returned
+        as a :class:`CapturedOutput`. Otherwise they are inherited.
+
+    :param tee: Optional path of a log file, or a binary file object, to
+        which the captured output is written as well while the command
+        runs. Implies `capture`.
+
+    :param spill_threshold: Bytes of output kept in memory before it is
+        moved to a temporary file.
+
+    :param check: Raise an exception if the exit code is not zero.
+
+    :param cwd: Working directory of the command. Defaults to :func:`cish.pwd`.
+
+    :returns: :class:`CapturedOutput` if the output was captured, otherwise
+        the exit code.
+
+    :raises subprocess.CalledProcessError: if `check` is set and the command
+        failed. Its `output` attribute holds the :class:`CapturedOutput`.
+    """
+    cwd = commands.abspath(cwd if cwd is not None else ".")
+    if not (capture or tee is not None):
+        with subprocess.Popen(args, cwd=cwd) as process:
+            try:
+                returncode = trace.wait(process)
+            except BaseException:
+                process.kill()
+                raise
+        if check and returncode:
+            raise subprocess.CalledProcessError(returncode, args)
+        return returncode
+
+    output = CapturedOutput(args, spill_threshold)
+    if tee is None or hasattr(tee, "write"):
+        log = tee
+    else:
+        log = open(commands.abspath(tee), 'wb')
+    try:
+        process = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        try:
+            with process.stdout:
+                while True:
+                    chunk = process.stdout.read1(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    output.write(chunk)
+                    if log is not None:
+                        log.write(chunk)
+            output.returncode = trace.wait(process)
+        except BaseException:
+            process.kill()
+            process.wait()
+            output.close()
+            raise
+    finally:
+        if log is not None and log is not tee:
+            log.close()
+
+    if check and output.returncode:
+        raise subprocess.CalledProcessError(output.returncode, args, output=output)
+    return output
@@ -1,12 +1,38 @@
 import os.path
-import shutil
+import errno
+import stat
+import contextvars
+import threading
+
+from cish import trace
+
+# Modules that are slow to import (shutil, uuid, threading, ...) are
+# imported where they are needed, so that `import cish` stays cheap.
+
+
+#: Logical working directory of the current thread or asyncio task.
+#: `None` if :func:`cd` was not used, in which case the process' working
+#: directory is used.
+_cwd = contextvars.ContextVar("cish_cwd", default=None)
+
 
 def pwd():
     """
     Returns the current working directory.
-    This is just a convinience function to access `os.getcwd()`.
+
+    This is the directory last changed to with :func:`cd` in the current
+    thread or asyncio task, or `os.getcwd()` if there is none.
+    """
+    cwd = _cwd.get()
+    return cwd if cwd is not None else os.getcwd()
+
+
+def abspath(path):
+    """
+    Returns the absolute version of a path. Relative paths are
+    resolved against :func:`pwd`.
     """
-    return os.getcwd()
+    return os.path.normpath(os.path.join(pwd(), path))
 
 
 def cd(path):
@@ -28,32 +54,42 @@ def cd(path):
         print cish.pwd()      # we are back where we were before.
 
     This produces the same output as the previous example.
+
+    The process' working directory (`os.getcwd()`) is not changed. The
+    current directory is tracked per thread and asyncio task instead, so
+    threads can work in different directories at the same time. All cish
+    functions and the commands invoked through :class:`PyEnv` use it.
+    New threads start in the process' working directory.
     """
-    path = os.path.abspath(path)
-    prev_pwd = os.getcwd()
+    path = abspath(path)
+    if not os.path.isdir(path):
+        code = errno.ENOTDIR if os.path.exists(path) else errno.ENOENT
+        raise OSError(code, os.strerror(code), path)
+    prev_pwd = _cwd.get()
 
     # Don't wait for __enter__ as this function might not be
     # used with `with`.
-    os.chdir(path)
+    _cwd.set(path)
 
     class ChangeDirContext(object):
         def __enter__(self):
             return path
         
         def __exit__(self, type_, value, traceback):
-            os.chdir(prev_pwd)
+            _cwd.set(prev_pwd)
             return False # re-throw exceptions if there was one.
 
     return ChangeDirContext()
 
 
+@trace.traced("mkdirs")
 def mkdirs(path):
     """
     Creates the given directory, creating parent directories if required.
     Has no effect if the directory already exists, throws an exception
     if the path exists but is not a directory.
     """
-    path = os.path.abspath(path)
+    path = abspath(path)
     if os.path.isdir(path):
         return
     elif os.path.exists(path):
@@ -63,15 +99,659 @@ def mkdirs(path):
         os.makedirs(path)
 
 
-def rm(path):
+@trace.traced("rm")
+def rm(path, defer=False):
     """
     Deletes the given file or directory, including the content.
     Has no effect if the path does not exist.
+
+    :param defer: If set, a directory is renamed to a hidden sibling
+        right away and deleted in the background by several threads,
+        so that the path can be reused immediately. Use :func:`rm_wait`
+        to wait for the deletion to complete. All deferred deletions are
+        completed before the interpreter exits.
     """
-    path = os.path.abspath(path)
-    if os.path.isdir(path):
+    import shutil
+    path = abspath(path)
+    if defer and os.path.isdir(path) and not os.path.islink(path):
+        import uuid
+        trash = os.path.join(os.path.dirname(path),
+            ".{name}.cish-trash-{id}".format(name=os.path.basename(path), id=uuid.uuid4().hex))
+        try:
+            os.rename(path, trash)
+        except OSError:
+            shutil.rmtree(path)
+        else:
+            _get_deleter().delete(trash)
+    elif os.path.islink(path):
+        os.remove(path)
+    elif os.path.isdir(path):
         shutil.rmtree(path)
     elif os.path.exists(path):
         os.remove(path)
 
 
+def rm_wait():
+    """
+    Waits until all deletions started with `rm(path, defer=True)` are
+    complete.
+
+    :raises OSError: if a file or directory could not be deleted.
+    """
+    if _deleter is not None:
+        _deleter.wait()
+
+
+def mkdirs_many(paths, workers=8):
+    """
+    Creates many directories like :func:`mkdirs`, with fewer system calls.
+
+    The paths are merged into a tree, so each ancestor is looked at only
+    once. Directories are created relative to an open handle of their
+    parent where the platform supports it, and independent subtrees are
+    created by several threads.
+
+    :raises ValueError: if a path exists but is not a directory.
+    """
+    paths = list(paths)
+    tree = _path_tree(paths)
+    with trace.span("mkdirs_many", "mkdirs_many", ["{0} paths".format(len(paths))]):
+        prefix, node = _common_prefix(tree)
+        if node is None:
+            return
+        if os.path.exists(prefix) and not os.path.isdir(prefix):
+            raise ValueError("Cannot create directory {path}, it already exists "
+                             "but is not a directory.".format(path=prefix))
+        os.makedirs(prefix, exist_ok=True)
+        subtrees = []
+        _mkdirs_split(prefix, node, workers, subtrees)
+        _run_parallel(workers, [(_mkdirs_subtree, path, children) for path, children in subtrees])
+
+
+def rm_many(paths, workers=8):
+    """
+    Deletes many files and directories like :func:`rm`, with fewer
+    system calls.
+
+    Paths inside other deleted paths are skipped. Each parent directory
+    is opened only once and its entries are deleted relative to that
+    handle where the platform supports it. Independent paths are deleted
+    by several threads.
+    """
+    paths = list(paths)
+    tree = _path_tree(paths)
+    targets = []
+    _collect_leaves("", tree, targets)
+    with trace.span("rm_many", "rm_many", ["{0} paths".format(len(paths))]):
+        if not _DIR_FD:
+            _run_parallel(workers, [(rm, path) for path in targets])
+            return
+        by_parent = {}
+        for path in targets:
+            parent, name = os.path.split(path)
+            by_parent.setdefault(parent, []).append(name)
+        fds = {}
+        try:
+            tasks = []
+            for parent, names in by_parent.items():
+                try:
+                    fds[parent] = os.open(parent, os.O_RDONLY | os.O_DIRECTORY)
+                except FileNotFoundError:
+                    continue
+                tasks.extend((_rm_at, fds[parent], name) for name in names)
+            _run_parallel(workers, tasks)
+        finally:
+            for fd in fds.values():
+                os.close(fd)
+
+
+#: `True` if directories can be created and deleted relative to an open
+#: handle of their parent (`dir_fd`), which saves resolving the full path.
+_DIR_FD = (os.mkdir in os.supports_dir_fd and os.unlink in os.supports_dir_fd and
+           os.rmdir in os.supports_dir_fd and os.scandir in os.supports_fd and
+           hasattr(os, "O_DIRECTORY"))
+
+#: Number of directories to create in one parent from which on the parent
+#: is listed instead of checking each of them.
+_SCAN_THRESHOLD = 8
+
+#: Marks a node of a path tree as a path that was given, not just an ancestor.
+_LEAF = None
+
+
+def _path_tree(paths):
+    """
+    Merges absolute paths into a tree of nested `dict`s keyed by path
+    components. The root key is the drive or `/`.
+    """
+    tree = {}
+    base = pwd()
+    for path in paths:
+        path = os.path.normpath(os.path.join(base, path))
+        drive, rest = os.path.splitdrive(path)
+        node = tree.setdefault(drive + os.sep, {})
+        for part in rest.split(os.sep):
+            if part:
+                node = node.setdefault(part, {})
+        node[_LEAF] = True
+    return tree
+
+
+def _children(node):
+    return [(name, child) for name, child in node.items() if name is not _LEAF]
+
+
+def _common_prefix(tree):
+    """
+    Follows the tree down while it does not branch.
+
+    :returns: The path and its node, `(None, None)` for an empty tree.
+    """
+    if not tree:
+        return None, None
+    if len(tree) > 1:
+        raise ValueError("Paths on different drives: {0}".format(", ".join(tree)))
+    path, node = next(iter(tree.items()))
+    children = _children(node)
+    while len(children) == 1 and _LEAF not in node:
+        name, node = children[0]
+        path = os.path.join(path, name)
+        children = _children(node)
+    return path, node
+
+
+def _collect_leaves(path, node, leaves):
+    """
+    Collects the given paths, skipping those inside another given path.
+    """
+    for name, child in _children(node):
+        child_path = os.path.join(path, name) if path else name
+        if _LEAF in child:
+            leaves.append(child_path)
+        else:
+            _collect_leaves(child_path, child, leaves)
+
+
+def _mkdirs_split(path, node, workers, subtrees):
+    """
+    Creates the upper levels of the tree below `path` until it has split
+    into enough subtrees to keep the workers busy, which are added to
+    `subtrees` as `(path, node)`.
+    """
+    level = [(path, node)]
+    while level and len(level) < workers:
+        below = []
+        for parent, parent_node in level:
+            children = _children(parent_node)
+            _mkdirs_children(parent, children)
+            below.extend((os.path.join(parent, name), child) for name, child in children)
+        if not below:
+            return
+        level = below
+    subtrees.extend((p, n) for p, n in level if _children(n))
+
+
+def _mkdirs_children(path, children):
+    """
+    Creates the directories `children`, `(name, node)` pairs, in the
+    existing directory `path`.
+    """
+    if not _DIR_FD:
+        _mkdirs_in(None, path, children)
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        _mkdirs_in(fd, path, children)
+    finally:
+        os.close(fd)
+
+
+def _mkdirs_subtree(path, node):
+    if not _DIR_FD:
+        children = _children(node)
+        _mkdirs_in(None, path, children)
+        for name, child in children:
+            _mkdirs_subtree(os.path.join(path, name), child)
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        _mkdirs_at(fd, path, node)
+    finally:
+        os.close(fd)
+
+
+def _mkdirs_at(fd, path, node):
+    children = _children(node)
+    _mkdirs_in(fd, path, children)
+    for name, child in children:
+        if _children(child):
+            child_fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY, dir_fd=fd)
+            try:
+                _mkdirs_at(child_fd, os.path.join(path, name), child)
+            finally:
+                os.close(child_fd)
+
+
+def _mkdirs_in(fd, path, children):
+    """
+    Creates the directories `children`, `(name, node)` pairs, in the
+    existing directory `path`, relative to its handle `fd` unless it
+    is `None`.
+    """
+    existing = {}
+    if len(children) >= _SCAN_THRESHOLD:
+        # one listing is cheaper than probing each child.
+        with os.scandir(path if fd is None else fd) as it:
+            existing = {entry.name: entry.is_dir() for entry in it}
+    for name, child in children:
+        child_path = os.path.join(path, name)
+        is_dir = existing.get(name)
+        if is_dir is None:
+            try:
+                if fd is None:
+                    os.mkdir(child_path)
+                else:
+                    os.mkdir(name, dir_fd=fd)
+                is_dir = True
+            except FileExistsError:
+                if fd is None:
+                    is_dir = os.path.isdir(child_path)
+                else:
+                    is_dir = stat.S_ISDIR(os.stat(name, dir_fd=fd).st_mode)
+        if not is_dir:
+            raise ValueError("Cannot create directory {path}, it already exists "
+                             "but is not a directory.".format(path=child_path))
+
+
+def _rm_at(fd, name):
+    """
+    Deletes the file or directory `name` inside the directory `fd`.
+    """
+    try:
+        st = os.stat(name, dir_fd=fd, follow_symlinks=False)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISDIR(st.st_mode):
+        os.unlink(name, dir_fd=fd)
+        return
+    child_fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY | getattr(os, "O_NOFOLLOW", 0), dir_fd=fd)
+    try:
+        with os.scandir(child_fd) as it:
+            entries = [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+        for entry, is_dir in entries:
+            if is_dir:
+                _rm_at(child_fd, entry)
+            else:
+                os.unlink(entry, dir_fd=child_fd)
+    finally:
+        os.close(child_fd)
+    os.rmdir(name, dir_fd=fd)
+
+
+def _run_parallel(workers, tasks):
+    """
+    Runs `(func, *args)` tasks with a thread pool, raising the first error.
+    """
+    if len(tasks) <= 1 or workers <= 1:
+        for task in tasks:
+            task[0](*task[1:])
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(*task) for task in tasks]:
+            future.result()
+
+
+@trace.traced("sync")
+def sync(src, dst, checksum=False, delete=True, hardlink=False, workers=8):
+    """
+    Makes `dst` a copy of `src`, copying only what changed.
+
+    A file is copied if it is missing in `dst` or if size or
+    modification time differ. Files are copied in parallel, using
+    copy-on-write clones or `copy_file_range` where the platform supports
+    them. Each file is written to a temporary name first and then renamed,
+    so `dst` never contains partially written files.
+
+    :param src: Source file or directory.
+
+    :param dst: Destination. Parent directories are created if required.
+
+    :param checksum: Compare the content of files with equal size instead
+        of their modification time.
+
+    :param delete: Delete files and directories in `dst` that don't
+        exist in `src`.
+
+    :param hardlink: Hard link files instead of copying them if the
+        file system does not support clones. `src` and `dst` then share
+        the files, modifying one modifies the other.
+
+    :param workers: Number of threads copying files.
+
+    :returns: List of the copied files, relative to `dst`.
+    """
+    src = abspath(src)
+    dst = abspath(dst)
+    if not os.path.exists(src):
+        raise ValueError("Cannot sync {src}, it does not exist.".format(src=src))
+
+    if not os.path.isdir(src):
+        if os.path.isdir(dst) or os.path.islink(dst):
+            rm(dst)
+        mkdirs(os.path.dirname(dst))
+        if _sync_needed(src, dst, checksum):
+            _sync_file(src, dst, hardlink)
+            return [os.path.basename(dst)]
+        return []
+
+    if os.path.islink(dst) or (os.path.exists(dst) and not os.path.isdir(dst)):
+        os.remove(dst)
+    mkdirs(dst)
+
+    todo = []
+    for dirpath, dirnames, filenames in os.walk(src):
+        relative = os.path.relpath(dirpath, src)
+        target = os.path.normpath(os.path.join(dst, relative))
+        existing = set(os.listdir(target))
+
+        for name in list(dirnames):
+            source = os.path.join(dirpath, name)
+            if source == dst:
+                # `dst` is inside `src`, don't copy it into itself.
+                dirnames.remove(name)
+                continue
+            if os.path.islink(source):
+                dirnames.remove(name)
+                filenames.append(name)
+                continue
+            path = os.path.join(target, name)
+            if os.path.islink(path) or (os.path.exists(path) and not os.path.isdir(path)):
+                rm(path)
+            if not os.path.isdir(path):
+                os.mkdir(path)
+
+        for name in filenames:
+            source = os.path.join(dirpath, name)
+            path = os.path.join(target, name)
+            if os.path.islink(source):
+                link = os.readlink(source)
+                if not (os.path.islink(path) and os.readlink(path) == link):
+                    rm(path)
+                    os.symlink(link, path)
+                continue
+            if os.path.islink(path) or os.path.isdir(path):
+                rm(path)
+            if _sync_needed(source, path, checksum):
+                todo.append((source, path))
+
+        if delete:
+            for name in existing - set(dirnames) - set(filenames):
+                rm(os.path.join(target, name))
+
+    if todo:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for future in [executor.submit(_sync_file, s, d, hardlink) for s, d in todo]:
+                future.result()
+    return [os.path.relpath(d, dst) for _, d in todo]
+
+
+def _sync_needed(src, dst, checksum):
+    """
+    Checks if the file `src` has to be copied to `dst`.
+    """
+    try:
+        dst_stat = os.lstat(dst)
+    except OSError:
+        return True
+    src_stat = os.stat(src)
+    if src_stat.st_size != dst_stat.st_size or os.path.islink(dst):
+        return True
+    if checksum:
+        return _file_digest(src) != _file_digest(dst)
+    return src_stat.st_mtime_ns != dst_stat.st_mtime_ns
+
+
+def _sync_file(src, dst, hardlink):
+    """
+    Replaces `dst` with a copy of `src`.
+    """
+    import uuid
+    tmp = os.path.join(os.path.dirname(dst),
+        ".{name}.cish-tmp-{id}".format(name=os.path.basename(dst), id=uuid.uuid4().hex))
+    try:
+        _clone_file(src, tmp, hardlink)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _file_digest(path):
+    import hashlib
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _Deleter(object):
+    """
+    Deletes directory trees in the background.
+
+    Each directory is a task for a pool of daemon threads. A task deletes
+    the files of its directory and queues its subdirectories as new tasks,
+    so independent subtrees are deleted in parallel. A directory is removed
+    once all its subdirectories are gone.
+    """
+
+    def __init__(self, workers=16):
+        import queue
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._errors = []
+        self._threads = []
+
+    def delete(self, path):
+        with self._lock:
+            if not self._threads:
+                import atexit
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self._work)
+                    thread.daemon = True
+                    thread.start()
+                    self._threads.append(thread)
+                atexit.register(self.wait, False)
+            self._pending += 1
+        self._queue.put(_DeleteNode(path, None))
+
+    def wait(self, raise_errors=True):
+        with self._lock:
+            while self._pending:
+                self._idle.wait()
+            errors, self._errors = self._errors, []
+        if errors and raise_errors:
+            raise errors[0]
+
+    def _work(self):
+        while True:
+            self._delete(self._queue.get())
+
+    def _delete(self, node):
+        try:
+            with os.scandir(node.path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            with self._lock:
+                                node.count += 1
+                            self._queue.put(_DeleteNode(entry.path, node))
+                        else:
+                            os.remove(entry.path)
+                    except OSError as e:
+                        self._error(e)
+        except OSError as e:
+            self._error(e)
+        self._release(node)
+
+    def _release(self, node):
+        while node is not None:
+            with self._lock:
+                node.count -= 1
+                if node.count:
+                    return
+            try:
+                os.rmdir(node.path)
+            except OSError as e:
+                self._error(e)
+            if node.parent is None:
+                with self._lock:
+                    self._pending -= 1
+                    self._idle.notify_all()
+            node = node.parent
+
+    def _error(self, error):
+        with self._lock:
+            self._errors.append(error)
+
+
+class _DeleteNode(object):
+    """
+    Directory being deleted. `count` is the number of unfinished
+    subdirectories plus one while the directory itself is being listed.
+    """
+
+    def __init__(self, path, parent):
+        self.path = path
+        self.parent = parent
+        self.count = 1
+
+
+_deleter = None
+_deleter_lock = threading.Lock()
+
+def _get_deleter():
+    """
+    Returns the :class:`_Deleter`, creating it on first use.
+    """
+    global _deleter
+    with _deleter_lock:
+        if _deleter is None:
+            _deleter = _Deleter()
+        return _deleter
+
+
+def _reset_deleter():
+    """
+    Drops the :class:`_Deleter` in a forked child, which inherits it
+    without its threads. The parent completes its own deletions.
+    """
+    global _deleter, _deleter_lock
+    _deleter = None
+    _deleter_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_deleter)
+
+
+def _clone_file(src, dst, hardlink=False):
+    """
+    Copies a file as cheaply as the platform allows.
+
+    Tries a copy-on-write clone (reflink) first, then a hard link if
+    `hardlink` is set, and falls back to a regular copy. With a hard link,
+    `src` and `dst` share their content, so `dst` must not be modified in
+    place afterwards.
+    """
+    if _reflink(src, dst):
+        return
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    if _copy_file_range(src, dst):
+        return
+    import shutil
+    shutil.copy2(src, dst)
+
+
+def _copy_file_range(src, dst):
+    """
+    Copies a file with `os.copy_file_range`, so the data does not pass
+    through user space (Linux only).
+
+    :returns: `True` on success, `False` if not supported. `dst` does not
+        exist in the latter case.
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+    with open(src, 'rb') as fsrc:
+        with open(dst, 'wb') as fdst:
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if not copied:
+                        break
+                    remaining -= copied
+                done = remaining <= 0
+            except OSError:
+                done = False
+    if done:
+        import shutil
+        shutil.copystat(src, dst)
+    else:
+        os.remove(dst)
+    return done
+
+
+_FICLONE = 0x40049409
+
+def _reflink(src, dst):
+    """
+    Creates `dst` as a copy-on-write clone of `src` (Linux only).
+
+    :returns: `True` on success, `False` if the file system does not
+        support it. `dst` does not exist in the latter case.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(src, 'rb') as fsrc:
+        with open(dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                cloned = True
+            except (OSError, IOError):
+                cloned = False
+    if cloned:
+        import shutil
+        shutil.copystat(src, dst)
+    else:
+        os.remove(dst)
+    return cloned
+
+
+def _cache_dir():
+    """
+    Returns the directory in which cish keeps its caches.
+    """
+    if "CISH_CACHE_DIR" in os.environ:
+        return os.environ["CISH_CACHE_DIR"]
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "cish")
@@ -0,0 +1,153 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import re
+import glob
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from cish import probe
+from cish.pyenv import LazyEnvs
+
+
+#: File names of interpreters, such as `python`, `python3.11` or `pypy3.exe`.
+_INTERPRETER_NAME = re.compile(r"^(python|pypy)(\d+(\.\d+)?)?(\.exe)?$", re.IGNORECASE)
+
+#: Short names of the implementations used in the keys.
+_SHORT_NAMES = {"CPython": "py", "PyPy": "pypy"}
+
+
+def default_locations():
+    """
+    Returns the directories :func:`discover` searches by default: the
+    `PATH`, `/usr/local/bin`, `/opt/*/bin` and the interpreters installed
+    with pyenv and asdf.
+    """
+    home = os.path.expanduser("~")
+    pyenv_root = os.environ.get("PYENV_ROOT", os.path.join(home, ".pyenv"))
+    asdf_root = os.environ.get("ASDF_DATA_DIR", os.path.join(home, ".asdf"))
+    locations = [path for path in os.environ.get("PATH", "").split(os.pathsep) if path]
+    locations.append("/usr/local/bin")
+    locations.extend(sorted(glob.glob("/opt/*/bin")))
+    locations.extend(sorted(glob.glob(os.path.join(pyenv_root, "versions", "*", "bin"))))
+    locations.extend(sorted(glob.glob(os.path.join(asdf_root, "installs", "python", "*", "bin"))))
+    return locations
+
+
+def discover(locations=None, timeout=10, workers=8, cache=None):
+    """
+    Finds the python interpreters installed on this machine, as an
+    alternative to a `cish.json` file.
+
+    Each interpreter is started once to ask for its version, in parallel
+    and with a timeout. The answers are kept in the
+    :class:`cish.probe.ProbeCache` as long as the executable's mtime and
+    inode are unchanged, so later runs do not start any interpreters.
+    Interpreters that fail to answer are remembered as well, unless
+    they only ran into the timeout, which might be caused by a busy
+    machine.
+
+    :param locations: Directories to search. Defaults to
+        :func:`default_locations`.
+
+    :param timeout: Seconds to wait for each interpreter.
+
+    :param workers: Number of interpreters probed at the same time.
+
+    :param cache: :class:`cish.probe.ProbeCache`, defaults to
+        :func:`cish.probe.default_cache`.
+
+    :returns: :class:`cish.pyenv.LazyEnvs` like :func:`cish.from_config`.
+        For each minor version the interpreter found first is available
+        as for example `"py3.11"` or `"pypy3.9"`, every interpreter also
+        under its full version such as `"py3.11.7"`.
+    """
+    if locations is None:
+        locations = default_locations()
+    if cache is None:
+        cache = probe.default_cache()
+
+    candidates = _candidates(locations)
+
+    def probe_one(exe):
+        if cache.get(exe, "probe_failed"):
+            return None
+        try:
+            return probe.interpreter_info(exe, cache, timeout)
+        except subprocess.TimeoutExpired:
+            return None
+        except (subprocess.SubprocessError, OSError, ValueError):
+            cache.put(exe, "probe_failed", True)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        infos = [info for info in executor.map(probe_one, candidates) if info is not None]
+
+    interpreters = {}
+    for info in sorted(infos, key=_sort_key):
+        short = _SHORT_NAMES.get(info.implementation, info.implementation.lower())
+        minor = ".".join(info.version.split(".")[:2])
+        for name in (short + minor, short + info.version):
+            interpreters.setdefault(name, info.executable)
+    return LazyEnvs(interpreters)
+
+
+def _candidates(locations):
+    """
+    Returns the interpreter executables in the given directories, without
+    duplicates such as `python3` being a link to `python3.11`. Like a
+    shell, the first path found is used.
+    """
+    candidates = []
+    seen = set()
+    for location in locations:
+        try:
+            names = sorted(os.listdir(location))
+        except OSError:
+            continue
+        for name in names:
+            if not _INTERPRETER_NAME.match(name):
+                continue
+            path = os.path.abspath(os.path.join(location, name))
+            real = os.path.realpath(path)
+            if real in seen or not os.path.isfile(real) or not os.access(real, os.X_OK):
+                continue
+            seen.add(real)
+            candidates.append(path)
+    return candidates
+
+
+def _sort_key(info):
+    """
+    Newest minor versions first, keeping the search order otherwise.
+    """
+    minor = tuple(-int(part) for part in info.version.split(".")[:2] if part.isdigit())
+    return (info.implementation != "CPython", info.implementation, minor)
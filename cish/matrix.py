@@ -0,0 +1,239 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import sys
+import time
+import subprocess
+import multiprocessing
+import multiprocessing.connection
+
+from cish import commands
+
+
+class MatrixResult(object):
+    """
+    Outcome of running the matrix task in one environment.
+    """
+
+    def __init__(self, name, env, workdir, logfile, returncode, duration):
+        self.name = name
+        self.env = env
+        self.workdir = workdir
+        self.logfile = logfile
+        self.returncode = returncode
+        self.duration = duration
+
+    @property
+    def passed(self):
+        return self.returncode == 0
+
+    @property
+    def output(self):
+        """
+        Output (stdout and stderr) the run produced.
+        """
+        with open(self.logfile, 'r') as f:
+            return f.read()
+
+
+class MatrixReport(object):
+    """
+    Aggregated results of a matrix run.
+
+    `results` is a `dict` mapping the environment names to
+    :class:`MatrixResult` instances.
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def passed(self):
+        """
+        Sorted names of the environments in which the task succeeded.
+        """
+        return sorted(name for name, r in self.results.items() if r.passed)
+
+    @property
+    def failed(self):
+        """
+        Sorted names of the environments in which the task failed.
+        """
+        return sorted(name for name, r in self.results.items() if not r.passed)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    def __str__(self):
+        lines = []
+        for name in sorted(self.results):
+            r = self.results[name]
+            lines.append("{status:4} {name} ({duration:.1f}s, exit code {code}) {log}".format(
+                status="ok" if r.passed else "FAIL",
+                name=name,
+                duration=r.duration,
+                code=r.returncode,
+                log=r.logfile))
+        lines.append("{passed} passed, {failed} failed".format(
+            passed=len(self.passed), failed=len(self.failed)))
+        return "\n".join(lines)
+
+
+def run_matrix(task, envs, max_workers=None, workdir="matrix"):
+    """
+    Runs a task in all given environments at the same time.
+
+    Every run happens in its own process with its own working directory
+    `workdir/<name>`, which is emptied first. Stdout and stderr of the run,
+    including those of the commands it invokes, are captured in
+    `workdir/<name>.log`. Since the runs don't share a process they can
+    safely use relative paths, :func:`cish.cd` and :meth:`PyEnv.virtualenv`.
+
+    Example::
+
+        def build(env):
+            venv = env.virtualenv("env")
+            venv.pip("install", "nose")
+            venv.nosetests()
+
+        report = cish.run_matrix(build, cish.from_config())
+        print(report)
+
+    :param task: Either a callable that is invoked with the :class:`PyEnv`
+        as its only argument, or the path to a python script that is
+        executed with the environment's interpreter. A run fails if the
+        callable raises an exception or the script has a non-zero exit code.
+        On platforms without `fork` the callable has to be picklable.
+
+    :param envs: `dict` mapping names to :class:`PyEnv` instances,
+        as returned by :func:`cish.from_config`. The names are used as
+        directory names and must not contain path separators.
+
+    :param max_workers: Maximal number of runs executed concurrently.
+        Defaults to the number of CPUs.
+
+    :param workdir: Directory in which the working directories and logs of
+        the runs are created. Defaults to `"matrix"`.
+
+    :returns: :class:`MatrixReport` with the results of all runs.
+
+    :raises ValueError: if a name is not a valid directory name.
+    """
+    for name in envs:
+        if (not name or name in (".", "..") or os.sep in name or
+                (os.altsep is not None and os.altsep in name)):
+            raise ValueError("Environment name {name!r} cannot be used as a "
+                             "directory name.".format(name=name))
+    workdir = commands.abspath(workdir)
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    max_workers = max(1, max_workers)
+    if not callable(task):
+        task = _ScriptTask(commands.abspath(task))
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+
+    commands.mkdirs(workdir)
+
+    pending = sorted(envs)
+    running = {}
+    results = {}
+    try:
+        while pending or running:
+            while pending and len(running) < max_workers:
+                name = pending.pop(0)
+                rundir = os.path.join(workdir, name)
+                logfile = rundir + ".log"
+                commands.rm(rundir)
+                commands.mkdirs(rundir)
+                process = context.Process(target=_child_main,
+                                          args=(task, envs[name], rundir, logfile))
+                process.start()
+                running[process.sentinel] = (name, process, rundir, logfile, time.time())
+
+            for sentinel in multiprocessing.connection.wait(list(running)):
+                name, process, rundir, logfile, start = running.pop(sentinel)
+                process.join()
+                results[name] = MatrixResult(name, envs[name], rundir, logfile,
+                                             process.exitcode, time.time() - start)
+    finally:
+        # only left running if interrupted, e.g. by KeyboardInterrupt.
+        for name, process, rundir, logfile, start in running.values():
+            process.terminate()
+        for name, process, rundir, logfile, start in running.values():
+            process.join()
+    return MatrixReport(results)
+
+
+class _ScriptTask(object):
+    """
+    Task executing a python script with the interpreter of the environment.
+    """
+
+    def __init__(self, script):
+        self.script = script
+
+    def __call__(self, env):
+        python = env.find_executable("python")
+        sys.exit(subprocess.call([python, self.script]))
+
+
+def _child_main(task, env, rundir, logfile):
+    """
+    Entry point of the child process running the task.
+    Redirects the file descriptors, so that the output of invoked
+    commands ends up in the log as well.
+    """
+    # the child is a process of its own, changing its working directory
+    # affects no one else.
+    os.chdir(rundir)
+    commands._cwd.set(None)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    fd = os.open(logfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    sys.stdout = open(1, 'w', buffering=1, closefd=False)
+    sys.stderr = open(2, 'w', buffering=1, closefd=False)
+    try:
+        task(env)
+    finally:
+        # multiprocessing ends the child with `os._exit`, which skips
+        # the atexit handler completing deferred deletions.
+        commands.rm_wait()
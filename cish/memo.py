@@ -0,0 +1,243 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import json
+import locale
+import hashlib
+import threading
+import subprocess
+import collections
+import uuid
+
+from cish import commands
+from cish import capture
+
+
+PureResult = collections.namedtuple("PureResult", ["returncode", "output"])
+PureResult.__doc__ = """
+Result of a memoized invocation: the exit code and the combined stdout
+and stderr output as a string.
+"""
+
+
+class MemoCache(object):
+    """
+    Cache of the results of pure invocations, see :class:`PureInvokers`.
+
+    Results are kept in memory, evicting the least recently used ones
+    beyond `max_entries`. If a `directory` is given, results are also
+    stored there as JSON files and shared with other processes. On disk,
+    the least recently used files are removed once there are more than
+    `max_disk_entries`.
+    """
+
+    def __init__(self, max_entries=256, directory=None, max_disk_entries=4096):
+        """
+        :param max_entries: Results kept in memory.
+
+        :param directory: Optional directory for the on-disk tier.
+
+        :param max_disk_entries: Results kept on disk.
+        """
+        self.max_entries = max_entries
+        self.directory = None if directory is None else commands.abspath(directory)
+        self.max_disk_entries = max_disk_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+
+
+    def get(self, key):
+        """
+        Returns the cached :class:`PureResult` or `None`.
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                return result
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                result = PureResult(*json.load(f))
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, TypeError):
+            return None
+        self._remember(key, result)
+        return result
+
+
+    def put(self, key, result):
+        """
+        Stores a :class:`PureResult`.
+        """
+        self._remember(key, result)
+        if self.directory is None:
+            return
+        path = self._path(key)
+        try:
+            commands.mkdirs(os.path.dirname(path))
+            tmp = path + "." + uuid.uuid4().hex
+            with open(tmp, 'w') as f:
+                json.dump(list(result), f)
+            os.replace(tmp, path)
+        except (IOError, OSError):
+            return # the cache is an optimization only.
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % 64 == 0
+        if prune:
+            self.prune()
+
+
+    def clear(self):
+        """
+        Forgets all results held in memory.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+    def prune(self):
+        """
+        Deletes the least recently used files of the on-disk tier
+        beyond `max_disk_entries`.
+        """
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    files.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    pass
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_disk_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+
+_default_cache = MemoCache()
+
+def default_cache():
+    """
+    Returns the :class:`MemoCache` used by :attr:`PyEnv.pure`.
+    """
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """
+    Replaces the cache used by :attr:`PyEnv.pure`, for example by one
+    with an on-disk tier::
+
+        cish.memo.set_default_cache(cish.memo.MemoCache(directory=".cish-memo"))
+    """
+    global _default_cache
+    _default_cache = cache
+
+
+class PureInvokers(object):
+    """
+    Memoizing counterpart of the invokers returned by `PyEnv.__getattr__`,
+    for invocations without side effects, obtained through :attr:`PyEnv.pure`::
+
+        version = env.pure.python("--version").output
+        freeze = env.pure.pip("freeze").output
+
+    The result is taken from the cache if the environment, the command
+    line and the working directory are the same, and the directories
+    packages and scripts are installed into were not modified since.
+    Installing or removing packages therefore invalidates the results.
+    Environment variables are not part of the key.
+
+    The invokers take `check` (raise `subprocess.CalledProcessError` on a
+    non-zero exit code, the default) and `cwd`.
+    """
+
+    def __init__(self, env, cache=None):
+        self._env = env
+        self._cache = cache
+
+    def __getattr__(self, name):
+        executable = self._env.find_executable(name)
+
+        def invoker(*args, **options):
+            return self._run([executable] + list(args), **options)
+        return invoker
+
+    def fingerprint(self):
+        """
+        Returns the modification times of the interpreter and the
+        directories packages and scripts are installed into.
+        """
+        info = self._env.info
+        paths = [info.executable, info.scripts] + list(info.site_packages)
+        stamps = []
+        for path in paths:
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return stamps
+
+    def _run(self, argv, check=True, cwd=None):
+        cache = self._cache if self._cache is not None else default_cache()
+        cwd = commands.abspath(cwd if cwd is not None else ".")
+        python = self._env.find_executable("python")
+        key = json.dumps([python, argv, cwd, self.fingerprint()])
+        key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        result = cache.get(key)
+        if result is None:
+            with capture.call(argv, capture=True, check=False, cwd=cwd) as output:
+                data = output.read()
+            encoding = locale.getpreferredencoding(False)
+            result = PureResult(output.returncode, data.decode(encoding, "replace"))
+            cache.put(key, result)
+        if check and result.returncode:
+            raise subprocess.CalledProcessError(result.returncode, argv, output=result.output)
+        return result
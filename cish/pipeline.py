@@ -0,0 +1,205 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import subprocess
+
+from cish import commands
+
+
+class PipelineError(subprocess.CalledProcessError):
+    """
+    Raised if a stage of a pipeline fails. Like bash's `pipefail`,
+    `returncode` is the exit code of the last stage that failed.
+    `returncodes` holds the exit codes of all stages.
+    """
+
+    def __init__(self, returncodes, cmd):
+        failed = [code for code in returncodes if code]
+        subprocess.CalledProcessError.__init__(self, failed[-1], cmd)
+        self.returncodes = returncodes
+
+    def __str__(self):
+        return "Pipeline {cmd} failed with exit codes {codes}.".format(
+            cmd=self.cmd, codes=self.returncodes)
+
+
+class Commands(object):
+    """
+    Factory for :class:`Command` objects of an environment, obtained
+    through :attr:`PyEnv.cmd`. `env.cmd.gzip` is the command `gzip`
+    without arguments, `env.cmd.gzip("-9")` with arguments.
+    """
+
+    def __init__(self, env):
+        self._env = env
+
+    def __getattr__(self, name):
+        return Command([self._env.find_executable(name)])
+
+
+class Command(object):
+    """
+    A command line that is not executed yet.
+
+    Commands are combined into a :class:`Pipeline` with `|`. The output
+    of one command is passed directly to the next one through an OS pipe,
+    it never passes through this process::
+
+        env.cmd.python("gen.py") | cish.sh.cmd.gzip > "out.gz"
+        (env.cmd.python("gen.py") | cish.sh.cmd.gzip).run(stdout="all.gz", append=True)
+
+    `>` runs the pipeline, writing the output of the last command to a
+    file, and returns the :class:`PipelineResult`. There is no `>>`, as
+    it would bind more tightly than `|`.
+    """
+
+    def __init__(self, argv):
+        self.argv = list(argv)
+
+    def __call__(self, *args):
+        return Command(self.argv + list(args))
+
+    def __or__(self, other):
+        return Pipeline([self]) | other
+
+    def __gt__(self, path):
+        return Pipeline([self]).run(stdout=path)
+
+    def run(self, stdin=None, stdout=None, append=False, check=True):
+        """
+        Runs the command, see :meth:`Pipeline.run`.
+        """
+        return Pipeline([self]).run(stdin, stdout, append, check)
+
+    def __repr__(self):
+        return " ".join(self.argv)
+
+
+class PipelineResult(object):
+    """
+    Exit codes of the stages of a pipeline that ran.
+    """
+
+    def __init__(self, returncodes):
+        self.returncodes = returncodes
+
+    @property
+    def returncode(self):
+        """
+        Exit code of the last stage that failed or `0`.
+        """
+        failed = [code for code in self.returncodes if code]
+        return failed[-1] if failed else 0
+
+
+class Pipeline(object):
+    """
+    Sequence of commands whose output is passed on to the next one.
+    See :class:`Command`.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def __or__(self, other):
+        if isinstance(other, Pipeline):
+            return Pipeline(self.stages + other.stages)
+        if isinstance(other, Command):
+            return Pipeline(self.stages + [other])
+        return NotImplemented
+
+    def __gt__(self, path):
+        return self.run(stdout=path)
+
+    def __repr__(self):
+        return " | ".join(repr(stage) for stage in self.stages)
+
+    def run(self, stdin=None, stdout=None, append=False, check=True):
+        """
+        Starts all stages, connected with OS pipes, and waits for them.
+
+        :param stdin: Path of a file to pass to the first stage. Inherited
+            from this process by default.
+
+        :param stdout: Path of a file for the output of the last stage.
+            Inherited from this process by default.
+
+        :param append: Append to `stdout` instead of replacing it.
+
+        :param check: Raise :class:`PipelineError` if a stage fails.
+
+        :returns: :class:`PipelineResult`.
+        """
+        cwd = commands.pwd()
+        stdin_fd = None
+        stdout_fd = None
+        processes = []
+        try:
+            if stdin is not None:
+                stdin_fd = os.open(commands.abspath(stdin), os.O_RDONLY)
+            if stdout is not None:
+                flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+                stdout_fd = os.open(commands.abspath(stdout), flags, 0o666)
+
+            read_fd = stdin_fd
+            for i, stage in enumerate(self.stages):
+                if i < len(self.stages) - 1:
+                    next_read_fd, write_fd = os.pipe()
+                else:
+                    next_read_fd, write_fd = None, stdout_fd
+                try:
+                    processes.append(subprocess.Popen(stage.argv, stdin=read_fd,
+                                                      stdout=write_fd, cwd=cwd))
+                except BaseException:
+                    if next_read_fd is not None:
+                        os.close(next_read_fd)
+                    raise
+                finally:
+                    # the children hold their own copies of the pipe ends.
+                    if read_fd is not None and read_fd != stdin_fd:
+                        os.close(read_fd)
+                    if write_fd is not None and write_fd != stdout_fd:
+                        os.close(write_fd)
+                read_fd = next_read_fd
+        except BaseException:
+            for process in processes:
+                process.kill()
+                process.wait()
+            raise
+        finally:
+            for fd in [stdin_fd, stdout_fd]:
+                if fd is not None:
+                    os.close(fd)
+
+        result = PipelineResult([process.wait() for process in processes])
+        if check and result.returncode:
+            raise PipelineError(result.returncodes, repr(self))
+        return result
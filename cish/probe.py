@@ -0,0 +1,202 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import json
+import threading
+import subprocess
+import collections
+import uuid
+
+from cish import commands
+
+
+InterpreterInfo = collections.namedtuple("InterpreterInfo", [
+    "executable", "version", "implementation", "platform_tag", "abi_tag",
+    "prefix", "scripts", "site_packages"])
+InterpreterInfo.__doc__ = """
+Metadata of a python interpreter.
+
+* `version`: Version string such as `"3.11.7"`.
+* `implementation`: For example `"CPython"` or `"PyPy"`.
+* `platform_tag`: Platform as used in wheel names, such as `"linux_x86_64"`.
+* `abi_tag`: Python tag of the interpreter as used in wheel names, such as `"cp311"`.
+* `prefix`: `sys.prefix`.
+* `scripts`: Directory into which console scripts are installed.
+* `site_packages`: List of the directories packages are installed into.
+"""
+
+
+#: Code printing the interpreter metadata as JSON. Kept compatible with old interpreters.
+_PROBE_SOURCE = r'''
+import sys, json, platform, sysconfig
+impl = platform.python_implementation()
+short = {"CPython": "cp", "PyPy": "pp", "IronPython": "ip", "Jython": "jy"}.get(impl, "py")
+paths = []
+for name in ("purelib", "platlib"):
+    path = sysconfig.get_path(name)
+    if path not in paths:
+        paths.append(path)
+print(json.dumps({
+    "version": platform.python_version(),
+    "implementation": impl,
+    "platform_tag": sysconfig.get_platform().replace("-", "_").replace(".", "_"),
+    "abi_tag": "%s%d%d" % (short, sys.version_info[0], sys.version_info[1]),
+    "prefix": sys.prefix,
+    "scripts": sysconfig.get_path("scripts"),
+    "site_packages": paths,
+}))
+'''
+
+
+class ProbeCache(object):
+    """
+    Persistent cache of interpreter metadata.
+
+    Entries are keyed by the path of the interpreter and are only valid as
+    long as the mtime and inode of the executable are unchanged, so a
+    replaced or upgraded interpreter is probed again. Each entry can hold
+    the search paths of the environment and the :class:`InterpreterInfo`.
+    The entry of an interpreter that no longer exists is dropped with the
+    next write once it was looked up.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: JSON file holding the cache. Defaults to
+            `cish/interpreters.json` in the user's cache directory.
+        """
+        if path is None:
+            path = os.path.join(commands._cache_dir(), "interpreters.json")
+        self.path = commands.abspath(path)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._stale = set()
+
+
+    def get(self, exe, field):
+        """
+        Returns a cached field for the interpreter, or `None` if there is
+        no valid entry.
+        """
+        stamp = _stamp(exe)
+        with self._lock:
+            entries = self._load()
+            if stamp is None:
+                # the interpreter is gone, drop its entry with the next write.
+                if entries.pop(exe, None) is not None:
+                    self._stale.add(exe)
+                return None
+            entry = entries.get(exe)
+        if entry is None or entry["stamp"] != stamp:
+            return None
+        return entry.get(field)
+
+
+    def put(self, exe, field, value):
+        """
+        Stores a field for the interpreter.
+        """
+        stamp = _stamp(exe)
+        if stamp is None:
+            return
+        with self._lock:
+            # merge with entries written by other processes meanwhile.
+            self._entries = None
+            entries = self._load()
+            self._stale.discard(exe)
+            for key in self._stale:
+                entries.pop(key, None)
+            entry = entries.get(exe)
+            if entry is None or entry["stamp"] != stamp:
+                entry = entries[exe] = {"stamp": stamp}
+            entry[field] = value
+            try:
+                commands.mkdirs(os.path.dirname(self.path))
+                tmp = self.path + "." + uuid.uuid4().hex
+                with open(tmp, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp, self.path)
+            except (IOError, OSError):
+                pass # the cache is an optimization only.
+
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except (IOError, OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+
+_default_cache = None
+
+def default_cache():
+    """
+    Returns the :class:`ProbeCache` used by default.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ProbeCache()
+    return _default_cache
+
+
+def interpreter_info(exe, cache=None, timeout=None):
+    """
+    Returns the :class:`InterpreterInfo` of an interpreter. The interpreter
+    is only started if the cache has no valid entry for it.
+
+    :param cache: :class:`ProbeCache` to use, defaults to :func:`default_cache`.
+
+    :param timeout: Seconds to wait for the interpreter to answer.
+    """
+    exe = commands.abspath(exe)
+    if cache is None:
+        cache = default_cache()
+    info = cache.get(exe, "info")
+    if info is None:
+        output = subprocess.check_output([exe, "-c", _PROBE_SOURCE], timeout=timeout,
+                                         stderr=subprocess.DEVNULL)
+        info = json.loads(output.decode("utf-8"))
+        cache.put(exe, "info", info)
+    return InterpreterInfo(executable=exe, **info)
+
+
+def _stamp(exe):
+    """
+    Returns `[mtime, inode]` of the executable or `None` if it does not exist.
+    """
+    try:
+        st = os.stat(exe)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_ino]
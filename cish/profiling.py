@@ -0,0 +1,259 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import json
+import collections
+
+from cish import commands
+
+
+#: Code that runs a python program under a profiler in the child process.
+#: Kept compatible with old interpreters.
+_RUNNER_SOURCE = r'''
+import sys, os, json, time, threading, runpy, hashlib, platform
+
+def label():
+    return "%s-%s-%s" % (platform.python_implementation().lower(), platform.python_version(),
+                         hashlib.sha1(sys.executable.encode("utf-8")).hexdigest()[:8])
+
+def key(filename, lineno, function):
+    return "%s:%d(%s)" % (filename, lineno, function)
+
+def run(kind, target, args):
+    if kind == "module":
+        sys.argv = [target] + args
+        sys.path[0] = os.getcwd()
+        runpy.run_module(target, run_name="__main__", alter_sys=True)
+    elif kind == "code":
+        sys.argv = ["-c"] + args
+        sys.path[0] = ""
+        exec(compile(target, "<string>", "exec"), {"__name__": "__main__"})
+    else:
+        sys.argv = [target] + args
+        sys.path[0] = os.path.dirname(os.path.abspath(target))
+        runpy.run_path(target, run_name="__main__")
+
+def cprofile(kind, target, args, base):
+    import cProfile, pstats
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        run(kind, target, args)
+    finally:
+        profile.disable()
+        profile.dump_stats(base + ".prof")
+        functions = {}
+        for (filename, lineno, function), (cc, nc, tt, ct, callers) in pstats.Stats(profile).stats.items():
+            functions[key(filename, lineno, function)] = [nc, tt, ct]
+        collected[0] = functions
+
+def sampling(kind, target, args, base, interval=0.005):
+    main = threading.current_thread().ident
+    counts = {}
+    stop = threading.Event()
+    def sample():
+        while not stop.is_set():
+            frame = sys._current_frames().get(main)
+            seen = set()
+            leaf = True
+            while frame is not None:
+                code = frame.f_code
+                k = key(code.co_filename, code.co_firstlineno, code.co_name)
+                entry = counts.setdefault(k, [0, 0, 0])
+                if leaf:
+                    entry[1] += 1
+                    leaf = False
+                if k not in seen:
+                    entry[2] += 1
+                    seen.add(k)
+                frame = frame.f_back
+            time.sleep(interval)
+    thread = threading.Thread(target=sample)
+    thread.daemon = True
+    thread.start()
+    try:
+        run(kind, target, args)
+    finally:
+        stop.set()
+        thread.join()
+        collected[0] = dict((k, [0, s * interval, c * interval]) for k, (n, s, c) in counts.items())
+
+collected = [{}]
+
+def main():
+    profiler, directory, name, kind, target = sys.argv[1:6]
+    args = sys.argv[6:]
+    directory = os.path.join(directory, label())
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    base = os.path.join(directory, "%s-%d-%d" % (name, os.getpid(), int(time.time() * 1000)))
+    start = time.time()
+    try:
+        if profiler == "sampling":
+            sampling(kind, target, args, base)
+        else:
+            cprofile(kind, target, args, base)
+    finally:
+        report = {"profiler": profiler, "name": name, "executable": sys.executable,
+                  "argv": [target] + args, "duration": time.time() - start,
+                  "functions": collected[0]}
+        with open(base + ".json", "w") as f:
+            json.dump(report, f)
+
+main()
+'''
+
+PROFILERS = ("cprofile", "sampling")
+
+#: Interpreter options that take a value.
+_OPTIONS_WITH_VALUE = ("-X", "-W", "-Q")
+
+
+FunctionStats = collections.namedtuple("FunctionStats", ["function", "calls", "self_time", "cumulative_time"])
+FunctionStats.__doc__ = """
+Aggregated statistics of a function. `function` is `"file:line(name)"`.
+`calls` is 0 for the sampling profiler, which cannot count them.
+"""
+
+
+def wrap(python, name, executable, args, directory, profiler="cprofile"):
+    """
+    Returns the command line that runs `executable` with `args` under a
+    profiler.
+
+    :param python: Interpreter of the environment.
+
+    :param name: Name of the invoked executable. `python` invocations
+        support scripts, `-m` and `-c`; other executables must be python
+        scripts, such as the console scripts created by `pip`.
+
+    :param directory: Directory for the profiles. Each invocation writes
+        a JSON summary, and with `cprofile` also a `.prof` file for
+        `pstats`, into a subdirectory named after the interpreter.
+
+    :param profiler: `"cprofile"` for exact statistics, or `"sampling"`
+        for a low-overhead profiler that samples the stack every 5ms.
+
+    :raises ValueError: if the executable cannot be profiled.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError("Unknown profiler {p!r}, use one of {ps}.".format(p=profiler, ps=PROFILERS))
+    directory = commands.abspath(directory)
+    commands.mkdirs(directory)
+    args = list(args)
+
+    if os.path.normcase(executable) == os.path.normcase(python) or name.startswith("python"):
+        options = []
+        while args and args[0].startswith("-") and args[0] not in ("-m", "-c", "-"):
+            option = args.pop(0)
+            options.append(option)
+            if option in _OPTIONS_WITH_VALUE and args:
+                options.append(args.pop(0))
+        if not args or args[0] == "-":
+            raise ValueError("Cannot profile an interactive interpreter or stdin.")
+        if args[0] in ("-m", "-c") and len(args) < 2:
+            raise ValueError("Missing argument for {o}.".format(o=args[0]))
+        if args[0] == "-m":
+            kind, target, rest = "module", args[1], args[2:]
+        elif args[0] == "-c":
+            kind, target, rest = "code", args[1], args[2:]
+        else:
+            kind, target, rest = "script", commands.abspath(args[0]), args[1:]
+    else:
+        if not _is_python_script(executable):
+            raise ValueError("Cannot profile {e}, it is not a python script.".format(e=executable))
+        options = []
+        kind, target, rest = "script", executable, args
+
+    return ([python] + options + ["-c", _RUNNER_SOURCE, profiler, directory, name, kind, target] + rest)
+
+
+def aggregate(directory):
+    """
+    Merges the profiles in `directory` per interpreter.
+
+    :returns: `dict` mapping the interpreter labels (like
+        `cpython-3.11.7-1a2b3c4d`) to a list of :class:`FunctionStats`,
+        hottest functions (by self time) first.
+    """
+    directory = commands.abspath(directory)
+    result = {}
+    if not os.path.isdir(directory):
+        return result
+    for label in sorted(os.listdir(directory)):
+        subdir = os.path.join(directory, label)
+        if not os.path.isdir(subdir):
+            continue
+        totals = {}
+        for filename in sorted(os.listdir(subdir)):
+            if not filename.endswith(".json"):
+                continue
+            with open(os.path.join(subdir, filename)) as f:
+                profile = json.load(f)
+            for function, (calls, self_time, cumulative) in profile["functions"].items():
+                entry = totals.setdefault(function, [0, 0.0, 0.0])
+                entry[0] += calls
+                entry[1] += self_time
+                entry[2] += cumulative
+        stats = [FunctionStats(function, *entry) for function, entry in totals.items()]
+        stats.sort(key=lambda s: (-s.self_time, s.function))
+        result[label] = stats
+    return result
+
+
+def report(directory, top=20):
+    """
+    Returns a table of the `top` hottest functions per interpreter,
+    merged over all profiles in `directory`.
+    """
+    lines = []
+    for label, stats in sorted(aggregate(directory).items()):
+        lines.append(label)
+        lines.append("  {0:>10} {1:>10} {2:>10}  {3}".format("calls", "self s", "cum s", "function"))
+        for s in stats[:top]:
+            lines.append("  {0:>10} {1:>10.4f} {2:>10.4f}  {3}".format(
+                s.calls, s.self_time, s.cumulative_time, s.function))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _is_python_script(path):
+    if path.endswith((".py", ".pyw")):
+        return True
+    try:
+        with open(path, "rb") as f:
+            first = f.readline(256)
+    except IOError:
+        return False
+    return first.startswith(b"#!") and b"python" in first
@@ -29,9 +29,13 @@
 
 import os.path
 import sys
-import shutil
-import subprocess
-import json
+from collections.abc import Mapping
+
+from cish import commands
+from cish import trace
+
+# The other modules of cish, and `subprocess` and `json`, are imported
+# where they are used, so that creating `cish.default` stays cheap.
 
 class PyEnv(object):
     """
@@ -48,21 +52,114 @@ class PyEnv(object):
         self.search_paths = search_paths
         self.exec_patterns = ['{name}' ,'{name}.exe']
         self.python_patterns = ['{name}', 'w{name}.exe' ,'{name}.exe']
+        self._index = {}
+        self._batch = None
+        #: Optional :class:`cish.Wheelhouse` through which `pip install` calls go.
+        self.wheelhouse = None
 
 
     def __getattr__(self, name):
         """
         Returns a method that invokes an exectuable in this environment.
         Arguments passed to the method become console line arguments.
+
+        The method accepts the keyword arguments of :func:`cish.capture.call`.
+        It returns the exit code, which is only non-zero with `check=False`.
+        With `capture=True` it returns a :class:`cish.capture.CapturedOutput`::
+
+            with env.pip("freeze", capture=True) as out:
+                installed = list(out.lines())
+
+        Inside a :meth:`batch` block, `pip install` calls are queued.
+        If :attr:`wheelhouse` is set, they install from it.
+
+        `python` and python console scripts can be profiled by passing
+        `profile` with a directory for the profiles, and optionally
+        `profiler="sampling"`. See :func:`cish.profiling.report`::
+
+            env.nosetests(profile="profiles")
+            print(cish.profiling.report("profiles"))
         """
         executable = self.find_executable(name)
         
-        def invoker(*args):
-            subprocess.check_call([executable] + list(args))
+        def invoker(*args, **options):
+            batch = self._batch
+            if batch is not None:
+                if name == "pip" and args[:1] == ("install",) and not options:
+                    batch.add(args[1:])
+                    return 0
+                batch.flush()
+            from cish import capture
+            argv = [executable] + list(args)
+            profile = options.pop("profile", None)
+            profiler = options.pop("profiler", "cprofile")
+            if profile is not None:
+                from cish import profiling
+                argv = profiling.wrap(self.find_executable("python"), name, executable,
+                                      args, profile, profiler)
+            with trace.span("command", name, list(args), self):
+                if (name == "pip" and args[:1] == ("install",) and not options and
+                        profile is None and self.wheelhouse is not None):
+                    self.wheelhouse.install(self, *args[1:])
+                    return 0
+                return capture.call(argv, **options)
         return invoker
 
 
-    def virtualenv(self, path="env", system_side_packages=False):
+    def __repr__(self):
+        return "PyEnv({paths!r})".format(paths=self.search_paths)
+
+
+    def batch(self):
+        """
+        Queues `pip install` calls and runs them as few invocations as
+        possible, paying for pip's startup and dependency resolution
+        only once::
+
+            with env.batch():
+                env.pip("install", "nose")
+                env.pip("install", "-r", "requirements.txt")
+
+        The queue is flushed before any other command of this
+        environment runs and at the end of the block. If a flushed
+        installation fails, :class:`cish.batch.BatchError` lists the
+        call sites of the requests that were part of it.
+        """
+        if self._batch is None:
+            from cish.batch import Batch
+            self._batch = Batch(self)
+        return self._batch
+
+
+    @property
+    def aio(self):
+        """
+        Asynchronous invokers for the executables of this environment,
+        see :class:`cish.aio.AsyncInvokers`::
+
+            result = await env.aio.python("setup.py", "build")
+        """
+        from cish.aio import AsyncInvokers
+        self._flush_batch()
+        return AsyncInvokers(self)
+
+
+    @property
+    def pure(self):
+        """
+        Invokers whose results are memoized, for commands without side
+        effects. Installing packages invalidates the results. See
+        :class:`cish.memo.PureInvokers`::
+
+            version = env.pure.python("--version").output
+        """
+        from cish.memo import PureInvokers
+        self._flush_batch()
+        return PureInvokers(self)
+
+
+    @trace.traced("virtualenv", method=True)
+    def virtualenv(self, path="env", system_side_packages=False, requirements=None, cache=None):
         """
         Creates a new virtual environment and returns the PyEnv for it.
         
@@ -73,36 +170,113 @@ class PyEnv(object):
         :param system_side_packages: Should the venv see the packages
             of the main environment?
 
+        :param requirements: Optional list of requirements to install
+            into the new environment using `pip`.
+
+        :param cache: Optional :class:`cish.VenvCache`. If given, the
+            environment is cloned from a cached template instead of
+            running `virtualenv`.
+
         :returns: PyEnv instance for the new environment.
         """
-        abspath = os.path.abspath(path)
-        
-        if os.path.isdir(abspath):
-            shutil.rmtree(abspath)
-        elif os.path.exists(abspath):
-            os.remove(abspath)
+        abspath = commands.abspath(path)
+        commands.rm(abspath, defer=True)
         
         parent = os.path.dirname(abspath)
         if not os.path.exists(parent):
             os.makedirs(parent)
-        
-        currentdir = os.getcwd()
-        try:
-            os.chdir(parent)
-            
-            virtualenv = self.find_executable("virtualenv")
-            args = [virtualenv, os.path.basename(abspath)]
-            if system_side_packages:
-                args.append("--system-site-packages")
-            subprocess.check_call(args)
 
+        if cache is not None:
+            cache.clone(self, abspath, system_side_packages, requirements)
             venv = from_virtualenv(abspath)
+            venv.wheelhouse = self.wheelhouse
             if system_side_packages:
                 venv.search_paths.extend(self.search_paths)
             return venv
 
-        finally:
-            os.chdir(currentdir)
+        virtualenv = self.find_executable("virtualenv")
+        args = [virtualenv, os.path.basename(abspath)]
+        if system_side_packages:
+            args.append("--system-site-packages")
+        import subprocess
+        subprocess.check_call(args, cwd=parent)
+
+        venv = from_virtualenv(abspath)
+        venv.wheelhouse = self.wheelhouse
+        if system_side_packages:
+            venv.search_paths.extend(self.search_paths)
+        if requirements:
+            venv.pip("install", *requirements)
+        return venv
+
+
+    @property
+    def cmd(self):
+        """
+        Commands of this environment that are not executed right away but
+        can be combined into pipelines, see :class:`cish.pipeline.Command`::
+
+            env.cmd.python("gen.py") | cish.sh.cmd.gzip > "out.gz"
+        """
+        from cish.pipeline import Commands
+        self._flush_batch()
+        return Commands(self)
+
+
+    @property
+    def info(self):
+        """
+        :class:`cish.probe.InterpreterInfo` of this environment's interpreter
+        with version, platform and installation paths. Cached on disk, so the
+        interpreter is only started the first time.
+        """
+        from cish import probe
+        return probe.interpreter_info(self.find_executable("python"))
+
+
+    def worker(self, idle_timeout=60):
+        """
+        Returns a long-lived python process of this environment that
+        executes snippets of code without paying the interpreter startup
+        for each of them. See :class:`cish.worker.Worker`::
+
+            env.worker().run("import nose")
+
+        :param idle_timeout: Seconds after which an unused worker
+            process is stopped. It is restarted on demand.
+        """
+        from cish.worker import get_worker
+        self._flush_batch()
+        return get_worker(self.find_executable("python"), idle_timeout)
+
+
+    def lease_venv(self, size=2, requirements=None, system_side_packages=False,
+                   cache=None, max_size=None, timeout=None):
+        """
+        Takes a pre-created virtual environment of this interpreter from a
+        shared :class:`cish.VenvPool`. It is reset and returned to the pool
+        at the end of the `with` block::
+
+            with env.lease_venv(requirements=["nose"]) as venv:
+                venv.pip("install", ".")
+                venv.nosetests()
+
+        The pool is created on first use with the given parameters;
+        later calls with the same interpreter and requirements share it.
+
+        :param timeout: Seconds to wait for an environment to be ready.
+        """
+        from cish.venvpool import get_pool
+        pool = get_pool(self, size, requirements, system_side_packages, cache, max_size)
+        return pool.lease(timeout)
+
+
+    def _flush_batch(self):
+        """
+        Runs queued `pip install` calls before something else uses this environment.
+        """
+        if self._batch is not None:
+            self._batch.flush()
 
 
     def find_executable(self, name):
@@ -116,17 +290,50 @@ class PyEnv(object):
         
         patterns = self.python_patterns if name == "python" else self.exec_patterns
         candidate_names = [ext.format(name=name) for ext in patterns]
+
+        for path in self.search_paths:
+            entries = self._directory_entries(path)
+            for n in candidate_names:
+                if os.path.normcase(n) in entries:
+                    return os.path.join(path, n)
+
         candidates = [os.path.join(path, n) for path in self.search_paths for n in candidate_names]
-   
-        for candidate in candidates:
-            if os.path.exists(candidate):
-                return candidate
-            
         raise ValueError("Unable to find {name}. Looked at {candidates}".format(
             name=repr(name),
             candidates=", ".join(candidates)
         ))
-        
+
+
+    def _directory_entries(self, path):
+        """
+        Returns the names of the entries in the given directory.
+
+        The names are listed with a single `os.scandir` and kept in an index
+        together with the directory's modification time. The directory is only
+        listed again once its mtime changes, for example because `pip install`
+        added a new console script.
+
+        :returns: `frozenset` with the (case-normalized) entry names. Empty
+            if the directory does not exist.
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._index.pop(path, None)
+            return frozenset()
+
+        cached = self._index.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with os.scandir(path) as it:
+                entries = frozenset(os.path.normcase(entry.name) for entry in it)
+        except OSError:
+            entries = frozenset()
+        self._index[path] = (mtime, entries)
+        return entries
+
 
 def interpeter_pyenv():
     """
@@ -134,14 +341,16 @@ def interpeter_pyenv():
     """
     if not sys.executable:
         raise ValueError("Interpeter that runs this script cannot be identified.")
-    return from_interpreter(sys.executable)
+    # A few `stat` calls are cheaper than loading the probe cache.
+    return _from_paths(os.path.dirname(os.path.abspath(sys.executable)), ["Scripts", "scripts"])
 
 
 def from_config(*search_paths):
     """
     Reads a json file with a `{name:"path/to/python", ...}` content and
-    returns a `dict` with the names and :class:`PyEnv` instances for each
-    entry.
+    returns a mapping with the names and :class:`PyEnv` instances for each
+    entry. The environments are constructed on first access, see
+    :class:`LazyEnvs`.
 
     By default it searches in the following locations (in that order):
 
@@ -156,8 +365,8 @@ def from_config(*search_paths):
 
     filename = "cish.json"
 
-    paths = list(search_paths)
-    paths.append(os.path.abspath(filename))
+    paths = [commands.abspath(path) for path in search_paths]
+    paths.append(commands.abspath(filename))
     paths.append(os.path.join(os.path.expanduser("~"), filename))
     if os.name == "nt":
         paths.append("C:\\" + filename)
@@ -172,31 +381,85 @@ def from_config(*search_paths):
         raise ValueError("Unable to locate configuration file. Searched in {paths}".format(
             paths = ", ".join(paths)))
 
+    import json
     with open(config_file, 'r') as f:
         config = json.load(f)
 
-    if not hasattr(config, "iteritems"):
-        raise ValueError("Invalid config file {f}. Must contain a key-value dict " + 
-            "as the top level element.".format(f=config_file))
+    if not isinstance(config, dict):
+        raise ValueError(("Invalid config file {f}. Must contain a key-value dict " + 
+            "as the top level element.").format(f=config_file))
+
+    return LazyEnvs(config)
+
+
+class LazyEnvs(Mapping):
+    """
+    Read-only mapping of names to :class:`PyEnv` instances, as returned by
+    :func:`from_config`. An environment is only constructed when its
+    name is accessed, so unused interpreters are never looked at.
+
+    :attr:`interpreters` maps the names to the interpreter paths.
+    """
+
+    def __init__(self, interpreters):
+        self.interpreters = dict(interpreters)
+        self._envs = {}
+
+    def __getitem__(self, name):
+        env = self._envs.get(name)
+        if env is None:
+            env = self._envs[name] = from_interpreter(self.interpreters[name])
+        return env
+
+    def __iter__(self):
+        return iter(self.interpreters)
 
-    return dict((name, from_interpreter(exe)) for name, exe in config.iteritems())
+    def __len__(self):
+        return len(self.interpreters)
+
+    def __repr__(self):
+        return "LazyEnvs({interpreters!r})".format(interpreters=self.interpreters)
 
 
 def from_interpreter(exe):
     """
     Attempts to construct the environment for a given python interpeter by guessing
-    where the paths are relative to it.
+    where the paths are relative to it. The result is kept in the
+    :class:`cish.probe.ProbeCache` until the interpreter or the content
+    of its directory changes.
  
     :param exe: Path to the python interpeter executable.
  
     :returns: Instance of :class:`PyEnv`
     """
-    exeabs = os.path.abspath(exe)
+    from cish import probe
+    exeabs = commands.abspath(exe)
+    cache = probe.default_cache()
+    path = os.path.dirname(exeabs)
+    try:
+        # creating or deleting a sub-directory changes the mtime.
+        stamp = os.stat(path).st_mtime_ns
+    except OSError:
+        stamp = None
+    cached = cache.get(exeabs, "search_paths")
+    if isinstance(cached, dict) and cached.get("stamp") == stamp:
+        return PyEnv(list(cached["paths"]))
+
     if not os.path.exists(exeabs):
         raise ValueError("Python interpreter {exe} does not exist here {exeabs}.".format(exe=exe, exeabs=exeabs))
     
-    path = os.path.dirname(exeabs)
-    return _from_paths(path, ["Scripts", "scripts"])
+    env = _from_paths(path, ["Scripts", "scripts"])
+    cache.put(exeabs, "search_paths", {"stamp": stamp, "paths": list(env.search_paths)})
+    return env
+
+
+def from_path():
+    """
+    Returns an environment containing the executables found on the `PATH`,
+    like a shell does. Available as `cish.sh`.
+    """
+    paths = [path for path in os.environ.get("PATH", "").split(os.pathsep) if path]
+    return PyEnv([commands.abspath(path) for path in paths])
 
 
 def from_virtualenv(path):
@@ -207,7 +470,7 @@ def from_virtualenv(path):
 
     :returns: Instance of :class:`PyEnv`
     """
-    return _from_paths(path, ["bin", "Scripts", "scripts"])    
+    return _from_paths(commands.abspath(path), ["bin", "Scripts", "scripts"])
 
 
 def _from_paths(path, subdirs):
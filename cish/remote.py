@@ -0,0 +1,728 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import sys
+import stat
+import json
+import base64
+import socket
+import select
+import hashlib
+import hmac
+import argparse
+import threading
+import subprocess
+import socketserver
+from collections.abc import Mapping
+
+from cish import commands
+from cish.capture import CapturedOutput, DEFAULT_SPILL_THRESHOLD
+from cish.worker import _write_frame, _read_frame
+
+
+#: Files are transferred in chunks of this size, addressed by their SHA-256.
+CHUNK_SIZE = 1024 * 1024
+
+#: Environment variable holding the secret shared by agents and clients.
+TOKEN_VARIABLE = "CISH_AGENT_TOKEN"
+
+#: Largest handshake message in bytes an agent accepts.
+_HELLO_LIMIT = 4096
+
+#: Directory names that are not synced to the agents.
+DEFAULT_IGNORE = (".git", ".hg", ".svn", "__pycache__", ".cish-cache")
+
+
+class RemoteError(Exception):
+    """
+    Raised if an agent rejects a request or the connection fails.
+    """
+
+
+# -- agent ------------------------------------------------------------------
+
+class Agent(object):
+    """
+    Build agent that runs commands in its environments for remote clients.
+
+    The environments are the ones listed in the agent's `cish.json`, see
+    :func:`cish.from_config`. Clients upload their working tree as
+    content-addressed chunks that the agent keeps in `root/chunks`, so
+    unchanged content is never transferred twice. Trees are checked out
+    in `root/trees`. At most `capacity` commands run at the same time.
+
+    Anyone who can talk to the agent can run commands on its machine, so
+    every connection has to prove that it knows the secret `token` before
+    anything else, by answering a random challenge with an HMAC of it.
+    The token itself is never sent. The rest of the traffic, including
+    commands and their output, is not encrypted, so only expose the agent
+    on a trusted network or through a tunnel such as `ssh -L`. Start an
+    agent with::
+
+        CISH_AGENT_TOKEN=secret python -m cish.remote --host 127.0.0.1 --port 7878
+    """
+
+    def __init__(self, envs, root, token, capacity=None):
+        """
+        :param envs: Mapping of names to :class:`PyEnv`.
+
+        :param token: Secret shared with the clients.
+
+        :param root: Directory for chunks and working trees.
+
+        :param capacity: Number of commands run in parallel. Defaults to
+            the number of CPUs.
+        """
+        if not token:
+            raise ValueError("The agent needs a token.")
+        self.envs = envs
+        self.token = token
+        self.root = commands.abspath(root)
+        self.capacity = capacity or os.cpu_count() or 1
+        self.running = 0
+        self._slots = threading.Semaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._tree_locks = {}
+        self._local = threading.local()
+        commands.mkdirs(os.path.join(self.root, "chunks"))
+        commands.mkdirs(os.path.join(self.root, "trees"))
+
+
+    def serve(self, host="127.0.0.1", port=0, ready=None):
+        """
+        Serves clients until interrupted.
+
+        :param ready: Optional callable invoked with `(host, port)` once
+            the agent accepts connections.
+        """
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                agent._local.socket = self.connection
+                agent._handle(self.rfile, self.wfile)
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        with Server((host, port), Handler) as server:
+            if ready is not None:
+                ready(*server.server_address[:2])
+            server.serve_forever()
+
+
+    def _handle(self, rfile, wfile):
+        challenge = os.urandom(32).hex()
+        try:
+            _write_frame(wfile, {"challenge": challenge})
+            # don't let unauthenticated peers make us buffer large messages.
+            request = _read_frame(rfile, _HELLO_LIMIT)
+        except (EOFError, OSError, ValueError):
+            return
+        response = request.get("response") if isinstance(request, dict) else None
+        if (request.get("op") != "hello" or not isinstance(response, str) or
+                not hmac.compare_digest(response, _respond(self.token, challenge))):
+            _write_frame(wfile, {"error": "Authentication failed."})
+            return
+        self._op_hello(request, wfile)
+        while True:
+            try:
+                request = _read_frame(rfile)
+            except (EOFError, OSError):
+                return
+            try:
+                op = getattr(self, "_op_" + request.get("op", ""), None)
+                if op is None:
+                    raise RemoteError("Unknown operation {op!r}.".format(op=request.get("op")))
+                op(request, wfile)
+            except Exception as e:
+                _write_frame(wfile, {"error": "{t}: {e}".format(t=type(e).__name__, e=e)})
+
+
+    def _op_hello(self, request, wfile):
+        _write_frame(wfile, {"envs": sorted(self.envs), "capacity": self.capacity})
+
+
+    def _op_status(self, request, wfile):
+        _write_frame(wfile, {"running": self.running, "capacity": self.capacity})
+
+
+    def _op_missing(self, request, wfile):
+        missing = [digest for digest in request["digests"]
+                   if not os.path.exists(self._chunk_path(digest))]
+        _write_frame(wfile, {"missing": missing})
+
+
+    def _op_put(self, request, wfile):
+        data = base64.b64decode(request["data"])
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != request["digest"]:
+            raise RemoteError("Chunk {d} arrived corrupted.".format(d=request["digest"]))
+        path = self._chunk_path(digest)
+        if not os.path.exists(path):
+            commands.mkdirs(os.path.dirname(path))
+            tmp = "{path}.{id}.tmp".format(path=path, id=threading.get_ident())
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        _write_frame(wfile, {"ok": True})
+
+
+    def _op_checkout(self, request, wfile):
+        tree = _check_name(request["tree"])
+        with self._tree_lock(tree):
+            self._checkout(tree, request["files"])
+        _write_frame(wfile, {"ok": True})
+
+
+    def _op_run(self, request, wfile):
+        env = self.envs[request["env"]]
+        executable = env.find_executable(request["name"])
+        cwd = self.root
+        if request.get("tree"):
+            cwd = os.path.join(self.root, "trees", _check_name(request["tree"]))
+            cwd = os.path.join(cwd, _check_relpath(request.get("cwd") or "."))
+        with self._slots:
+            with self._lock:
+                self.running += 1
+            try:
+                process = subprocess.Popen([executable] + list(request["args"]), cwd=cwd,
+                                           stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT)
+                done = threading.Event()
+                watcher = threading.Thread(target=self._watch_client,
+                                           args=(getattr(self._local, "socket", None), process, done))
+                watcher.daemon = True
+                watcher.start()
+                try:
+                    with process.stdout:
+                        while True:
+                            data = process.stdout.read1(64 * 1024)
+                            if not data:
+                                break
+                            _write_frame(wfile, {"output": base64.b64encode(data).decode("ascii")})
+                finally:
+                    # the client may be gone, the command must not outlive it.
+                    done.set()
+                    if process.poll() is None:
+                        process.kill()
+                    returncode = process.wait()
+            finally:
+                with self._lock:
+                    self.running -= 1
+        _write_frame(wfile, {"returncode": returncode})
+
+
+    def _watch_client(self, sock, process, done):
+        """
+        Kills `process` if the client disconnects while it is running.
+        Clients send nothing while they wait for a command, so a readable
+        socket means it was closed.
+        """
+        if sock is None:
+            return
+        while not done.is_set():
+            readable, _, _ = select.select([sock], [], [], 0.2)
+            if readable and not done.is_set():
+                try:
+                    closed = not sock.recv(1, socket.MSG_PEEK)
+                except OSError:
+                    closed = True
+                if closed:
+                    process.kill()
+                    return
+                done.wait(0.2)
+
+
+    def _chunk_path(self, digest):
+        digest = _check_name(digest)
+        return os.path.join(self.root, "chunks", digest[:2], digest)
+
+
+    def _tree_lock(self, tree):
+        with self._lock:
+            return self._tree_locks.setdefault(tree, threading.Lock())
+
+
+    def _checkout(self, tree, files):
+        """
+        Makes the working tree match the manifest. Files are only written
+        if their content changed since the last checkout, or if they were
+        modified on the agent.
+        """
+        treedir = os.path.join(self.root, "trees", tree)
+        statefile = os.path.join(self.root, "trees", tree + ".json")
+        try:
+            with open(statefile) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            state = {}
+
+        for relpath in set(state) - set(files):
+            commands.rm(os.path.join(treedir, _check_relpath(relpath)))
+            del state[relpath]
+
+        for relpath, (chunks, mode) in files.items():
+            path = os.path.join(treedir, _check_relpath(relpath))
+            known = state.get(relpath)
+            if known is not None and known[0] == chunks and known[1] == mode and _stamp(path) == known[2]:
+                continue
+            commands.mkdirs(os.path.dirname(path))
+            tmp = path + ".cish-tmp"
+            with open(tmp, "wb") as f:
+                for digest in chunks:
+                    with open(self._chunk_path(digest), "rb") as chunk:
+                        f.write(chunk.read())
+            os.chmod(tmp, mode)
+            os.replace(tmp, path)
+            state[relpath] = [chunks, mode, _stamp(path)]
+
+        with open(statefile + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(statefile + ".tmp", statefile)
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _check_name(name):
+    """
+    Rejects names that could escape the agent's directories.
+    """
+    if not name or "/" in name or "\\" in name or name.startswith("."):
+        raise RemoteError("Invalid name {name!r}.".format(name=name))
+    return name
+
+
+def _check_relpath(relpath):
+    """
+    Rejects paths that are absolute or point outside of the tree.
+    """
+    normalized = os.path.normpath(relpath)
+    if os.path.isabs(normalized) or normalized == ".." or normalized.startswith(".." + os.sep):
+        raise RemoteError("Invalid path {path!r}.".format(path=relpath))
+    return normalized
+
+
+def _respond(token, challenge):
+    """
+    Returns the answer to an agent's challenge, which proves knowledge of
+    the token without revealing it.
+    """
+    return hmac.new(token.encode("utf-8"), challenge.encode("ascii"), hashlib.sha256).hexdigest()
+
+
+
+# -- client -----------------------------------------------------------------
+
+class _Connection(object):
+    """
+    Authenticated connection to an agent. `hello` is the agent's answer
+    to the handshake.
+    """
+
+    def __init__(self, address, timeout, token):
+        self.socket = socket.create_connection(address, timeout)
+        self.socket.settimeout(None)
+        self.rfile = self.socket.makefile("rb")
+        self.wfile = self.socket.makefile("wb")
+        try:
+            challenge = self.response()["challenge"]
+            self.hello = self.request({"op": "hello", "response": _respond(token, challenge)})
+        except BaseException:
+            self.close()
+            raise
+
+    def request(self, message):
+        _write_frame(self.wfile, message)
+        return self.response()
+
+    def response(self):
+        response = _read_frame(self.rfile)
+        if "error" in response:
+            raise RemoteError(response["error"])
+        return response
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.socket.close()
+
+
+class _AgentClient(object):
+    """
+    Connections to one agent. Idle connections are kept for reuse.
+    """
+
+    def __init__(self, address, pool_size, timeout, token):
+        self.address = address
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.token = token
+        self.inflight = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        connection = self.connection()
+        self.envs = set(connection.hello["envs"])
+        self.capacity = connection.hello["capacity"]
+        self.release(connection)
+
+    def connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return _Connection(self.address, self.timeout, self.token)
+        except (OSError, EOFError) as e:
+            raise RemoteError("Cannot connect to agent {a}: {e}".format(a=_format_address(self.address), e=e))
+
+    def release(self, connection, healthy=True):
+        with self._lock:
+            if healthy and len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, message):
+        connection = self.connection()
+        try:
+            response = connection.request(message)
+        except RemoteError:
+            self.release(connection)
+            raise
+        except (OSError, EOFError) as e:
+            self.release(connection, healthy=False)
+            raise RemoteError("Connection to agent {a} failed: {e}".format(a=_format_address(self.address), e=e))
+        self.release(connection)
+        return response
+
+    def sync(self, manifest, read_chunk, tree):
+        """
+        Uploads the chunks the agent does not have yet and checks the tree out.
+
+        :returns: Number of uploaded chunks.
+        """
+        digests = sorted({digest for chunks, _ in manifest.values() for digest in chunks})
+        missing = self.request({"op": "missing", "digests": digests})["missing"]
+        for digest in missing:
+            data = read_chunk(digest)
+            self.request({"op": "put", "digest": digest,
+                          "data": base64.b64encode(data).decode("ascii")})
+        self.request({"op": "checkout", "tree": tree, "files": manifest})
+        return len(missing)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class Cluster(Mapping):
+    """
+    Environments of a set of remote agents (see :class:`Agent`), as a
+    mapping of names to :class:`RemoteEnv`, like :func:`cish.from_config`.
+
+    A command is sent to an agent that has the environment and a free
+    slot, preferring the least loaded one. If all of them are busy, the
+    command waits. Connections to the agents are pooled::
+
+        cluster = cish.Cluster(["build1:7878", "build2:7878"], workdir=".")
+        for name, env in cluster.items():
+            env.python("setup.py", "test")
+    """
+
+    def __init__(self, addresses, workdir=None, pool_size=4, timeout=10,
+                 ignore=DEFAULT_IGNORE, token=None):
+        """
+        :param addresses: Agents as `"host:port"` or `(host, port)`.
+
+        :param token: Secret shared with the agents. Defaults to the
+            `CISH_AGENT_TOKEN` environment variable.
+
+        :param workdir: Local directory that is synced to the agent before
+            each command, which then runs in the synced copy. If not given,
+            nothing is synced.
+
+        :param pool_size: Idle connections kept per agent.
+
+        :param timeout: Seconds to wait for a connection.
+
+        :param ignore: Directory names not synced.
+        """
+        self.workdir = None if workdir is None else commands.abspath(workdir)
+        self.ignore = set(ignore)
+        if token is None:
+            token = os.environ.get(TOKEN_VARIABLE)
+        if not token:
+            raise ValueError("A token is required, pass it or set {v}.".format(v=TOKEN_VARIABLE))
+        self._agents = [_AgentClient(_parse_address(a), pool_size, timeout, token) for a in addresses]
+        self._changed = threading.Condition()
+        self._hashes = {}
+        self._hashes_lock = threading.Lock()
+        self._synced = {}
+
+    def __getitem__(self, name):
+        if not any(name in agent.envs for agent in self._agents):
+            raise KeyError(name)
+        return RemoteEnv(self, name)
+
+    def __iter__(self):
+        return iter(sorted(set().union(*[agent.envs for agent in self._agents])))
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __repr__(self):
+        return "Cluster({agents!r})".format(agents=[_format_address(a.address) for a in self._agents])
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        for agent in self._agents:
+            agent.close()
+
+    def _acquire(self, env):
+        """
+        Picks an agent with the environment and a free slot, waiting for one.
+        """
+        candidates = [agent for agent in self._agents if env in agent.envs]
+        if not candidates:
+            raise ValueError("No agent has environment {env!r}.".format(env=env))
+        with self._changed:
+            while True:
+                free = [agent for agent in candidates if agent.inflight < agent.capacity]
+                if free:
+                    agent = min(free, key=lambda a: float(a.inflight) / a.capacity)
+                    agent.inflight += 1
+                    return agent
+                self._changed.wait()
+
+    def _release(self, agent):
+        with self._changed:
+            agent.inflight -= 1
+            self._changed.notify_all()
+
+    def _tree(self):
+        """
+        Name of the synced copy of `workdir` on the agents.
+        """
+        key = "{host}:{path}".format(host=socket.gethostname(), path=self.workdir)
+        return "t" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    def _manifest(self):
+        """
+        Maps the relative paths of the files in `workdir` to their chunk
+        digests and modes. Digests are recomputed only for files whose
+        size or modification time changed.
+        """
+        manifest = {}
+        for dirpath, dirnames, filenames in os.walk(self.workdir):
+            dirnames[:] = [d for d in dirnames if d not in self.ignore]
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                st = os.stat(path)
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                key = (st.st_size, st.st_mtime_ns)
+                with self._hashes_lock:
+                    cached = self._hashes.get(path)
+                if cached is None or cached[0] != key:
+                    cached = (key, _chunk_digests(path))
+                    with self._hashes_lock:
+                        self._hashes[path] = cached
+                relpath = os.path.relpath(path, self.workdir).replace(os.sep, "/")
+                manifest[relpath] = [cached[1], stat.S_IMODE(st.st_mode)]
+        return manifest
+
+    def _read_chunk(self, manifest):
+        locations = {}
+        for relpath, (chunks, _) in manifest.items():
+            for index, digest in enumerate(chunks):
+                locations.setdefault(digest, (relpath, index))
+
+        def read_chunk(digest):
+            relpath, index = locations[digest]
+            with open(os.path.join(self.workdir, relpath), "rb") as f:
+                f.seek(index * CHUNK_SIZE)
+                return f.read(CHUNK_SIZE)
+        return read_chunk
+
+    def _sync(self, agent):
+        """
+        Syncs `workdir` to the agent.
+
+        :returns: Number of uploaded chunks.
+        """
+        manifest = self._manifest()
+        return agent.sync(manifest, self._read_chunk(manifest), self._tree())
+
+
+class RemoteEnv(object):
+    """
+    Environment on remote agents, obtained from a :class:`Cluster`.
+
+    Like :class:`PyEnv`, attributes are invokers for executables::
+
+        env.python("-c", "import sys; print(sys.version)")
+
+    The output is streamed back while the command runs. The invokers
+    accept `capture`, `tee`, `check` and `cwd` like :func:`cish.capture.call`;
+    `cwd` is relative to the synced working directory.
+    """
+
+    def __init__(self, cluster, name):
+        self.cluster = cluster
+        self.name = name
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def invoker(*args, **options):
+            return self._run(name, list(args), **options)
+        return invoker
+
+    def __repr__(self):
+        return "RemoteEnv({name!r})".format(name=self.name)
+
+    def _run(self, name, args, capture=False, tee=None, check=True, cwd=None,
+             spill_threshold=DEFAULT_SPILL_THRESHOLD):
+        cluster = self.cluster
+        agent = cluster._acquire(self.name)
+        try:
+            tree = None
+            if cluster.workdir is not None:
+                cluster._sync(agent)
+                tree = cluster._tree()
+            request = {"op": "run", "env": self.name, "name": name, "args": args,
+                       "tree": tree, "cwd": cwd}
+            output = CapturedOutput([name] + args, spill_threshold) if (capture or tee) else None
+            log = None
+            connection = agent.connection()
+            healthy = False
+            try:
+                if tee:
+                    log = open(commands.abspath(tee), "wb")
+                _write_frame(connection.wfile, request)
+                while True:
+                    response = connection.response()
+                    if "returncode" in response:
+                        returncode = response["returncode"]
+                        break
+                    data = base64.b64decode(response["output"])
+                    if output is not None:
+                        output.write(data)
+                    else:
+                        sys.stdout.buffer.write(data)
+                        sys.stdout.flush()
+                    if log is not None:
+                        log.write(data)
+                healthy = True
+            except (OSError, EOFError) as e:
+                raise RemoteError("Connection to agent {a} failed: {e}".format(
+                    a=_format_address(agent.address), e=e))
+            finally:
+                agent.release(connection, healthy)
+                if log is not None:
+                    log.close()
+        finally:
+            cluster._release(agent)
+
+        argv = [name] + args
+        if output is not None:
+            output.returncode = returncode
+        if check and returncode:
+            raise subprocess.CalledProcessError(returncode, argv, output=output)
+        return output if output is not None else returncode
+
+
+def _chunk_digests(path):
+    digests = []
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            digests.append(hashlib.sha256(data).hexdigest())
+    return digests
+
+
+def _parse_address(address):
+    if isinstance(address, str):
+        host, _, port = address.rpartition(":")
+        return (host or "127.0.0.1", int(port))
+    return tuple(address)
+
+
+def _format_address(address):
+    return "{0}:{1}".format(*address)
+
+
+def main(argv=None):
+    from cish import pyenv
+    parser = argparse.ArgumentParser(prog="python -m cish.remote",
+                                     description="Runs a cish build agent.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=7878, help="Port to listen on, 0 for any.")
+    parser.add_argument("--config", action="append", default=[],
+                        help="cish.json with the environments to offer.")
+    parser.add_argument("--capacity", type=int, help="Commands run in parallel.")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_VARIABLE),
+                        help="Secret the clients must present. Defaults to ${v}, "
+                             "which does not show up in the process list.".format(v=TOKEN_VARIABLE))
+    parser.add_argument("--root", default=os.path.join(commands._cache_dir(), "agent"),
+                        help="Directory for chunks and working trees.")
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error("a token is required, set {v} or pass --token.".format(v=TOKEN_VARIABLE))
+
+    agent = Agent(pyenv.from_config(*args.config), args.root, args.token, args.capacity)
+
+    def ready(host, port):
+        print("cish agent listening on {host}:{port}".format(host=host, port=port))
+        sys.stdout.flush()
+
+    try:
+        agent.serve(args.host, args.port, ready)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import json
+import heapq
+import time
+import multiprocessing
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+
+from cish import commands
+
+
+class DurationHistory(object):
+    """
+    Durations of individual tests from earlier runs, stored as JSON.
+    Tests are identified like in JUnit XML, by `"classname::name"`.
+    """
+
+    def __init__(self, path=".cish-test-durations.json"):
+        self.path = commands.abspath(path)
+        try:
+            with open(self.path, 'r') as f:
+                self.durations = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.durations = {}
+
+    def estimate(self, test_id):
+        """
+        Returns the expected duration of a test given by its pytest node id.
+        Tests without history are assumed to take the median duration.
+        """
+        duration = self.durations.get(_junit_key(test_id))
+        if duration is not None:
+            return duration
+        known = sorted(self.durations.values())
+        return known[len(known) // 2] if known else 1.0
+
+    def save(self):
+        commands.mkdirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            json.dump(self.durations, f, indent=0, sort_keys=True)
+
+
+class ShardReport(object):
+    """
+    Result of :func:`run_sharded`.
+
+    `junit_xml` is the path of the merged JUnit XML file, `returncodes`
+    maps `(env name, shard index)` to the exit code of the shard.
+    """
+
+    def __init__(self, junit_xml, returncodes, duration, tests, failures):
+        self.junit_xml = junit_xml
+        self.returncodes = returncodes
+        self.duration = duration
+        self.tests = tests
+        self.failures = failures
+
+    @property
+    def ok(self):
+        # pytest exits with 5 if a shard collected no tests.
+        return self.failures == 0 and all(code in (0, 5) for code in self.returncodes.values())
+
+    def __str__(self):
+        return "{tests} tests, {failures} failures/errors in {shards} shards, {duration:.1f}s".format(
+            tests=self.tests, failures=self.failures, shards=len(self.returncodes),
+            duration=self.duration)
+
+
+def collect_tests(env, args=()):
+    """
+    Returns the pytest node ids of the tests in the current directory.
+
+    :param args: Additional pytest arguments selecting the tests,
+        such as paths or `-k` expressions.
+    """
+    with env.python("-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider",
+                    *args, capture=True, check=False) as out:
+        if out.returncode not in (0, 5):
+            raise ValueError("Collecting tests failed:\n{output}".format(
+                output=out.read().decode("utf-8", "replace")))
+        # one node id per line, up to the blank line before the summary.
+        tests = []
+        for line in out.lines():
+            if not line.strip():
+                break
+            if "::" in line:
+                tests.append(line)
+        return tests
+
+
+def partition(tests, durations, shards):
+    """
+    Splits tests into shards with similar total duration using the
+    longest-processing-time rule: the longest test not yet assigned goes
+    into the shard with the smallest total so far.
+
+    :param tests: Test ids.
+
+    :param durations: Function returning the expected duration of a test.
+
+    :param shards: Number of shards.
+
+    :returns: List of `shards` lists of test ids. Shards may be empty
+        if there are fewer tests than shards.
+    """
+    heap = [(0.0, i) for i in range(shards)]
+    result = [[] for _ in range(shards)]
+    for duration, test in sorted(((durations(t), t) for t in tests), key=lambda x: (-x[0], x[1])):
+        total, i = heapq.heappop(heap)
+        result[i].append(test)
+        heapq.heappush(heap, (total + duration, i))
+    return result
+
+
+def run_sharded(envs, args=(), options=(), shards=None, workers=None,
+                history=None, workdir="shards", junit_xml="junit.xml"):
+    """
+    Runs the pytest suite of the current directory in all environments,
+    split into shards that run in parallel.
+
+    Tests are collected in each environment and distributed over the
+    shards based on their durations in earlier runs, so that all shards
+    take about the same time. The results of all shards are merged into a
+    single JUnit XML file with one test suite per environment, and the
+    measured durations are added to the history for the next run::
+
+        report = cish.run_sharded(cish.from_config(), args=["tests"])
+        print(report)
+
+    Node ids are relative to the project root, so this should be called
+    with the project root as current directory.
+
+    :param envs: `dict` mapping names to :class:`PyEnv` instances.
+        pytest must be installed in each of them.
+
+    :param args: pytest arguments selecting the tests.
+
+    :param options: Additional pytest options for running the shards.
+
+    :param shards: Shards per environment. Defaults to the number of CPUs.
+
+    :param workers: Number of shards running at the same time.
+        Defaults to the number of CPUs.
+
+    :param history: :class:`DurationHistory`. Defaults to
+        `.cish-test-durations.json` in the current directory.
+
+    :param workdir: Directory for the JUnit XML files and logs of the shards.
+
+    :param junit_xml: Path of the merged JUnit XML file.
+
+    :returns: :class:`ShardReport`.
+    """
+    start = time.time()
+    cpus = multiprocessing.cpu_count()
+    shards = shards or cpus
+    workers = workers or cpus
+    history = history if history is not None else DurationHistory()
+    workdir = commands.abspath(workdir)
+    junit_xml = commands.abspath(junit_xml)
+    cwd = commands.pwd()
+    commands.rm(workdir)
+    commands.mkdirs(workdir)
+
+    jobs = []
+    for name in sorted(envs):
+        env = envs[name]
+        tests = collect_tests(env, args)
+        for i, shard in enumerate(partition(tests, history.estimate, shards)):
+            if shard:
+                jobs.append((name, i, env, shard))
+
+    def run(job):
+        name, i, env, shard = job
+        xml = os.path.join(workdir, "{name}-{i}.xml".format(name=name, i=i))
+        log = os.path.join(workdir, "{name}-{i}.log".format(name=name, i=i))
+        with env.python("-m", "pytest", "-q", "-p", "no:cacheprovider",
+                        "--junitxml=" + xml, *(list(options) + shard),
+                        capture=True, tee=log, check=False, cwd=cwd) as out:
+            return out.returncode
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        codes = list(executor.map(run, jobs))
+    returncodes = dict(((name, i), code) for (name, i, _, _), code in zip(jobs, codes))
+
+    tests, failures = _merge(jobs, workdir, junit_xml, history)
+    history.save()
+    return ShardReport(junit_xml, returncodes, time.time() - start, tests, failures)
+
+
+def _merge(jobs, workdir, junit_xml, history):
+    """
+    Merges the JUnit XML files of the shards into one file and records
+    the durations of the tests in the history.
+
+    :returns: Total number of tests and of failures plus errors.
+    """
+    root = ElementTree.Element("testsuites")
+    suites = {}
+    counters = ["tests", "failures", "errors", "skipped"]
+    for name, i, _, _ in jobs:
+        xml = os.path.join(workdir, "{name}-{i}.xml".format(name=name, i=i))
+        if not os.path.exists(xml):
+            continue
+        suite = suites.get(name)
+        if suite is None:
+            suite = suites[name] = ElementTree.SubElement(root, "testsuite", name=name)
+            for counter in counters + ["time"]:
+                suite.set(counter, "0")
+        shard_root = ElementTree.parse(xml).getroot()
+        shard_suites = [shard_root] if shard_root.tag == "testsuite" else shard_root.findall("testsuite")
+        for shard_suite in shard_suites:
+            for counter in counters:
+                suite.set(counter, str(int(suite.get(counter)) + int(shard_suite.get(counter, "0"))))
+            # shards run in parallel, the suite took as long as its slowest shard.
+            suite.set("time", "%.3f" % max(float(suite.get("time")), float(shard_suite.get("time", "0"))))
+            for testcase in shard_suite.findall("testcase"):
+                suite.append(testcase)
+                key = "{0}::{1}".format(testcase.get("classname"), testcase.get("name"))
+                history.durations[key] = float(testcase.get("time", "0"))
+
+    commands.mkdirs(os.path.dirname(junit_xml))
+    ElementTree.ElementTree(root).write(junit_xml, encoding="utf-8", xml_declaration=True)
+    tests = sum(int(s.get("tests")) for s in suites.values())
+    failures = sum(int(s.get("failures")) + int(s.get("errors")) for s in suites.values())
+    return tests, failures
+
+
+def _junit_key(test_id):
+    """
+    Converts a pytest node id like `"pkg/test_mod.py::TestClass::test_f"` into
+    the JUnit identity `"pkg.test_mod.TestClass::test_f"`.
+    """
+    parts = test_id.split("::")
+    path = parts[0]
+    if path.endswith(".py"):
+        path = path[:-3]
+    module = path.replace("/", ".").replace("\\", ".")
+    return "{0}::{1}".format(".".join([module] + parts[1:-1]), parts[-1])
@@ -0,0 +1,299 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import glob
+import hashlib
+import json
+import functools
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cish import commands
+
+
+class StepCache(object):
+    """
+    Local content-addressed store for the outputs of build steps.
+
+    The directory contains:
+
+    * `objects/`: file contents, named by their SHA-256.
+    * `steps/`: one manifest per successfully completed step, named by
+      the step's key and listing its outputs.
+    * `hashes.json`: digests of input files together with their size
+      and mtime, so unchanged files are not hashed again.
+    """
+
+    def __init__(self, root=".cish-cache", workers=8):
+        self.root = commands.abspath(root)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._hashes = None
+
+
+    def digest_files(self, paths):
+        """
+        Returns the SHA-256 hex digests of the given files as a `dict`.
+        Files whose size and mtime did not change since they were last
+        hashed are not read again, the others are hashed in parallel.
+        """
+        hashes = self._load_hashes()
+        result = {}
+        todo = []
+        for path in paths:
+            st = os.stat(path)
+            known = hashes.get(path)
+            if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+                result[path] = known[2]
+            else:
+                todo.append((path, st))
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                digests = executor.map(lambda item: _hash_file(item[0]), todo)
+                for (path, st), digest in zip(todo, digests):
+                    result[path] = digest
+                    with self._lock:
+                        hashes[path] = [st.st_size, st.st_mtime_ns, digest]
+            self._save_hashes()
+        return result
+
+
+    def lookup(self, key):
+        """
+        Returns the manifest of a completed step or `None`.
+        """
+        path = self._manifest_path(key)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+
+    def store(self, key, base, outputs):
+        """
+        Adds the output files to the store and records the step as completed.
+
+        :param base: Directory the output paths are relative to.
+
+        :param outputs: Paths of the output files.
+        """
+        digests = self.digest_files(outputs)
+        files = {}
+        for path in outputs:
+            digest = digests[path]
+            obj = self._object_path(digest)
+            if not os.path.exists(obj):
+                commands.mkdirs(os.path.dirname(obj))
+                tmp = obj + "." + uuid.uuid4().hex
+                commands._clone_file(path, tmp)
+                os.rename(tmp, obj)
+            files[os.path.relpath(path, base)] = {"digest": digest,
+                                                  "mode": os.stat(path).st_mode & 0o7777}
+        manifest = {"files": files}
+        _atomic_write_json(self._manifest_path(key), manifest)
+        return manifest
+
+
+    def restore(self, manifest, base):
+        """
+        Restores the outputs listed in a manifest.
+        """
+        for relpath, info in manifest["files"].items():
+            path = os.path.join(base, relpath)
+            commands.rm(path)
+            commands.mkdirs(os.path.dirname(path))
+            commands._clone_file(self._object_path(info["digest"]), path)
+            os.chmod(path, info["mode"])
+
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def _manifest_path(self, key):
+        return os.path.join(self.root, "steps", key + ".json")
+
+    def _load_hashes(self):
+        with self._lock:
+            if self._hashes is None:
+                path = os.path.join(self.root, "hashes.json")
+                try:
+                    with open(path, 'r') as f:
+                        self._hashes = json.load(f)
+                except (IOError, OSError, ValueError):
+                    self._hashes = {}
+            return self._hashes
+
+    def _save_hashes(self):
+        with self._lock:
+            _atomic_write_json(os.path.join(self.root, "hashes.json"), self._hashes)
+
+
+class Step(object):
+    """
+    Build step that is skipped if its inputs did not change.
+
+    The key of the step is a hash of its name, the environment, the
+    command line and the content of all input files. If a step with the
+    same key completed successfully before, its outputs are restored from
+    the :class:`StepCache` instead of running it again.
+
+    Can be used as a context manager::
+
+        with cish.step("build", inputs=["setup.py", "src/**/*.py"],
+                       outputs=["build"], env=env) as s:
+            if s.needed:
+                env.python("setup.py", "build")
+
+    or as a decorator::
+
+        @cish.step("deps", inputs=["requirements.txt"], env=env)
+        def install():
+            env.pip("install", "-r", "requirements.txt")
+
+        install()  # does nothing if requirements.txt did not change
+    """
+
+    def __init__(self, name, inputs=(), outputs=(), env=None, argv=(), cache=None):
+        """
+        :param name: Name of the step, part of the key.
+
+        :param inputs: Files, directories or glob patterns (`**` matches
+            subdirectories) the step reads.
+
+        :param outputs: Files or directories the step produces. Restored
+            if the step is skipped.
+
+        :param env: :class:`PyEnv` in which the step runs, part of the key.
+
+        :param argv: Command line arguments of the step, part of the key.
+
+        :param cache: :class:`StepCache` to use. Defaults to
+            `.cish-cache` in the current directory. Relative paths are
+            relative to the current directory as well.
+        """
+        self.name = name
+        self.base = commands.pwd()
+        self.inputs = [os.path.join(self.base, p) for p in inputs]
+        self.outputs = [os.path.join(self.base, p) for p in outputs]
+        self.env = env
+        self.argv = list(argv)
+        self.cache = cache if cache is not None else StepCache(os.path.join(self.base, ".cish-cache"))
+        self.key = None
+        self.needed = None
+
+
+    def compute_key(self):
+        """
+        Hashes the inputs and returns the key of the step.
+        """
+        files = sorted(_expand(self.inputs))
+        digests = self.cache.digest_files(files)
+        content = json.dumps({
+            "name": self.name,
+            "env": repr(self.env) if self.env is not None else None,
+            "argv": self.argv,
+            "inputs": [[os.path.relpath(f, self.base), digests[f]] for f in files],
+        }, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+    def __enter__(self):
+        self.key = self.compute_key()
+        manifest = self.cache.lookup(self.key)
+        if manifest is not None:
+            for output in self.outputs:
+                if not glob.has_magic(output):
+                    commands.rm(output)
+            self.cache.restore(manifest, self.base)
+            self.needed = False
+        else:
+            self.needed = True
+        return self
+
+
+    def __exit__(self, type_, value, traceback):
+        if type_ is None and self.needed:
+            outputs = sorted(_expand(self.outputs, must_exist=True))
+            self.cache.store(self.key, self.base, outputs)
+        return False
+
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self as s:
+                if s.needed:
+                    return func(*args, **kwargs)
+        return wrapper
+
+
+def step(name, inputs=(), outputs=(), env=None, argv=(), cache=None):
+    """
+    Declares a build step that is skipped if nothing changed.
+    See :class:`Step`.
+    """
+    return Step(name, inputs, outputs, env, argv, cache)
+
+
+def _expand(patterns, must_exist=False):
+    """
+    Expands files, directories and glob patterns to a set of files.
+    """
+    files = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = glob.glob(pattern, recursive=True)
+        elif os.path.exists(pattern):
+            matches = [pattern]
+        elif must_exist:
+            raise ValueError("Declared output {path} does not exist.".format(path=pattern))
+        else:
+            matches = []
+        for match in matches:
+            if os.path.isdir(match):
+                for dirpath, dirnames, filenames in os.walk(match):
+                    files.update(os.path.join(dirpath, f) for f in filenames)
+            else:
+                files.add(match)
+    return files
+
+
+_hash_file = commands._file_digest
+
+
+def _atomic_write_json(path, content):
+    commands.mkdirs(os.path.dirname(path))
+    tmp = path + "." + uuid.uuid4().hex
+    with open(tmp, 'w') as f:
+        json.dump(content, f)
+    os.replace(tmp, path)
@@ -0,0 +1,365 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import re
+import time
+import threading
+import traceback
+import multiprocessing
+import collections
+import queue
+import contextvars
+
+
+class TaskResult(object):
+    """
+    Outcome of a task. `status` is `"ok"`, `"failed"` or `"skipped"`
+    (a dependency failed). `error` holds the traceback of a failed task.
+    """
+
+    def __init__(self, name, status, start=None, duration=0.0, error=None):
+        self.name = name
+        self.status = status
+        self.start = start
+        self.duration = duration
+        self.error = error
+
+
+class GraphReport(object):
+    """
+    Results of running a :class:`TaskGraph`.
+
+    `results` maps task names to :class:`TaskResult` instances,
+    `critical_path` is the chain of dependent tasks with the longest
+    total duration, which limits how fast the graph can run.
+    """
+
+    def __init__(self, results, critical_path, duration):
+        self.results = results
+        self.critical_path = critical_path
+        self.duration = duration
+
+    def _names(self, status):
+        return sorted(name for name, r in self.results.items() if r.status == status)
+
+    @property
+    def passed(self):
+        return self._names("ok")
+
+    @property
+    def failed(self):
+        return self._names("failed")
+
+    @property
+    def skipped(self):
+        return self._names("skipped")
+
+    @property
+    def ok(self):
+        return not self.failed and not self.skipped
+
+    @property
+    def critical_path_duration(self):
+        return sum(self.results[name].duration for name in self.critical_path)
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    def __str__(self):
+        lines = []
+        for name in sorted(self.results, key=lambda n: (self.results[n].start is None,
+                                                        self.results[n].start)):
+            r = self.results[name]
+            lines.append("{status:7} {name} ({duration:.1f}s)".format(
+                status=r.status, name=name, duration=r.duration))
+        lines.append("{passed} passed, {failed} failed, {skipped} skipped in {duration:.1f}s".format(
+            passed=len(self.passed), failed=len(self.failed), skipped=len(self.skipped),
+            duration=self.duration))
+        lines.append("critical path ({duration:.1f}s): {path}".format(
+            duration=self.critical_path_duration, path=" -> ".join(self.critical_path)))
+        return "\n".join(lines)
+
+
+class _Task(object):
+
+    def __init__(self, name, func, deps, env):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.env = env
+
+
+class TaskGraph(object):
+    """
+    Build steps with dependencies, executed with as much parallelism as
+    the dependencies and the job limit allow.
+
+    Example::
+
+        graph = cish.TaskGraph()
+        graph.task("venv", lambda: ...)
+        graph.task("lint", lint, deps=["venv"], env=envs["3.11"])
+        graph.task("docs", build_docs)
+        for name, env in envs.items():
+            graph.task("test-" + name, functools.partial(test, env),
+                       deps=["venv"], env=env)
+        report = graph.run(jobs=4)
+        print(report)
+
+    Tasks run in threads of this process, each starting in the current
+    directory of the caller (see :func:`cish.cd`). If a task fails, the tasks
+    depending on it are skipped; independent tasks still run. Tasks using
+    the same environment never run at the same time, so they can't
+    interfere with each other's installs.
+
+    When running under GNU make with `-j`, the job slots are shared with
+    make through its jobserver.
+    """
+
+    def __init__(self):
+        self.tasks = collections.OrderedDict()
+
+
+    def task(self, name, func=None, deps=(), env=None):
+        """
+        Adds a task. Without `func` it returns a decorator::
+
+            @graph.task("docs", deps=["venv"])
+            def docs():
+                ...
+
+        :param name: Unique name of the task.
+
+        :param func: Callable without arguments.
+
+        :param deps: Names of the tasks that must complete successfully first.
+
+        :param env: Optional :class:`PyEnv` the task uses exclusively.
+        """
+        if func is None:
+            def decorator(func):
+                self.task(name, func, deps, env)
+                return func
+            return decorator
+        if name in self.tasks:
+            raise ValueError("Task {name} already exists.".format(name=repr(name)))
+        self.tasks[name] = _Task(name, func, deps, env)
+        return func
+
+
+    def run(self, jobs=None, jobserver=True):
+        """
+        Executes all tasks.
+
+        :param jobs: Maximal number of tasks running at the same time.
+            Defaults to the number of CPUs, or unlimited if a make
+            jobserver is available.
+
+        :param jobserver: Use the GNU make jobserver if `MAKEFLAGS` announces one.
+
+        :returns: :class:`GraphReport`.
+
+        :raises ValueError: if a dependency is unknown or the
+            dependencies contain a cycle.
+        """
+        self._check()
+        server = _JobServer.from_environ() if jobserver else None
+        if jobs is None:
+            jobs = len(self.tasks) if server is not None else multiprocessing.cpu_count()
+        jobs = max(1, jobs)
+
+        dependents = collections.defaultdict(list)
+        for task in self.tasks.values():
+            for dep in task.deps:
+                dependents[dep].append(task.name)
+
+        results = {}
+        waiting = collections.OrderedDict((name, set(task.deps)) for name, task in self.tasks.items())
+        busy_envs = set()
+        running = {}
+        done = queue.Queue()
+        implicit_slot = [None]
+        origin = time.time()
+
+        def skip(name):
+            for dependent in dependents[name]:
+                if dependent in waiting:
+                    del waiting[dependent]
+                    results[dependent] = TaskResult(dependent, "skipped")
+                    skip(dependent)
+
+        while waiting or running:
+            for name in list(waiting):
+                if len(running) >= jobs:
+                    break
+                task = self.tasks[name]
+                if waiting[name] or (task.env is not None and id(task.env) in busy_envs):
+                    continue
+                del waiting[name]
+                if task.env is not None:
+                    busy_envs.add(id(task.env))
+                use_token = server is not None and implicit_slot[0] is not None
+                if not use_token:
+                    implicit_slot[0] = name
+                running[name] = task
+                # tasks start in the caller's current directory, see `cish.cd`.
+                context = contextvars.copy_context()
+                thread = threading.Thread(target=context.run,
+                                          args=(_execute, task, server if use_token else None, done))
+                thread.daemon = True
+                thread.start()
+
+            result = done.get()
+            results[result.name] = result
+            result.start = result.start - origin if result.start is not None else None
+            task = running.pop(result.name)
+            if task.env is not None:
+                busy_envs.discard(id(task.env))
+            if implicit_slot[0] == result.name:
+                implicit_slot[0] = None
+            if result.status == "ok":
+                for dependent in dependents[result.name]:
+                    if dependent in waiting:
+                        waiting[dependent].discard(result.name)
+            else:
+                skip(result.name)
+
+        return GraphReport(results, self._critical_path(results), time.time() - origin)
+
+
+    def _check(self):
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise ValueError("Task {name} depends on unknown task {dep}.".format(
+                        name=repr(task.name), dep=repr(dep)))
+        visited = {}
+        def visit(name, path):
+            state = visited.get(name)
+            if state == "done":
+                return
+            if state == "active":
+                raise ValueError("Dependency cycle: {cycle}".format(
+                    cycle=" -> ".join(path + [name])))
+            visited[name] = "active"
+            for dep in self.tasks[name].deps:
+                visit(dep, path + [name])
+            visited[name] = "done"
+        for name in self.tasks:
+            visit(name, [])
+
+
+    def _critical_path(self, results):
+        """
+        Returns the chain of tasks with the longest total duration.
+        """
+        longest = {}
+        def visit(name):
+            if name not in longest:
+                best = []
+                for dep in self.tasks[name].deps:
+                    path = visit(dep)
+                    if _duration(path, results) > _duration(best, results):
+                        best = path
+                longest[name] = best + [name]
+            return longest[name]
+        paths = [visit(name) for name in self.tasks]
+        return max(paths, key=lambda p: _duration(p, results)) if paths else []
+
+
+def _duration(path, results):
+    return sum(results[name].duration for name in path)
+
+
+def _execute(task, server, done):
+    """
+    Runs a task in a worker thread, holding a jobserver token if required.
+    """
+    token = server.acquire() if server is not None else None
+    start = time.time()
+    try:
+        task.func()
+        result = TaskResult(task.name, "ok", start, time.time() - start)
+    except BaseException:
+        result = TaskResult(task.name, "failed", start, time.time() - start,
+                            traceback.format_exc())
+    finally:
+        if token is not None:
+            server.release(token)
+    done.put(result)
+
+
+class _JobServer(object):
+    """
+    Client of the GNU make jobserver. Each job beyond the first one needs
+    a token that is read from the jobserver pipe and written back after
+    the job is done.
+    """
+
+    def __init__(self, read_fd, write_fd):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """
+        Connects to the jobserver announced in `MAKEFLAGS`, if any.
+        """
+        if environ is None:
+            environ = os.environ
+        flags = environ.get("MAKEFLAGS", "")
+        match = re.search(r"--jobserver-(?:auth|fds)=(\S+)", flags)
+        if not match:
+            return None
+        auth = match.group(1)
+        try:
+            if auth.startswith("fifo:"):
+                fd = os.open(auth[len("fifo:"):], os.O_RDWR)
+                return cls(fd, fd)
+            read_fd, write_fd = [int(fd) for fd in auth.split(",")]
+            os.fstat(read_fd)
+            os.fstat(write_fd)
+            return cls(read_fd, write_fd)
+        except (ValueError, OSError):
+            # make did not pass the file descriptors to us (no `+` in the rule).
+            return None
+
+    def acquire(self):
+        while True:
+            try:
+                token = os.read(self.read_fd, 1)
+            except InterruptedError:
+                continue
+            # an empty read means make closed the pipe, continue without a token.
+            return token or None
+
+    def release(self, token):
+        os.write(self.write_fd, token)
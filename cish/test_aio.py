@@ -0,0 +1,122 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import asyncio
+import os.path
+import shutil
+import tempfile
+import time
+
+from cish import pyenv
+
+
+class TestAio(unittest.TestCase):
+    """
+    Unit-tests for :class:`aio.AsyncInvokers`.
+    """
+
+    def setUp(self):
+        self.env = pyenv.interpeter_pyenv()
+
+    def test_output(self):
+        """
+        Exit code and output are returned.
+        """
+        result = asyncio.run(self.env.aio.python("-c", "print('hello')"))
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.output.strip(), "hello")
+
+    def test_exit_code(self):
+        """
+        Non-zero exit codes are returned, not raised.
+        """
+        result = asyncio.run(self.env.aio.python("-c", "import sys; sys.exit(4)"))
+        self.assertEqual(result.returncode, 4)
+
+    def test_overlap(self):
+        """
+        Invocations run concurrently.
+        """
+        async def main():
+            sleep = "import time; time.sleep(0.5)"
+            return await asyncio.gather(self.env.aio.python("-c", sleep),
+                                        self.env.aio.python("-c", sleep),
+                                        self.env.aio.python("-c", sleep))
+        start = time.time()
+        results = asyncio.run(main())
+        self.assertEqual([r.returncode for r in results], [0, 0, 0])
+        self.assertTrue(time.time() - start < 1.5)
+
+    def test_timeout(self):
+        """
+        The process is killed when the timeout expires.
+        """
+        start = time.time()
+        self.assertRaises(asyncio.TimeoutError, asyncio.run,
+                          self.env.aio.python("-c", "import time; time.sleep(30)", timeout=0.5))
+        self.assertTrue(time.time() - start < 10)
+
+    def test_cancel(self):
+        """
+        Cancelling the coroutine kills the process.
+        """
+        async def main():
+            task = asyncio.ensure_future(
+                self.env.aio.python("-c", "import time; time.sleep(30)"))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            await task
+        start = time.time()
+        self.assertRaises(asyncio.CancelledError, asyncio.run, main())
+        self.assertTrue(time.time() - start < 10)
+
+    @unittest.skipUnless(os.name == "posix", "process groups are POSIX only")
+    def test_timeout_kills_group(self):
+        """
+        Processes left behind by a command that already exited are killed.
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            marker = os.path.join(tmpdir, "marker")
+            grandchild = "import time; time.sleep(2); open({0!r}, 'w').close()".format(marker)
+            child = "import subprocess, sys; subprocess.Popen([sys.executable, '-c', {0!r}])".format(grandchild)
+            self.assertRaises(asyncio.TimeoutError, asyncio.run,
+                              self.env.aio.python("-c", child, timeout=0.5))
+            time.sleep(3)
+            self.assertFalse(os.path.exists(marker))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_unknown_executable(self):
+        """
+        Executables are resolved like `find_executable` does.
+        """
+        self.assertRaises(ValueError, getattr, self.env.aio, "doesnotexist")
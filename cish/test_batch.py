@@ -0,0 +1,155 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+import json
+
+from cish import pyenv
+from cish import batch
+from cish import commands
+
+
+_FAKE_PIP = """#!{python}
+import os, sys, json
+with open({log!r}, "a") as f:
+    f.write(json.dumps(sys.argv[1:]) + "\\n")
+with open({log!r} + ".cwd", "a") as f:
+    f.write(os.getcwd() + "\\n")
+sys.exit(1 if "broken" in sys.argv else 0)
+"""
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Unit-tests for :meth:`pyenv.PyEnv.batch`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpdir, "log")
+        pip = os.path.join(self.tmpdir, "pip")
+        with open(pip, "w") as f:
+            f.write(_FAKE_PIP.format(python=sys.executable, log=self.log))
+        os.chmod(pip, 0o755)
+        self.env = pyenv.PyEnv([self.tmpdir])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def invocations(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            return [json.loads(line) for line in f]
+
+    def test_coalesce(self):
+        """
+        Installs with the same options are merged.
+        """
+        with self.env.batch():
+            self.env.pip("install", "a")
+            self.env.pip("install", "b", "-r", "req.txt")
+            self.env.pip("install", "a", "-e", ".")
+            self.assertEqual([], self.invocations())
+        self.assertEqual([["install", "a", "b", "-r", "req.txt", "-e", "."]],
+                         self.invocations())
+
+    def test_options_split(self):
+        """
+        Installs with different options are not merged.
+        """
+        with self.env.batch():
+            self.env.pip("install", "a")
+            self.env.pip("install", "--upgrade", "b")
+            self.env.pip("install", "-i", "http://x", "c")
+            self.env.pip("install", "d")
+        self.assertEqual([["install", "a", "d"],
+                          ["install", "--upgrade", "b"],
+                          ["install", "-i", "http://x", "c"]],
+                         self.invocations())
+
+    def test_working_directory(self):
+        """
+        Installs run in the directory they were requested in.
+        """
+        for name in ("a", "b"):
+            os.mkdir(os.path.join(self.tmpdir, name))
+        with self.env.batch():
+            with commands.cd(os.path.join(self.tmpdir, "a")):
+                self.env.pip("install", "-r", "req.txt")
+            with commands.cd(os.path.join(self.tmpdir, "b")):
+                self.env.pip("install", "-r", "req.txt")
+        self.assertEqual([["install", "-r", "req.txt"], ["install", "-r", "req.txt"]],
+                         self.invocations())
+        with open(self.log + ".cwd") as f:
+            cwds = f.read().splitlines()
+        self.assertEqual([os.path.realpath(os.path.join(self.tmpdir, name)) for name in ("a", "b")],
+                         [os.path.realpath(cwd) for cwd in cwds])
+
+    def test_flush_on_other_command(self):
+        """
+        Other commands see the installed packages.
+        """
+        with self.env.batch():
+            self.env.pip("install", "a")
+            self.env.pip("freeze")
+            self.env.pip("install", "b")
+        self.assertEqual([["install", "a"], ["freeze"], ["install", "b"]],
+                         self.invocations())
+
+    def test_error_call_site(self):
+        """
+        Failures name the requesting lines.
+        """
+        with self.assertRaises(batch.BatchError) as cm:
+            with self.env.batch():
+                self.env.pip("install", "a")
+                self.env.pip("install", "broken")
+        sites = cm.exception.call_sites
+        self.assertEqual(2, len(sites))
+        self.assertEqual("test_batch.py", os.path.basename(sites[0][0]))
+        self.assertEqual("test_error_call_site", sites[1][2])
+        self.assertIn("test_batch.py", str(cm.exception))
+
+    def test_exception_discards(self):
+        """
+        Requests are dropped if the block raises.
+        """
+        with self.assertRaises(ValueError):
+            with self.env.batch():
+                self.env.pip("install", "a")
+                raise ValueError()
+        self.assertEqual([], self.invocations())
+        self.env.pip("install", "b")
+        self.assertEqual([["install", "b"]], self.invocations())
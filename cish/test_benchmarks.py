@@ -0,0 +1,79 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+
+from cish import benchmarks
+
+
+def results(**medians):
+    return {"results": {name: {"median": median, "stdev": stdev}
+                        for name, (median, stdev) in medians.items()}}
+
+
+class TestBenchmarks(unittest.TestCase):
+    """
+    Unit-tests for :mod:`benchmarks`.
+    """
+
+    def status(self, current, baseline):
+        comparisons = benchmarks.compare(current, baseline, threshold=0.1)
+        return {c.name: c.status for c in comparisons}
+
+    def test_regressed(self):
+        status = self.status(results(a=(2.0, 0.01)), results(a=(1.0, 0.01)))
+        self.assertEqual({"a": "regressed"}, status)
+
+    def test_improved(self):
+        status = self.status(results(a=(0.5, 0.01)), results(a=(1.0, 0.01)))
+        self.assertEqual({"a": "improved"}, status)
+
+    def test_below_threshold(self):
+        status = self.status(results(a=(1.05, 0.001)), results(a=(1.0, 0.001)))
+        self.assertEqual({"a": "unchanged"}, status)
+
+    def test_noisy(self):
+        """
+        Changes within the noise are not regressions.
+        """
+        status = self.status(results(a=(1.5, 0.2)), results(a=(1.0, 0.2)))
+        self.assertEqual({"a": "unchanged"}, status)
+
+    def test_new(self):
+        status = self.status(results(a=(1.0, 0.0)), results())
+        self.assertEqual({"a": "new"}, status)
+
+    def test_run(self):
+        report = benchmarks.run(["mkdirs", "rm"], repeat=2, files=200)
+        self.assertEqual(["mkdirs", "rm"], list(report["results"]))
+        self.assertEqual(2, len(report["results"]["rm"]["samples"]))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, benchmarks.run, ["nope"])
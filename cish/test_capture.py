@@ -0,0 +1,160 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import shutil
+import tempfile
+import re
+import io
+import gc
+import time
+import subprocess
+
+from cish import pyenv
+from cish import capture
+
+
+class TestCapture(unittest.TestCase):
+    """
+    Unit-tests for :mod:`capture`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.env = pyenv.interpeter_pyenv()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lines(self):
+        """
+        Captured output can be iterated line by line.
+        """
+        with self.env.python("-c", "print('a'); print('b')", capture=True) as out:
+            self.assertEqual(list(out.lines()), ["a", "b"])
+            self.assertEqual(out.returncode, 0)
+            self.assertFalse(out.spilled)
+
+    def test_stderr(self):
+        """
+        Stderr is captured as well.
+        """
+        with self.env.python("-c", "import sys; sys.stderr.write('err')", capture=True) as out:
+            self.assertEqual(out.read(), b"err")
+
+    def test_spill(self):
+        """
+        Large outputs are moved to a temporary file.
+        """
+        code = "for i in range(100000): print('line %d' % i)"
+        with self.env.python("-c", code, capture=True, spill_threshold=1024) as out:
+            self.assertTrue(out.spilled)
+            self.assertEqual(sum(1 for _ in out.lines()), 100000)
+            self.assertEqual(out.search(r"line (99\d*)").group(1), b"99")
+            self.assertEqual(out.search(r"line (9999\d)$", re.M).group(1), b"99990")
+            self.assertIsNone(out.search("nothere"))
+
+    def test_close(self):
+        """
+        Closing removes the temporary file.
+        """
+        code = "print('x' * 10000)"
+        out = self.env.python("-c", code, capture=True, spill_threshold=10)
+        spillfile = out._spillfile
+        self.assertTrue(os.path.exists(spillfile))
+        out.close()
+        self.assertFalse(os.path.exists(spillfile))
+
+    def test_garbage_collected(self):
+        """
+        The temporary file is removed if the output is not closed.
+        """
+        code = "print('x' * 10000)"
+        out = self.env.python("-c", code, capture=True, spill_threshold=10)
+        spillfile = out._spillfile
+        self.assertTrue(os.path.exists(spillfile))
+        del out
+        gc.collect()
+        self.assertFalse(os.path.exists(spillfile))
+
+    def test_tee(self):
+        """
+        Output is written to the log file as well.
+        """
+        log = os.path.join(self.tmpdir, "log.txt")
+        with self.env.python("-c", "print('hello')", tee=log) as out:
+            self.assertEqual(out.read().strip(), b"hello")
+        with open(log, 'rb') as f:
+            self.assertEqual(f.read().strip(), b"hello")
+
+    def test_tee_file_object(self):
+        """
+        Output can be written to an open file object, which stays open.
+        """
+        log = io.BytesIO()
+        with self.env.python("-c", "print('hello')", tee=log) as out:
+            self.assertEqual(out.read().strip(), b"hello")
+        self.assertEqual(log.getvalue().strip(), b"hello")
+
+    @unittest.skipUnless(os.name == "posix", "checks for the process with signal 0")
+    def test_interrupted_kills(self):
+        """
+        The command is killed if reading its output fails.
+        """
+        class Interrupting(object):
+            def write(self, data):
+                self.pid = int(data.split()[0])
+                raise KeyboardInterrupt()
+        log = Interrupting()
+        code = "import os, time; print(os.getpid(), flush=True); time.sleep(30)"
+        start = time.time()
+        self.assertRaises(KeyboardInterrupt, self.env.python, "-c", code, tee=log)
+        self.assertLess(time.time() - start, 20)
+        self.assertRaises(OSError, os.kill, log.pid, 0)
+
+    def test_check(self):
+        """
+        Failing commands raise, the output is attached to the exception.
+        """
+        try:
+            self.env.python("-c", "print('oops'); raise SystemExit(2)", capture=True)
+            self.fail("expected CalledProcessError")
+        except subprocess.CalledProcessError as e:
+            self.assertEqual(e.returncode, 2)
+            self.assertEqual(list(e.output.lines()), ["oops"])
+
+    def test_no_check(self):
+        """
+        Failures can be inspected without exceptions.
+        """
+        out = self.env.python("-c", "raise SystemExit(3)", capture=True, check=False)
+        self.assertEqual(out.returncode, 3)
+        self.assertEqual(self.env.python("-c", "raise SystemExit(3)", check=False), 3)
@@ -31,8 +31,10 @@ import unittest
 import os.path
 import shutil
 import tempfile
+import threading
 
 from cish import commands
+from cish import pyenv
 
 class TestCommands(unittest.TestCase):
 
@@ -42,6 +44,8 @@ class TestCommands(unittest.TestCase):
 
     def tearDown(self):
         os.chdir(self.cwd)
+        commands._cwd.set(None)
+        commands.rm_wait()
         shutil.rmtree(self.tmpdir)
 
     def test_mkdirs(self):
@@ -105,6 +109,108 @@ class TestCommands(unittest.TestCase):
         commands.rm(self.get_path("mydir"))
         self.assertFalse(os.path.exists(self.get_path("mydir")))
 
+    def test_rm_defer(self):
+        """
+        Test that a deferred deletion frees the path immediately.
+        """
+        self.create_files(["mydir/myfile",
+                           "mydir/subdir/anotherfile",
+                           "mydir/subdir/subsubdir/afile",
+                           "mydir/otherdir/afile"])
+        commands.rm(self.get_path("mydir"), defer=True)
+        self.assertFalse(os.path.exists(self.get_path("mydir")))
+        commands.rm_wait()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_rm_defer_reuse(self):
+        """
+        Test that the path can be reused while the deletion is in progress.
+        """
+        self.create_files(["mydir/myfile"])
+        commands.rm(self.get_path("mydir"), defer=True)
+        self.create_files(["mydir/newfile"])
+        commands.rm_wait()
+        self.assertEqual(os.listdir(self.get_path("mydir")), ["newfile"])
+
+    def test_rm_defer_file(self):
+        """
+        Test that files are deleted right away.
+        """
+        self.create_files(["myfile"])
+        commands.rm(self.get_path("myfile"), defer=True)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_rm_defer_large(self):
+        """
+        Test deferred deletion of a wider and deeper tree.
+        """
+        self.create_files(["mydir/{0}/{1}/file{2}".format(i, j, k)
+                           for i in range(10) for j in range(5) for k in range(5)])
+        commands.rm(self.get_path("mydir"), defer=True)
+        commands.rm_wait()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_mkdirs_many(self):
+        """
+        Test creating a tree of directories at once.
+        """
+        self.create_files(["existing/file"])
+        paths = [self.get_path("a/{0}/{1}".format(i, j)) for i in range(20) for j in range(10)]
+        paths += [self.get_path("existing"), self.get_path("a/0"), self.get_path("b")]
+        commands.mkdirs_many(paths)
+        for path in paths:
+            self.assertTrue(os.path.isdir(path))
+        self.assertTrue(os.path.exists(self.get_path("existing/file")))
+        commands.mkdirs_many(paths)
+
+    def test_mkdirs_many_relative(self):
+        """
+        Test that relative paths are resolved against the current directory.
+        """
+        with commands.cd(self.tmpdir):
+            commands.mkdirs_many(["x/y", "x/z"])
+        self.assertEqual(sorted(os.listdir(self.get_path("x"))), ["y", "z"])
+
+    def test_many_generator(self):
+        """
+        Test that mkdirs_many and rm_many accept generators.
+        """
+        commands.mkdirs_many(self.get_path("g/{0}".format(i)) for i in range(10))
+        self.assertEqual(len(os.listdir(self.get_path("g"))), 10)
+        commands.rm_many(self.get_path("g/{0}".format(i)) for i in range(10))
+        self.assertEqual(os.listdir(self.get_path("g")), [])
+
+    def test_mkdirs_many_file(self):
+        """
+        Tests that mkdirs_many fails if a path is an existing file.
+        """
+        self.create_files(["d/myfile"])
+        paths = [self.get_path("d/{0}".format(i)) for i in range(20)] + [self.get_path("d/myfile")]
+        self.assertRaises(ValueError, commands.mkdirs_many, paths)
+        self.assertRaises(ValueError, commands.mkdirs_many, [self.get_path("d/myfile")])
+
+    def test_rm_many(self):
+        """
+        Test deleting files and trees at once, including nested and missing paths.
+        """
+        self.create_files(["a/{0}/{1}/file".format(i, j) for i in range(10) for j in range(5)] +
+                          ["keep/file", "single"])
+        paths = [self.get_path("a/{0}".format(i)) for i in range(10)]
+        paths += [self.get_path("a/3/2/file"), self.get_path("missing"), self.get_path("single")]
+        commands.rm_many(paths)
+        self.assertEqual(os.listdir(self.get_path("a")), [])
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["a", "keep"])
+
+    def test_rm_many_symlink(self):
+        """
+        Tests that rm_many deletes links to directories, not their target.
+        """
+        self.create_files(["target/file"])
+        os.symlink(self.get_path("target"), self.get_path("link"))
+        commands.rm_many([self.get_path("link")])
+        self.assertEqual(os.listdir(self.tmpdir), ["target"])
+        self.assertEqual(os.listdir(self.get_path("target")), ["file"])
+
     def test_pwd(self):
         """
         Tests pwd.
@@ -119,7 +225,7 @@ class TestCommands(unittest.TestCase):
         self.create_files(["mydir/myfile",
                            "mydir/subdir/anotherfile"])
         commands.cd(self.get_path("mydir/subdir"))
-        self.assertTrue(os.getcwd(), self.get_path("mydir/subdir"))
+        self.assertSamePath(commands.pwd(), self.get_path("mydir/subdir"))
 
     def test_cd_relative(self):
         """
@@ -129,7 +235,7 @@ class TestCommands(unittest.TestCase):
                            "mydir/subdir/anotherfile"])
         os.chdir(self.get_path("mydir"))
         commands.cd("subdir")
-        self.assertTrue(os.getcwd(), self.get_path("mydir/subdir"))
+        self.assertSamePath(commands.pwd(), self.get_path("mydir/subdir"))
 
     def test_cd_with(self):
         """
@@ -140,9 +246,9 @@ class TestCommands(unittest.TestCase):
         os.chdir(self.get_path("mydir"))
  
         with commands.cd("subdir") as path:
-            self.assertTrue(os.getcwd(), self.get_path("mydir/subdir"))
-            self.assertTrue(path, self.get_path("mydir/subdir")) 
-        self.assertTrue(os.getcwd(), self.get_path("mydir"))
+            self.assertSamePath(commands.pwd(), self.get_path("mydir/subdir"))
+            self.assertSamePath(path, self.get_path("mydir/subdir")) 
+        self.assertSamePath(commands.pwd(), self.get_path("mydir"))
 
     def test_cd_with_recursive(self):
         """
@@ -155,9 +261,196 @@ class TestCommands(unittest.TestCase):
 
         with commands.cd("subdir"):
             with commands.cd("subsubdir"): 
-                self.assertTrue(os.getcwd(), self.get_path("mydir/subdir/subsubdir"))
-            self.assertTrue(os.getcwd(), self.get_path("mydir/subdir"))
-        self.assertTrue(os.getcwd(), self.get_path("mydir"))
+                self.assertSamePath(commands.pwd(), self.get_path("mydir/subdir/subsubdir"))
+            self.assertSamePath(commands.pwd(), self.get_path("mydir/subdir"))
+        self.assertSamePath(commands.pwd(), self.get_path("mydir"))
+
+    def test_cd_process_unchanged(self):
+        """
+        Test that cd does not change the working directory of the process.
+        """
+        self.create_files(["mydir/myfile"])
+        with commands.cd(self.get_path("mydir")):
+            self.assertEqual(os.getcwd(), self.cwd)
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_cd_nonexistant(self):
+        """
+        Test that cd fails if the directory does not exist.
+        """
+        self.assertRaises(OSError, commands.cd, self.get_path("nothere"))
+        self.create_files(["myfile"])
+        self.assertRaises(OSError, commands.cd, self.get_path("myfile"))
+
+    def test_cd_threads(self):
+        """
+        Test that threads have their own current directory.
+        """
+        self.create_files(["dir0/myfile",
+                           "dir1/myfile"])
+        barrier = threading.Barrier(2)
+        seen = {}
+
+        def work(i):
+            with commands.cd(self.get_path("dir{0}".format(i))):
+                barrier.wait()
+                commands.mkdirs("created")
+                seen[i] = commands.pwd()
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(2):
+            self.assertSamePath(seen[i], self.get_path("dir{0}".format(i)))
+            self.assertTrue(os.path.isdir(self.get_path("dir{0}/created".format(i))))
+
+    def test_relative_paths(self):
+        """
+        Test that relative paths are resolved against the current directory.
+        """
+        self.create_files(["mydir/myfile"])
+        with commands.cd(self.get_path("mydir")):
+            commands.mkdirs("sub/subsub")
+            commands.rm("myfile")
+        self.assertTrue(os.path.isdir(self.get_path("mydir/sub/subsub")))
+        self.assertFalse(os.path.exists(self.get_path("mydir/myfile")))
+
+    def test_invoker_cwd(self):
+        """
+        Test that commands run in the current directory.
+        """
+        self.create_files(["mydir/myfile"])
+        env = pyenv.interpeter_pyenv()
+        with commands.cd(self.get_path("mydir")):
+            with env.python("-c", "import os; print(os.getcwd())", capture=True) as out:
+                self.assertSamePath(out.read().decode().strip(), self.get_path("mydir"))
+
+    def test_sync(self):
+        """
+        Test that sync copies a directory tree.
+        """
+        self.create_files(["src/a",
+                           "src/sub/b",
+                           "src/sub/subsub/c"])
+        copied = commands.sync(self.get_path("src"), self.get_path("dst"))
+        self.assertEqual(sorted(copied), ["a",
+                                          os.path.join("sub", "b"),
+                                          os.path.join("sub", "subsub", "c")])
+        self.assertSameTree("src", "dst")
+
+    def test_sync_incremental(self):
+        """
+        Test that sync only copies changed files.
+        """
+        self.create_files(["src/a",
+                           "src/sub/b"])
+        commands.sync(self.get_path("src"), self.get_path("dst"))
+        self.assertEqual(commands.sync(self.get_path("src"), self.get_path("dst")), [])
+
+        with open(self.get_path("src/sub/b"), 'w') as f:
+            f.write("changed content")
+        self.assertEqual(commands.sync(self.get_path("src"), self.get_path("dst")),
+                         [os.path.join("sub", "b")])
+        self.assertSameTree("src", "dst")
+
+    def test_sync_checksum(self):
+        """
+        Test that checksum mode ignores the modification time.
+        """
+        self.create_files(["src/a"])
+        commands.sync(self.get_path("src"), self.get_path("dst"))
+        os.utime(self.get_path("src/a"), (0, 0))
+        self.assertEqual(commands.sync(self.get_path("src"), self.get_path("dst"), checksum=True), [])
+        self.assertEqual(commands.sync(self.get_path("src"), self.get_path("dst")), ["a"])
+
+    def test_sync_delete(self):
+        """
+        Test that extraneous files are deleted unless disabled.
+        """
+        self.create_files(["src/a",
+                           "dst/extra",
+                           "dst/extradir/file",
+                           "dst/a/nowafile"])
+        commands.sync(self.get_path("src"), self.get_path("dst"), delete=False)
+        self.assertTrue(os.path.exists(self.get_path("dst/extra")))
+        commands.sync(self.get_path("src"), self.get_path("dst"))
+        self.assertSameTree("src", "dst")
+
+    def test_sync_hardlink(self):
+        """
+        Test that hard links are used if requested.
+        """
+        self.create_files(["src/a"])
+        commands.sync(self.get_path("src"), self.get_path("dst"), hardlink=True)
+        self.assertSameTree("src", "dst")
+
+    def test_sync_symlink(self):
+        """
+        Test that symbolic links are copied as links.
+        """
+        if not hasattr(os, "symlink"):
+            return
+        self.create_files(["src/a"])
+        os.symlink("a", self.get_path("src/link"))
+        commands.sync(self.get_path("src"), self.get_path("dst"))
+        self.assertEqual(os.readlink(self.get_path("dst/link")), "a")
+
+    def test_sync_replaces_symlink_to_directory(self):
+        """
+        Test that a link to a directory in the destination is replaced
+        without touching the directory it points to.
+        """
+        if not hasattr(os, "symlink"):
+            return
+        self.create_files(["src/a/b",
+                           "src/c",
+                           "outside/keep"])
+        os.mkdir(self.get_path("dst"))
+        os.symlink(self.get_path("outside"), self.get_path("dst/a"))
+        os.symlink(self.get_path("outside"), self.get_path("dst/c"))
+        os.symlink(self.get_path("outside"), self.get_path("dst/extra"))
+        commands.sync(self.get_path("src"), self.get_path("dst"))
+        self.assertSameTree("src", "dst")
+        self.assertTrue(os.path.exists(self.get_path("outside/keep")))
+
+    def test_sync_into_source(self):
+        """
+        Test that a destination inside the source is not copied into itself.
+        """
+        self.create_files(["src/a"])
+        commands.sync(self.get_path("src"), self.get_path("src/backup"))
+        commands.sync(self.get_path("src"), self.get_path("src/backup"))
+        self.assertEqual(sorted(os.listdir(self.get_path("src/backup"))), ["a"])
+
+    def test_sync_file(self):
+        """
+        Test that single files can be synced.
+        """
+        self.create_files(["a"])
+        self.assertEqual(commands.sync(self.get_path("a"), self.get_path("x/b")), ["b"])
+        with open(self.get_path("x/b")) as f:
+            self.assertEqual(f.read(), "a")
+
+    def assertSameTree(self, a, b):
+        """
+        Asserts that two directories in the temporary directory have the same content.
+        """
+        def tree(path):
+            result = {}
+            root = self.get_path(path)
+            for dirpath, dirnames, filenames in os.walk(root):
+                for name in filenames:
+                    with open(os.path.join(dirpath, name)) as f:
+                        result[os.path.relpath(os.path.join(dirpath, name), root)] = f.read()
+                for name in dirnames:
+                    result[os.path.relpath(os.path.join(dirpath, name), root)] = None
+            return result
+        self.assertEqual(tree(a), tree(b))
+
+    def assertSamePath(self, actual, expected):
+        self.assertEqual(os.path.realpath(actual), os.path.realpath(expected))
 
     def get_path(self, path):
         """
@@ -0,0 +1,121 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+import time
+import platform
+
+from cish import probe
+from cish import discovery
+
+
+class TestDiscovery(unittest.TestCase):
+    """
+    Unit-tests for :func:`discovery.discover`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.bin = os.path.join(self.tmpdir, "bin")
+        os.mkdir(self.bin)
+        self.log = os.path.join(self.tmpdir, "log")
+        self.cache = probe.ProbeCache(os.path.join(self.tmpdir, "cache.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def script(self, name, body):
+        path = os.path.join(self.bin, name)
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\necho {name} >> {log}\n{body}\n".format(name=name, log=self.log, body=body))
+        os.chmod(path, 0o755)
+        return path
+
+    def probes(self):
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as f:
+            return len(f.readlines())
+
+    def discover(self):
+        return discovery.discover([self.bin, os.path.join(self.tmpdir, "missing")],
+                                  timeout=2, cache=self.cache)
+
+    def minor(self):
+        return "py{0}.{1}".format(*sys.version_info[:2])
+
+    @unittest.skipIf(os.name == "nt", "uses shell scripts")
+    def test_discover(self):
+        python = self.script("python", 'exec {0} "$@"'.format(sys.executable))
+        self.script("python2", "exit 1")
+        self.script("pythonw-not-matching", "exit 1")
+        envs = self.discover()
+        self.assertEqual(python, envs.interpreters[self.minor()])
+        self.assertEqual(python, envs.interpreters["py" + platform.python_version()])
+        self.assertEqual(2, len(envs))
+        self.assertEqual(2, self.probes())
+        self.assertTrue(envs[self.minor()].find_executable("python"))
+
+    @unittest.skipIf(os.name == "nt", "uses shell scripts")
+    def test_cached(self):
+        """
+        A second run does not start any interpreter, not even broken ones.
+        """
+        self.script("python3", 'exec {0} "$@"'.format(sys.executable))
+        self.script("python2", "exit 1")
+        self.discover()
+        self.assertEqual(2, self.probes())
+        envs = self.discover()
+        self.assertEqual(2, self.probes())
+        self.assertIn(self.minor(), envs)
+
+    @unittest.skipIf(os.name == "nt", "uses shell scripts")
+    def test_timeout(self):
+        """
+        Interpreters that don't answer in time are skipped, but probed
+        again on the next run.
+        """
+        python = self.script("python3", "sleep 30")
+        start = time.time()
+        self.assertEqual(0, len(self.discover()))
+        self.assertLess(time.time() - start, 20)
+        self.assertIsNone(self.cache.get(python, "probe_failed"))
+
+    def test_links(self):
+        """
+        Links to the same interpreter are probed once.
+        """
+        os.symlink(sys.executable, os.path.join(self.bin, "python"))
+        os.symlink(sys.executable, os.path.join(self.bin, "python3"))
+        self.assertEqual(1, len(discovery._candidates([self.bin])))
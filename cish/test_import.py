@@ -0,0 +1,102 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import sys
+import subprocess
+
+
+#: Upper limit for `import cish` in microseconds, including the modules it
+#: imports. The import itself only defines a few names and takes well
+#: below a millisecond, the rest is loaded on first access. Eagerly
+#: importing `subprocess` (about 20 ms) or `json` (about 2.5 ms) again
+#: would exceed the limit.
+IMPORT_BUDGET_US = 2000
+
+#: Modules of cish loaded by `import cish`.
+EAGER_MODULES = ["cish"]
+
+#: Modules a script that only uses `cish.rm` and `cish.cd` must not load.
+HEAVY_MODULES = ["subprocess", "json", "shutil", "asyncio", "multiprocessing",
+                 "concurrent.futures", "uuid", "cish.pyenv", "cish.capture"]
+
+
+class TestImport(unittest.TestCase):
+    """
+    Guards the cost of `import cish`.
+    """
+
+    def python(self, *args):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run([sys.executable] + list(args), cwd=root, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+
+    def test_import_time(self):
+        """
+        `import cish` stays within the budget (best of five runs).
+        """
+        times = []
+        for _ in range(5):
+            result = self.python("-X", "importtime", "-c", "import cish")
+            for line in result.stderr.splitlines():
+                fields = [field.strip() for field in line.split("|")]
+                if len(fields) == 3 and fields[2] == "cish":
+                    times.append(int(fields[1]))
+        self.assertEqual(5, len(times))
+        self.assertLess(min(times), IMPORT_BUDGET_US)
+
+    def test_import_modules(self):
+        """
+        `import cish` loads no other module of cish.
+        """
+        code = "import sys, cish; print(repr(sorted(m for m in sys.modules if m.split('.')[0] == 'cish')))"
+        result = self.python("-c", code)
+        self.assertEqual(repr(EAGER_MODULES), result.stdout.strip())
+
+    def test_no_heavy_imports(self):
+        """
+        Using the file system helpers does not load the rest of cish.
+        """
+        code = ("import sys, cish; cish.rm; cish.cd; cish.mkdirs; "
+                "print(repr(sorted(m for m in {0!r} if m in sys.modules)))").format(HEAVY_MODULES)
+        result = self.python("-c", code)
+        self.assertEqual("[]", result.stdout.strip())
+
+    def test_lazy_names(self):
+        """
+        All exported names resolve, and `default` is created only once.
+        """
+        code = ("import cish; names = [n for n in dir(cish) if not n.startswith('_')]; "
+                "[getattr(cish, n) for n in names]; "
+                "print(cish.default is cish.default and 'trace' in names)")
+        result = self.python("-c", code)
+        self.assertEqual("True", result.stdout.strip())
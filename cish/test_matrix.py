@@ -0,0 +1,181 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import shutil
+import tempfile
+import time
+
+from cish import pyenv
+from cish import matrix
+from cish import commands
+
+
+def _write_cwd(env):
+    with open("cwd.txt", 'w') as f:
+        f.write(os.getcwd())
+    print("hello from {exe}".format(exe=env.find_executable("python")))
+
+
+def _fail(env):
+    raise ValueError("task failed")
+
+
+def _rm_deferred(env):
+    for i in range(20):
+        os.makedirs(os.path.join("tree", str(i)))
+        for j in range(20):
+            open(os.path.join("tree", str(i), str(j)), 'w').close()
+    commands.rm("tree", defer=True)
+
+
+def _sleep(env):
+    with open("pid", 'w') as f:
+        f.write(str(os.getpid()))
+    time.sleep(30)
+
+
+class TestMatrix(unittest.TestCase):
+    """
+    Unit-tests for :func:`matrix.run_matrix`.
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        env = pyenv.interpeter_pyenv()
+        self.envs = {"a": env, "b": env, "c": env}
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def test_callable(self):
+        """
+        Each run gets its own working directory and log.
+        """
+        report = matrix.run_matrix(_write_cwd, self.envs, workdir=self.get_path("m"))
+        self.assertTrue(report.ok)
+        self.assertEqual(report.passed, ["a", "b", "c"])
+        for name in self.envs:
+            with open(self.get_path("m/{0}/cwd.txt".format(name))) as f:
+                self.assertEqual(os.path.realpath(f.read()),
+                                 os.path.realpath(self.get_path("m/" + name)))
+            self.assertIn("hello from", report[name].output)
+
+    def test_callable_fails(self):
+        """
+        Exceptions fail the run and end up in the log.
+        """
+        report = matrix.run_matrix(_fail, self.envs, workdir=self.get_path("m"))
+        self.assertFalse(report.ok)
+        self.assertEqual(report.failed, ["a", "b", "c"])
+        self.assertIn("task failed", report["a"].output)
+
+    def test_deferred_rm(self):
+        """
+        Deferred deletions of a run are completed before it ends, even if
+        the parent had deferred deletions running when it forked.
+        """
+        os.makedirs(self.get_path("parent/sub"))
+        commands.rm(self.get_path("parent"), defer=True)
+        report = matrix.run_matrix(_rm_deferred, self.envs, workdir=self.get_path("m"))
+        commands.rm_wait()
+        self.assertTrue(report.ok, report)
+        for name in self.envs:
+            self.assertEqual([], os.listdir(self.get_path("m/" + name)))
+
+    def test_invalid_name(self):
+        """
+        Names that are not plain directory names are rejected.
+        """
+        env = self.envs["a"]
+        for name in ["..", "a/b", os.path.join("..", "x")]:
+            self.assertRaises(ValueError, matrix.run_matrix, _write_cwd, {name: env},
+                              workdir=self.get_path("m"))
+        self.assertFalse(os.path.exists(self.get_path("m")))
+
+    def test_interrupted(self):
+        """
+        Runs are terminated and reaped if waiting for them is interrupted.
+        """
+        pidfiles = [self.get_path("m/{0}/pid".format(name)) for name in self.envs]
+        def interrupt(sentinels):
+            while not all(os.path.exists(path) and os.path.getsize(path) for path in pidfiles):
+                time.sleep(0.05)
+            raise KeyboardInterrupt()
+        wait = matrix.multiprocessing.connection.wait
+        matrix.multiprocessing.connection.wait = interrupt
+        try:
+            start = time.time()
+            self.assertRaises(KeyboardInterrupt, matrix.run_matrix, _sleep, self.envs,
+                              max_workers=len(self.envs), workdir=self.get_path("m"))
+            self.assertLess(time.time() - start, 20)
+        finally:
+            matrix.multiprocessing.connection.wait = wait
+        for path in pidfiles:
+            with open(path) as f:
+                self.assertRaises(ProcessLookupError, os.kill, int(f.read()), 0)
+
+    def test_script(self):
+        """
+        Scripts are executed with the interpreter of the environment.
+        """
+        script = self.get_path("script.py")
+        with open(script, 'w') as f:
+            f.write("import sys\nprint('out')\nsys.exit(3)\n")
+        report = matrix.run_matrix(script, self.envs, max_workers=2,
+                                   workdir=self.get_path("m"))
+        self.assertEqual(report.failed, ["a", "b", "c"])
+        self.assertEqual(report["b"].returncode, 3)
+        self.assertIn("out", report["b"].output)
+
+    def test_concurrent(self):
+        """
+        Runs overlap if the concurrency limit allows it.
+        """
+        script = self.get_path("script.py")
+        with open(script, 'w') as f:
+            f.write("import time\ntime.sleep(0.5)\n")
+        envs = dict(("env%d" % i, self.envs["a"]) for i in range(4))
+        start = time.time()
+        report = matrix.run_matrix(script, envs, max_workers=4,
+                                   workdir=self.get_path("m"))
+        elapsed = time.time() - start
+        self.assertTrue(report.ok)
+        total = sum(r.duration for r in report.results.values())
+        self.assertTrue(elapsed < total)
+
+    def get_path(self, path):
+        """
+        Returns the absolute path to a file relative to the temporary directory.
+        """
+        return os.path.join(self.tmpdir, path.replace("/", os.sep))
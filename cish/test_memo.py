@@ -0,0 +1,124 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import shutil
+import tempfile
+import subprocess
+
+from cish import pyenv
+from cish import commands
+from cish import memo
+
+
+class TestMemo(unittest.TestCase):
+    """
+    Unit-tests for :mod:`memo`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.counter = os.path.join(self.tmpdir, "counter")
+        self.code = "open({0!r}, 'a').write('x'); print('hi')".format(self.counter)
+        self.env = pyenv.interpeter_pyenv()
+        self.cache = memo.MemoCache()
+        self.pure = memo.PureInvokers(self.env, self.cache)
+
+    def tearDown(self):
+        commands.rm_wait()
+        shutil.rmtree(self.tmpdir)
+
+    def runs(self):
+        with open(self.counter) as f:
+            return len(f.read())
+
+    def test_memoized(self):
+        first = self.pure.python("-c", self.code)
+        second = self.pure.python("-c", self.code)
+        self.assertEqual(memo.PureResult(0, "hi\n"), first)
+        self.assertEqual(first, second)
+        self.assertEqual(1, self.runs())
+
+    def test_arguments_in_key(self):
+        self.pure.python("-c", self.code)
+        self.pure.python("-c", self.code, "other")
+        self.assertEqual(2, self.runs())
+
+    def test_failure(self):
+        code = self.code + "; raise SystemExit(2)"
+        for _ in range(2):
+            with self.assertRaises(subprocess.CalledProcessError):
+                self.pure.python("-c", code)
+        self.assertEqual(2, self.pure.python("-c", code, check=False).returncode)
+        self.assertEqual(1, self.runs())
+
+    def test_install_invalidates(self):
+        """
+        Modifying site-packages invalidates the results.
+        """
+        venv = self.env.virtualenv(os.path.join(self.tmpdir, "env"))
+        pure = memo.PureInvokers(venv, self.cache)
+        pure.python("-c", self.code)
+        pure.python("-c", self.code)
+        self.assertEqual(1, self.runs())
+        site_packages = venv.info.site_packages[0]
+        os.mkdir(os.path.join(site_packages, "cish_memo_test"))
+        pure.python("-c", self.code)
+        self.assertEqual(2, self.runs())
+
+    def test_lru(self):
+        cache = memo.MemoCache(max_entries=2)
+        for key in "abc":
+            cache.put(key, memo.PureResult(0, key))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual("c", cache.get("c").output)
+
+    def test_disk(self):
+        """
+        The on-disk tier is shared between caches.
+        """
+        directory = os.path.join(self.tmpdir, "memo")
+        pure = memo.PureInvokers(self.env, memo.MemoCache(directory=directory))
+        pure.python("-c", self.code)
+        pure = memo.PureInvokers(self.env, memo.MemoCache(directory=directory))
+        self.assertEqual("hi\n", pure.python("-c", self.code).output)
+        self.assertEqual(1, self.runs())
+
+    def test_prune(self):
+        cache = memo.MemoCache(directory=os.path.join(self.tmpdir, "memo"), max_disk_entries=3)
+        for i in range(5):
+            cache.put("{0:02d}".format(i) * 32, memo.PureResult(0, str(i)))
+        cache.prune()
+        cache.clear()
+        self.assertEqual(3, sum(cache.get("{0:02d}".format(i) * 32) is not None for i in range(5)))
+
+    def test_env_property(self):
+        self.assertEqual(0, self.env.pure.python("--version").returncode)
@@ -0,0 +1,148 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import shutil
+import tempfile
+
+from cish import pyenv
+from cish import pipeline
+
+
+GENERATE = "for i in range(3): print('line %d' % i)"
+UPPER = "import sys\nfor line in sys.stdin: sys.stdout.write(line.upper())"
+COUNT = "import sys; print(len(sys.stdin.readlines()))"
+
+
+class TestPipeline(unittest.TestCase):
+    """
+    Unit-tests for :mod:`pipeline`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.env = pyenv.interpeter_pyenv()
+        self.out = os.path.join(self.tmpdir, "out.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self):
+        with open(self.out) as f:
+            return f.read()
+
+    def test_redirect(self):
+        """
+        Output of a single command can be written to a file.
+        """
+        result = self.env.cmd.python("-c", GENERATE) > self.out
+        self.assertEqual(result.returncodes, [0])
+        self.assertEqual(self.read(), "line 0\nline 1\nline 2\n")
+
+    def test_pipe(self):
+        """
+        Output is passed from one stage to the next.
+        """
+        cmd = self.env.cmd.python
+        cmd("-c", GENERATE) | cmd("-c", UPPER) | cmd("-c", COUNT) > self.out
+        self.assertEqual(self.read(), "3\n")
+
+        cmd("-c", GENERATE) | cmd("-c", UPPER) > self.out
+        self.assertEqual(self.read(), "LINE 0\nLINE 1\nLINE 2\n")
+
+    def test_append(self):
+        """
+        Output can be appended to a file.
+        """
+        cmd = self.env.cmd.python
+        cmd("-c", "print('a')") > self.out
+        (cmd("-c", "print('b')") | cmd("-c", UPPER)).run(stdout=self.out, append=True)
+        self.assertEqual(self.read(), "a\nB\n")
+
+    def test_stdin(self):
+        """
+        A file can be passed to the first stage.
+        """
+        infile = os.path.join(self.tmpdir, "in.txt")
+        with open(infile, 'w') as f:
+            f.write("x\ny\n")
+        self.env.cmd.python("-c", UPPER).run(stdin=infile, stdout=self.out)
+        self.assertEqual(self.read(), "X\nY\n")
+
+    def test_pipefail(self):
+        """
+        A failing stage fails the pipeline, even if it is not the last one.
+        """
+        cmd = self.env.cmd.python
+        fail = cmd("-c", "import sys; print('x'); sys.exit(3)")
+        try:
+            fail | cmd("-c", COUNT) > self.out
+            self.fail("expected PipelineError")
+        except pipeline.PipelineError as e:
+            self.assertEqual(e.returncodes, [3, 0])
+            self.assertEqual(e.returncode, 3)
+        self.assertEqual(self.read(), "1\n")
+
+    def test_no_check(self):
+        """
+        Exit codes can be inspected without exceptions.
+        """
+        cmd = self.env.cmd.python
+        p = cmd("-c", "raise SystemExit(2)") | cmd("-c", "raise SystemExit(4)")
+        result = p.run(check=False)
+        self.assertEqual(result.returncodes, [2, 4])
+        self.assertEqual(result.returncode, 4)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "lists open file descriptors in /proc")
+    def test_start_failure_closes_pipes(self):
+        """
+        No pipe is left open if a stage cannot be started.
+        """
+        cmd = self.env.cmd.python
+        missing = pipeline.Command([os.path.join(self.tmpdir, "missing")])
+        before = len(os.listdir("/proc/self/fd"))
+        self.assertRaises(OSError, (cmd("-c", GENERATE) | missing | cmd("-c", COUNT)).run)
+        self.assertEqual(before, len(os.listdir("/proc/self/fd")))
+
+    def test_command_args(self):
+        """
+        Arguments can be added to a command in several steps.
+        """
+        cmd = self.env.cmd.python("-c")("print('hi')")
+        self.assertEqual(cmd.argv[1:], ["-c", "print('hi')"])
+        self.assertIn("print('hi')", repr(cmd | cmd))
+
+    def test_from_path(self):
+        """
+        The PATH environment finds executables like a shell.
+        """
+        sh = pyenv.from_path()
+        self.assertTrue(sh.search_paths)
@@ -0,0 +1,119 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+import json
+
+from cish import probe
+
+
+class TestProbe(unittest.TestCase):
+    """
+    Unit-tests for :mod:`probe`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = probe.ProbeCache(self.get_path("cache.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_info(self):
+        """
+        The metadata of the running interpreter is probed correctly.
+        """
+        info = probe.interpreter_info(sys.executable, cache=self.cache)
+        self.assertEqual(info.version, "{0}.{1}.{2}".format(*sys.version_info[:3]))
+        self.assertEqual(info.abi_tag, "cp{0}{1}".format(*sys.version_info[:2]))
+        self.assertEqual(info.prefix, sys.prefix)
+        self.assertTrue(info.site_packages)
+
+    def test_info_cached(self):
+        """
+        The interpreter is only started once, even across cache instances.
+        """
+        probe.interpreter_info(sys.executable, cache=self.cache)
+        check_output = probe.subprocess.check_output
+        def fail(*args, **kwargs):
+            raise AssertionError("interpreter started again")
+        probe.subprocess.check_output = fail
+        try:
+            cache = probe.ProbeCache(self.get_path("cache.json"))
+            info = probe.interpreter_info(sys.executable, cache=cache)
+            self.assertEqual(info.prefix, sys.prefix)
+        finally:
+            probe.subprocess.check_output = check_output
+
+    def test_invalidated(self):
+        """
+        Entries are invalid once the executable changed.
+        """
+        exe = self.get_path("python")
+        with open(exe, 'w') as f:
+            f.write("old")
+        self.cache.put(exe, "search_paths", ["a"])
+        self.assertEqual(self.cache.get(exe, "search_paths"), ["a"])
+
+        os.utime(exe, (0, 0))
+        self.assertIsNone(self.cache.get(exe, "search_paths"))
+
+    def test_missing(self):
+        """
+        Interpreters that don't exist have no entries.
+        """
+        self.assertIsNone(self.cache.get(self.get_path("nothere"), "info"))
+
+    def test_prune(self):
+        """
+        Entries of deleted interpreters are removed.
+        """
+        exe1 = self.get_path("python1")
+        exe2 = self.get_path("python2")
+        for exe in [exe1, exe2]:
+            with open(exe, 'w') as f:
+                f.write("")
+            self.cache.put(exe, "search_paths", [])
+        os.remove(exe1)
+        cache = probe.ProbeCache(self.cache.path)
+        self.assertIsNone(cache.get(exe1, "search_paths"))
+        cache.put(exe2, "info", None)
+        with open(self.cache.path) as f:
+            self.assertEqual(list(json.load(f)), [exe2])
+
+    def get_path(self, path):
+        """
+        Returns the absolute path to a file relative to the temporary directory.
+        """
+        return os.path.join(self.tmpdir, path.replace("/", os.sep))
@@ -0,0 +1,123 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+import subprocess
+
+from cish import pyenv
+from cish import profiling
+
+
+_SCRIPT = """
+import sys
+def hot():
+    total = 0
+    for i in range(300000):
+        total += i * i
+    return total
+
+def main():
+    for _ in range(5):
+        hot()
+    sys.exit(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+
+main()
+"""
+
+
+class TestProfiling(unittest.TestCase):
+    """
+    Unit-tests for :mod:`profiling`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.env = pyenv.interpeter_pyenv()
+        self.profiles = os.path.join(self.tmpdir, "profiles")
+        self.script = os.path.join(self.tmpdir, "hot.py")
+        with open(self.script, "w") as f:
+            f.write(_SCRIPT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def hottest(self):
+        stats = profiling.aggregate(self.profiles)
+        self.assertEqual(1, len(stats))
+        return list(stats.values())[0]
+
+    def test_cprofile(self):
+        self.env.python(self.script, profile=self.profiles)
+        stats = self.hottest()
+        self.assertTrue(stats[0].function.endswith("(hot)"))
+        self.assertEqual(5, stats[0].calls)
+        label = os.listdir(self.profiles)[0]
+        self.assertTrue(any(f.endswith(".prof") for f in os.listdir(os.path.join(self.profiles, label))))
+
+    def test_sampling(self):
+        self.env.python(self.script, profile=self.profiles, profiler="sampling")
+        stats = self.hottest()
+        self.assertTrue(stats[0].function.endswith("(hot)"))
+        self.assertGreater(stats[0].self_time, 0)
+
+    def test_exit_code(self):
+        """
+        The exit code is kept and the profile is written anyway.
+        """
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            self.env.python(self.script, "3", profile=self.profiles)
+        self.assertEqual(3, cm.exception.returncode)
+        self.assertTrue(self.hottest())
+
+    def test_console_script(self):
+        self.env.pip("--version", profile=self.profiles, capture=True).close()
+        self.assertTrue(self.hottest())
+
+    def test_module_and_code(self):
+        self.env.python("-c", "import sys; assert sys.argv[1:] == ['x']", "x", profile=self.profiles)
+        self.env.python("-m", "json.tool", "--help", profile=self.profiles, capture=True).close()
+        self.assertTrue(self.hottest())
+
+    def test_merge(self):
+        """
+        Profiles of several invocations are merged.
+        """
+        self.env.python(self.script, profile=self.profiles)
+        self.env.python(self.script, profile=self.profiles)
+        self.assertEqual(10, self.hottest()[0].calls)
+        self.assertIn("(hot)", profiling.report(self.profiles, top=3))
+
+    def test_not_python(self):
+        self.assertRaises(ValueError, profiling.wrap, sys.executable, "ls", "/bin/ls", [], self.profiles)
+        self.assertRaises(ValueError, profiling.wrap, sys.executable, "python", sys.executable, [], self.profiles)
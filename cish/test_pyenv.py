@@ -35,6 +35,8 @@ import subprocess
 import json
 
 from cish import pyenv
+from cish import commands
+from cish import probe
 
 class TestPyEnv(unittest.TestCase):
     """
@@ -44,9 +46,20 @@ class TestPyEnv(unittest.TestCase):
     def setUp(self):
         self.cwd = os.getcwd()
         self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = tempfile.mkdtemp()
+        self.cache_env = os.environ.get("CISH_CACHE_DIR")
+        os.environ["CISH_CACHE_DIR"] = self.cachedir
+        probe._default_cache = None
     
     def tearDown(self):
         os.chdir(self.cwd)
+        commands.rm_wait()
+        probe._default_cache = None
+        if self.cache_env is None:
+            del os.environ["CISH_CACHE_DIR"]
+        else:
+            os.environ["CISH_CACHE_DIR"] = self.cache_env
+        shutil.rmtree(self.cachedir)
         shutil.rmtree(self.tmpdir)
 
     def test_linux_style(self):
@@ -70,6 +83,18 @@ class TestPyEnv(unittest.TestCase):
         env = pyenv.from_interpreter(self.get_path("python.exe"))
         self.assertEqual(env.find_executable("pip"), self.get_path("Scripts/pip"))
         
+    def test_scripts_created_later(self):
+        """
+        A cached environment picks up a utility directory created later.
+        """
+        self.create_files(["python.exe"])
+        env = pyenv.from_interpreter(self.get_path("python.exe"))
+        self.assertEqual(env.search_paths, [self.tmpdir])
+
+        self.create_files(["Scripts/pip"])
+        env = pyenv.from_interpreter(self.get_path("python.exe"))
+        self.assertEqual(env.find_executable("pip"), self.get_path("Scripts/pip"))
+
     def test_prefer_wpython(self):
         """
         Windows installations have the utilities in a separate directory.
@@ -91,6 +116,41 @@ class TestPyEnv(unittest.TestCase):
         env = pyenv.from_interpreter(self.get_path("python.exe"))
         self.assertEqual(env.find_executable("pip"), self.get_path("pip.exe"))
        
+    def test_new_executable_found(self):
+        """
+        Executables added after the first lookup, for example by
+        `pip install`, are found once the directory changed.
+        """
+        self.create_files(["bin/python"])
+        env = pyenv.from_interpreter(self.get_path("bin/python"))
+        self.assertRaises(ValueError, env.find_executable, "pip")
+
+        self.create_files(["bin/pip"])
+        os.utime(self.get_path("bin"), ns=(0, 0))
+        self.assertEqual(env.find_executable("pip"), self.get_path("bin/pip"))
+
+    def test_directory_listed_once(self):
+        """
+        Repeated lookups in an unchanged directory don't list it again.
+        """
+        self.create_files(["bin/python",
+                           "bin/pip"])
+        env = pyenv.from_interpreter(self.get_path("bin/python"))
+
+        calls = []
+        scandir = os.scandir
+        def counting_scandir(path):
+            calls.append(path)
+            return scandir(path)
+        os.scandir = counting_scandir
+        try:
+            for _ in range(10):
+                env.find_executable("pip")
+                env.find_executable("python")
+        finally:
+            os.scandir = scandir
+        self.assertEqual(calls, [self.get_path("bin")])
+
     def test_getattr(self):
         """
         Test if we can invoke the python interpreter using a method on the environment.
@@ -146,6 +206,22 @@ class TestPyEnv(unittest.TestCase):
         envs = pyenv.from_config(cfgfile)
         self.assertEqual(self.get_path("python.exe"), envs["abc"].find_executable("python"))
  
+    def test_config_lazy(self):
+        """
+        Environments are only constructed when they are accessed.
+        """
+        self.create_files(["python.exe"])
+
+        cfgfile = self.get_path("config.json")
+        with open(cfgfile, 'w') as f:
+            json.dump({"abc": self.get_path("python.exe"),
+                       "missing": self.get_path("nothere/python.exe")}, f)
+
+        envs = pyenv.from_config(cfgfile)
+        self.assertEqual(sorted(envs), ["abc", "missing"])
+        self.assertIs(envs["abc"], envs["abc"])
+        self.assertRaises(ValueError, lambda: envs["missing"])
+
     def get_path(self, path):
         """
         Returns the absolute path to a file relative to the temporary directory.
@@ -0,0 +1,220 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import time
+import subprocess
+import socket
+import struct
+
+from cish import commands
+from cish import remote
+
+
+TOKEN = "test-secret"
+
+
+class TestRemote(unittest.TestCase):
+    """
+    Unit-tests for :mod:`remote`, with agents running as local processes.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.workdir = self.get_path("work")
+        os.mkdir(self.workdir)
+        self.agents = []
+
+    def tearDown(self):
+        for process in self.agents:
+            process.terminate()
+            process.wait()
+            process.stdout.close()
+        commands.rm_wait()
+        shutil.rmtree(self.tmpdir)
+
+    def get_path(self, path):
+        return os.path.join(self.tmpdir, path)
+
+    def start_agent(self, name, envs, capacity=2):
+        config = self.get_path(name + ".json")
+        with open(config, "w") as f:
+            json.dump({env: sys.executable for env in envs}, f)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        process = subprocess.Popen(
+            [sys.executable, "-m", "cish.remote", "--port", "0", "--config", config,
+             "--capacity", str(capacity), "--root", self.get_path(name)],
+            cwd=root, stdout=subprocess.PIPE, universal_newlines=True,
+            env=dict(os.environ, CISH_AGENT_TOKEN=TOKEN))
+        self.agents.append(process)
+        line = process.stdout.readline()
+        self.assertIn("listening on", line)
+        return line.split()[-1]
+
+    def write(self, relpath, content):
+        path = os.path.join(self.workdir, relpath)
+        commands.mkdirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(content)
+
+    def test_envs(self):
+        """
+        The cluster offers the environments of all agents.
+        """
+        a = self.start_agent("a", ["py1", "py2"])
+        b = self.start_agent("b", ["py2", "py3"])
+        cluster = remote.Cluster([a, b], token=TOKEN)
+        self.assertEqual(["py1", "py2", "py3"], list(cluster))
+        self.assertRaises(KeyError, lambda: cluster["nope"])
+        cluster.close()
+
+    def test_run_capture(self):
+        """
+        Output of a remote command is captured.
+        """
+        cluster = remote.Cluster([self.start_agent("a", ["py"])], token=TOKEN)
+        with cluster["py"].python("-c", "print('hello')", capture=True) as out:
+            self.assertEqual(b"hello\n", out.read())
+        cluster.close()
+
+    def test_failure(self):
+        """
+        Remote exit codes are reported like local ones.
+        """
+        cluster = remote.Cluster([self.start_agent("a", ["py"])], token=TOKEN)
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            cluster["py"].python("-c", "import sys; sys.exit(3)")
+        self.assertEqual(3, cm.exception.returncode)
+        self.assertEqual(3, cluster["py"].python("-c", "import sys; sys.exit(3)", check=False))
+        cluster.close()
+
+    def test_sync(self):
+        """
+        The working directory is synced, sending only new chunks.
+        """
+        self.write("script.py", "print('one')")
+        self.write("sub/data.txt", "x" * 10)
+        cluster = remote.Cluster([self.start_agent("a", ["py"])], workdir=self.workdir, token=TOKEN)
+        env = cluster["py"]
+        with env.python("script.py", capture=True) as out:
+            self.assertEqual(b"one\n", out.read())
+
+        agent = cluster._agents[0]
+        self.assertEqual(0, cluster._sync(agent))
+
+        self.write("script.py", "import os; print(os.path.exists('sub/data.txt'))")
+        os.remove(os.path.join(self.workdir, "sub", "data.txt"))
+        self.assertEqual(1, cluster._sync(agent))
+        with env.python("script.py", capture=True) as out:
+            self.assertEqual(b"False\n", out.read())
+        cluster.close()
+
+    def test_chunks(self):
+        """
+        Large files are split into chunks, identical chunks are sent once.
+        """
+        self.write("big", "a" * remote.CHUNK_SIZE * 2 + "b")
+        cluster = remote.Cluster([self.start_agent("a", ["py"])], workdir=self.workdir, token=TOKEN)
+        self.assertEqual(2, cluster._sync(cluster._agents[0]))
+        with cluster["py"].python("-c", "print(len(open('big').read()))", capture=True) as out:
+            self.assertEqual(str(remote.CHUNK_SIZE * 2 + 1).encode() + b"\n", out.read())
+        cluster.close()
+
+    def test_scheduling(self):
+        """
+        Commands are spread over the agents by their capacity.
+        """
+        a = self.start_agent("a", ["py"], capacity=1)
+        b = self.start_agent("b", ["py"], capacity=1)
+        cluster = remote.Cluster([a, b], token=TOKEN)
+        cwds = []
+
+        def job():
+            code = "import os, time; time.sleep(0.5); print(os.getcwd())"
+            with cluster["py"].python("-c", code, capture=True) as out:
+                cwds.append(out.read().strip())
+
+        threads = [threading.Thread(target=job) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4, len(cwds))
+        self.assertEqual(2, len(set(cwds)))
+        cluster.close()
+
+    def test_wrong_token(self):
+        """
+        Clients without the right token are turned away.
+        """
+        address = self.start_agent("a", ["py"])
+        self.assertRaises(remote.RemoteError, remote.Cluster, [address], token="wrong")
+        self.assertRaises(ValueError, remote.Cluster, [address], token="")
+
+    def test_hello_limit(self):
+        """
+        Oversized handshakes are rejected before they are read.
+        """
+        host, port = self.start_agent("a", ["py"]).rsplit(":", 1)
+        with socket.create_connection((host, int(port)), 10) as sock:
+            rfile = sock.makefile("rb")
+            self.assertIn("challenge", remote._read_frame(rfile))
+            sock.sendall(struct.pack(">I", 2**31))
+            self.assertEqual(b"", rfile.read())
+
+    def test_disconnect_kills(self):
+        """
+        A command is killed if its client disconnects.
+        """
+        cluster = remote.Cluster([self.start_agent("a", ["py"])], token=TOKEN)
+        agent = cluster._agents[0]
+        marker = self.get_path("marker")
+        code = "import time; print('started', flush=True); time.sleep(3); open({0!r}, 'w')".format(marker)
+        connection = agent.connection()
+        remote._write_frame(connection.wfile, {"op": "run", "env": "py", "name": "python",
+                                               "args": ["-c", code], "tree": None, "cwd": None})
+        connection.response()
+        connection.close()
+        time.sleep(4)
+        self.assertFalse(os.path.exists(marker))
+        cluster.close()
+
+    def test_reject_escape(self):
+        """
+        Paths and names from clients cannot leave the agent's directories.
+        """
+        self.assertRaises(remote.RemoteError, remote._check_relpath, "../x")
+        self.assertRaises(remote.RemoteError, remote._check_name, "../x")
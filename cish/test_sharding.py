@@ -0,0 +1,154 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import shutil
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+from cish import pyenv
+from cish import commands
+from cish import sharding
+
+
+SUITE = """
+import time
+import unittest
+
+def test_fast():
+    pass
+
+def test_slow():
+    time.sleep(0.2)
+
+class TestGroup(unittest.TestCase):
+    def test_a(self):
+        pass
+    def test_b(self):
+        pass
+"""
+
+
+class TestSharding(unittest.TestCase):
+    """
+    Unit-tests for :mod:`sharding`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_partition(self):
+        """
+        Shards get similar total durations.
+        """
+        durations = {"a": 5, "b": 4, "c": 3, "d": 3, "e": 2, "f": 1}
+        shards = sharding.partition(sorted(durations), durations.get, 3)
+        totals = sorted(sum(durations[t] for t in shard) for shard in shards)
+        self.assertEqual(totals, [6, 6, 6])
+        self.assertEqual(sorted(t for shard in shards for t in shard), sorted(durations))
+
+    def test_partition_few_tests(self):
+        """
+        Extra shards stay empty.
+        """
+        shards = sharding.partition(["a"], lambda t: 1, 3)
+        self.assertEqual(sorted(shards), [[], [], ["a"]])
+
+    def test_junit_key(self):
+        """
+        Node ids are converted to JUnit identities.
+        """
+        self.assertEqual(sharding._junit_key("pkg/test_mod.py::TestClass::test_f"),
+                         "pkg.test_mod.TestClass::test_f")
+        self.assertEqual(sharding._junit_key("test_mod.py::test_f[1-2]"),
+                         "test_mod::test_f[1-2]")
+
+    def test_history(self):
+        """
+        Unknown tests are estimated with the median duration.
+        """
+        history = sharding.DurationHistory(os.path.join(self.tmpdir, "h.json"))
+        self.assertEqual(history.estimate("t.py::test_x"), 1.0)
+        history.durations = {"t::a": 1.0, "t::b": 2.0, "t::c": 9.0}
+        history.save()
+
+        history = sharding.DurationHistory(os.path.join(self.tmpdir, "h.json"))
+        self.assertEqual(history.estimate("t.py::a"), 1.0)
+        self.assertEqual(history.estimate("t.py::x"), 2.0)
+
+    def test_collect_spaces(self):
+        """
+        Parametrized tests with spaces in their ids are collected.
+        """
+        with open(os.path.join(self.tmpdir, "test_params.py"), 'w') as f:
+            f.write("import pytest\n\n@pytest.mark.parametrize('x', ['a b', 'c'])\n"
+                    "def test_x(x):\n    pass\n")
+        with commands.cd(self.tmpdir):
+            tests = sharding.collect_tests(pyenv.interpeter_pyenv())
+        self.assertEqual(tests, ["test_params.py::test_x[a b]", "test_params.py::test_x[c]"])
+
+    def test_run_sharded(self):
+        """
+        The suite runs in shards of several environments and the results
+        are merged.
+        """
+        with open(os.path.join(self.tmpdir, "test_suite.py"), 'w') as f:
+            f.write(SUITE)
+        env = pyenv.interpeter_pyenv()
+        with commands.cd(self.tmpdir):
+            report = sharding.run_sharded({"one": env, "two": env}, shards=2, workers=4)
+            history = sharding.DurationHistory()
+
+        self.assertTrue(report.ok, str(report))
+        self.assertEqual(report.tests, 8)
+        self.assertEqual(len(report.returncodes), 4)
+
+        root = ElementTree.parse(os.path.join(self.tmpdir, "junit.xml")).getroot()
+        suites = root.findall("testsuite")
+        self.assertEqual([s.get("name") for s in suites], ["one", "two"])
+        self.assertEqual([len(s.findall("testcase")) for s in suites], [4, 4])
+
+        self.assertTrue(history.durations["test_suite::test_slow"] >= 0.2)
+        self.assertIn("test_suite.TestGroup::test_a", history.durations)
+
+    def test_failures(self):
+        """
+        Failing tests fail the report.
+        """
+        with open(os.path.join(self.tmpdir, "test_fail.py"), 'w') as f:
+            f.write("def test_ok():\n    pass\n\ndef test_fail():\n    assert False\n")
+        with commands.cd(self.tmpdir):
+            report = sharding.run_sharded({"env": pyenv.interpeter_pyenv()}, shards=2)
+        self.assertFalse(report.ok)
+        self.assertEqual(report.failures, 1)
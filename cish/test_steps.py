@@ -0,0 +1,194 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import shutil
+import tempfile
+
+from cish import pyenv
+from cish import steps
+
+
+class TestSteps(unittest.TestCase):
+    """
+    Unit-tests for :mod:`steps`.
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.create_files({"src/a.py": "a", "src/sub/b.py": "b", "setup.py": "setup"})
+        self.runs = []
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def build(self, **kwargs):
+        """
+        Step concatenating the sources into `build/out.txt`.
+        """
+        with steps.step("build", inputs=["setup.py", "src/**/*.py"],
+                        outputs=["build"], **kwargs) as s:
+            if s.needed:
+                self.runs.append(1)
+                self.create_files({"build/out.txt": self.read("src/a.py") + self.read("src/sub/b.py")})
+        return s
+
+    def test_skip(self):
+        """
+        A step is skipped if nothing changed.
+        """
+        self.assertTrue(self.build().needed)
+        self.assertFalse(self.build().needed)
+        self.assertEqual(len(self.runs), 1)
+
+    def test_restore(self):
+        """
+        Outputs of skipped steps are restored.
+        """
+        self.build()
+        shutil.rmtree(self.get_path("build"))
+        self.build()
+        self.assertEqual(self.read("build/out.txt"), "ab")
+        self.assertEqual(len(self.runs), 1)
+
+    def test_restore_removes_stale(self):
+        """
+        Output directories only contain the restored files.
+        """
+        self.build()
+        self.create_files({"build/stale.txt": "x"})
+        self.build()
+        self.assertEqual(os.listdir(self.get_path("build")), ["out.txt"])
+
+    def test_input_changed(self):
+        """
+        Changed inputs run the step again.
+        """
+        self.build()
+        self.create_files({"src/sub/b.py": "changed"})
+        self.assertTrue(self.build().needed)
+        self.assertEqual(self.read("build/out.txt"), "achanged")
+
+    def test_new_input(self):
+        """
+        New files matching the input patterns run the step again.
+        """
+        self.build()
+        self.create_files({"src/sub/c.py": "c"})
+        self.assertTrue(self.build().needed)
+
+    def test_key_parts(self):
+        """
+        Environment and arguments are part of the key.
+        """
+        self.build()
+        self.assertTrue(self.build(argv=["--debug"]).needed)
+        self.assertTrue(self.build(env=pyenv.interpeter_pyenv()).needed)
+        self.assertFalse(self.build(env=pyenv.interpeter_pyenv()).needed)
+
+    def test_failure_not_cached(self):
+        """
+        Steps that raise are not recorded as completed.
+        """
+        try:
+            with steps.step("fail", inputs=["setup.py"]):
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        with steps.step("fail", inputs=["setup.py"]) as s:
+            self.assertTrue(s.needed)
+
+    def test_missing_output(self):
+        """
+        Declared outputs must exist.
+        """
+        def run():
+            with steps.step("missing", outputs=["nothere"]):
+                pass
+        self.assertRaises(ValueError, run)
+
+    def test_decorator(self):
+        """
+        Steps can decorate functions.
+        """
+        @steps.step("deco", inputs=["setup.py"])
+        def install():
+            self.runs.append(1)
+            return "ran"
+        self.assertEqual(install(), "ran")
+        self.assertIsNone(install())
+        self.assertEqual(len(self.runs), 1)
+
+    def test_unchanged_not_hashed(self):
+        """
+        Files with unchanged size and mtime are not hashed again.
+        """
+        self.build()
+        hashed = []
+        hash_file = steps._hash_file
+        def counting(path):
+            hashed.append(path)
+            return hash_file(path)
+        steps._hash_file = counting
+        try:
+            self.build()
+            self.assertEqual(hashed, [])
+            self.create_files({"src/a.py": "aaa"})
+            self.build()
+            self.assertEqual(sorted(hashed), [self.get_path("build/out.txt"),
+                                              self.get_path("src/a.py")])
+        finally:
+            steps._hash_file = hash_file
+
+    def read(self, path):
+        with open(self.get_path(path)) as f:
+            return f.read()
+
+    def get_path(self, path):
+        """
+        Returns the absolute path to a file relative to the temporary directory.
+        """
+        return os.path.join(self.tmpdir, path.replace("/", os.sep))
+
+    def create_files(self, files):
+        """
+        Takes a dict of files (optionally with relative paths) and their
+        content and creates them in the temporary directory.
+        """
+        for relative_file, content in files.items():
+            absolute_file = self.get_path(relative_file)
+            if not os.path.exists(os.path.dirname(absolute_file)):
+                os.makedirs(os.path.dirname(absolute_file))
+            with open(absolute_file, 'w') as f:
+                f.write(content)
@@ -0,0 +1,192 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os
+import threading
+import time
+
+from cish import tasks
+
+
+class TestTasks(unittest.TestCase):
+    """
+    Unit-tests for :class:`tasks.TaskGraph`.
+    """
+
+    def setUp(self):
+        self.graph = tasks.TaskGraph()
+        self.log = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def job(self, name, duration=0.0, fail=False):
+        """
+        Returns a task function that logs its execution.
+        """
+        def func():
+            with self.lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            time.sleep(duration)
+            with self.lock:
+                self.active -= 1
+                self.log.append(name)
+            if fail:
+                raise RuntimeError(name + " failed")
+        return func
+
+    def test_dependencies(self):
+        """
+        Tasks run after their dependencies.
+        """
+        self.graph.task("c", self.job("c"), deps=["b"])
+        self.graph.task("b", self.job("b"), deps=["a"])
+        self.graph.task("a", self.job("a"))
+        report = self.graph.run()
+        self.assertTrue(report.ok)
+        self.assertEqual(self.log, ["a", "b", "c"])
+
+    def test_parallel(self):
+        """
+        Independent tasks run concurrently.
+        """
+        for name in "abcd":
+            self.graph.task(name, self.job(name, 0.3))
+        report = self.graph.run(jobs=4)
+        self.assertEqual(self.max_active, 4)
+        self.assertTrue(report.duration < 1.0)
+
+    def test_jobs_limit(self):
+        """
+        No more than `jobs` tasks run at the same time.
+        """
+        for name in "abcd":
+            self.graph.task(name, self.job(name, 0.1))
+        self.graph.run(jobs=2)
+        self.assertEqual(self.max_active, 2)
+
+    def test_fail_fast(self):
+        """
+        Dependents of failed tasks are skipped, independent tasks still run.
+        """
+        self.graph.task("a", self.job("a", fail=True))
+        self.graph.task("b", self.job("b"), deps=["a"])
+        self.graph.task("c", self.job("c"), deps=["b"])
+        self.graph.task("d", self.job("d"))
+        report = self.graph.run()
+        self.assertFalse(report.ok)
+        self.assertEqual(report.failed, ["a"])
+        self.assertEqual(report.skipped, ["b", "c"])
+        self.assertEqual(report.passed, ["d"])
+        self.assertIn("a failed", report["a"].error)
+
+    def test_env_exclusive(self):
+        """
+        Tasks using the same environment don't overlap.
+        """
+        env = object()
+        for name in "abc":
+            self.graph.task(name, self.job(name, 0.1), env=env)
+        self.graph.run(jobs=3)
+        self.assertEqual(self.max_active, 1)
+
+    def test_critical_path(self):
+        """
+        The longest chain of dependent tasks is reported.
+        """
+        self.graph.task("a", self.job("a", 0.05))
+        self.graph.task("b", self.job("b", 0.3), deps=["a"])
+        self.graph.task("c", self.job("c", 0.05), deps=["a"])
+        self.graph.task("d", self.job("d", 0.05), deps=["b", "c"])
+        self.graph.task("e", self.job("e", 0.1))
+        report = self.graph.run(jobs=4)
+        self.assertEqual(report.critical_path, ["a", "b", "d"])
+        self.assertIn("a -> b -> d", str(report))
+
+    def test_cycle(self):
+        """
+        Cyclic dependencies are rejected.
+        """
+        self.graph.task("a", self.job("a"), deps=["b"])
+        self.graph.task("b", self.job("b"), deps=["a"])
+        self.assertRaises(ValueError, self.graph.run)
+
+    def test_unknown_dependency(self):
+        """
+        Dependencies must exist.
+        """
+        self.graph.task("a", self.job("a"), deps=["nothere"])
+        self.assertRaises(ValueError, self.graph.run)
+
+    def test_decorator(self):
+        """
+        Tasks can be declared with a decorator.
+        """
+        @self.graph.task("a")
+        def a():
+            self.log.append("a")
+        self.graph.run()
+        self.assertEqual(self.log, ["a"])
+
+    def test_jobserver(self):
+        """
+        Tokens from a make jobserver limit the concurrency.
+        """
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b"+")
+        try:
+            server = tasks._JobServer.from_environ(
+                {"MAKEFLAGS": " -j2 --jobserver-auth={0},{1}".format(read_fd, write_fd)})
+            self.assertIsNotNone(server)
+
+            from_environ = tasks._JobServer.from_environ
+            tasks._JobServer.from_environ = classmethod(lambda cls: server)
+            try:
+                for name in "abcd":
+                    self.graph.task(name, self.job(name, 0.1))
+                report = self.graph.run()
+            finally:
+                tasks._JobServer.from_environ = from_environ
+            self.assertTrue(report.ok)
+            self.assertEqual(self.max_active, 2)
+            self.assertEqual(os.read(read_fd, 1), b"+")
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_no_jobserver(self):
+        """
+        MAKEFLAGS without (usable) jobserver is ignored.
+        """
+        self.assertIsNone(tasks._JobServer.from_environ({"MAKEFLAGS": "-k"}))
+        self.assertIsNone(tasks._JobServer.from_environ(
+            {"MAKEFLAGS": "--jobserver-auth=9998,9999"}))
@@ -0,0 +1,139 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import shutil
+import tempfile
+import subprocess
+import json
+
+from cish import pyenv
+from cish import commands
+from cish import trace
+
+
+class TestTrace(unittest.TestCase):
+    """
+    Unit-tests for :mod:`trace`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.env = pyenv.interpeter_pyenv()
+        trace.enable()
+
+    def tearDown(self):
+        trace.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_command(self):
+        """
+        Commands are recorded with the resource usage of the child.
+        """
+        self.env.python("-c", "x = ' ' * 50000000")
+        record, = trace.records()
+        self.assertEqual(record.kind, "command")
+        self.assertEqual(record.name, "python")
+        self.assertEqual(record.args, ["-c", "x = ' ' * 50000000"])
+        self.assertEqual(record.returncode, 0)
+        self.assertEqual(record.env, repr(self.env))
+        self.assertTrue(record.duration > 0)
+        if hasattr(os, "wait4"):
+            self.assertTrue(record.max_rss > 50000000)
+            self.assertTrue(record.user_time + record.system_time > 0)
+
+    def test_failed_command(self):
+        """
+        Exit codes of failed commands are recorded.
+        """
+        self.assertRaises(subprocess.CalledProcessError,
+                          self.env.python, "-c", "raise SystemExit(5)")
+        self.env.python("-c", "raise SystemExit(6)", capture=True, check=False)
+        self.assertEqual([r.returncode for r in trace.records()], [5, 6])
+
+    @unittest.skipUnless(hasattr(os, "wait4"), "exit statuses are POSIX only")
+    def test_exitcode_fallback(self):
+        """
+        Exit statuses are converted without `os.waitstatus_to_exitcode`.
+        """
+        original = getattr(os, "waitstatus_to_exitcode", None)
+        if original is not None:
+            del os.waitstatus_to_exitcode
+        try:
+            self.assertEqual(trace._exitcode(3 << 8), 3)
+            self.assertEqual(trace._exitcode(9), -9)
+        finally:
+            if original is not None:
+                os.waitstatus_to_exitcode = original
+
+    def test_commands(self):
+        """
+        File system operations are recorded.
+        """
+        path = os.path.join(self.tmpdir, "mydir")
+        commands.mkdirs(path)
+        commands.rm(path)
+        records = trace.records()
+        self.assertEqual([r.kind for r in records], ["mkdirs", "rm"])
+        self.assertEqual(records[0].args, [path])
+        self.assertIsNone(records[0].max_rss)
+
+    def test_disabled(self):
+        """
+        Nothing is recorded if recording is disabled.
+        """
+        trace.disable()
+        self.env.python("-c", "pass")
+        commands.mkdirs(os.path.join(self.tmpdir, "mydir"))
+        self.assertEqual(trace.records(), [])
+
+    def test_chrome_trace(self):
+        """
+        Records can be exported in the trace-event format.
+        """
+        self.env.python("-c", "pass")
+        path = os.path.join(self.tmpdir, "trace.json")
+        trace.export_chrome_trace(path)
+        with open(path) as f:
+            event, = json.load(f)["traceEvents"]
+        self.assertEqual(event["name"], "python")
+        self.assertEqual(event["ph"], "X")
+        self.assertEqual(event["args"]["returncode"], 0)
+
+    def test_summary(self):
+        """
+        The summary lists the commands.
+        """
+        self.env.python("-c", "pass")
+        commands.mkdirs(os.path.join(self.tmpdir, "mydir"))
+        text = trace.summary()
+        self.assertIn("python -c pass", text)
+        self.assertIn("total (2 records)", text)
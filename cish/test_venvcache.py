@@ -0,0 +1,184 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import shutil
+import tempfile
+import subprocess
+import json
+
+from cish import pyenv
+from cish import commands
+from cish import venvcache
+from cish.test_wheelhouse import make_wheel
+
+
+class TestVenvCache(unittest.TestCase):
+    """
+    Unit-tests for :class:`venvcache.VenvCache`.
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        self.env = pyenv.interpeter_pyenv()
+        self.cache = venvcache.VenvCache(self.get_path("cache"))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        commands.rm_wait()
+        shutil.rmtree(self.tmpdir)
+
+    def test_clone(self):
+        """
+        The clone is a working virtual environment at the new location.
+        """
+        venv = self.env.virtualenv(self.get_path("myenv"), cache=self.cache)
+        python = venv.find_executable("python")
+        self.assertTrue(python.startswith(self.tmpdir))
+
+        prefix = subprocess.check_output([python, "-c", "import sys; print(sys.prefix)"])
+        self.assertEqual(os.path.realpath(prefix.decode().strip()),
+                         os.path.realpath(self.get_path("myenv")))
+
+    def test_paths_fixed(self):
+        """
+        Scripts refer to the clone, not to the template.
+        """
+        self.env.virtualenv(self.get_path("myenv"), cache=self.cache)
+        template = self.cache.template(self.env)
+        with open(self.get_path("myenv/pyvenv.cfg")) as f:
+            cfg = f.read()
+        self.assertNotIn(template, cfg)
+        for name in os.listdir(self.get_path("myenv/bin")):
+            script = self.get_path("myenv/bin/" + name)
+            if os.path.isfile(script) and not os.path.islink(script):
+                with open(script, 'rb') as f:
+                    self.assertNotIn(template.encode(), f.read())
+
+    def test_template_reused(self):
+        """
+        The template is only created once.
+        """
+        self.env.virtualenv(self.get_path("env1"), cache=self.cache)
+
+        def fail(*args):
+            raise AssertionError("template created again")
+        self.cache._create = fail
+        self.env.virtualenv(self.get_path("env2"), cache=self.cache)
+        commands.rm_wait()
+        self.assertEqual(len(os.listdir(self.get_path("cache"))), 1)
+
+    def test_template_untouched(self):
+        """
+        Replacing the clone does not affect the template.
+        """
+        self.env.virtualenv(self.get_path("myenv"), cache=self.cache)
+        self.env.virtualenv(self.get_path("myenv"), cache=self.cache)
+        template = self.cache.template(self.env)
+        self.assertTrue(os.path.isfile(os.path.join(template, "pyvenv.cfg")))
+
+    def test_key(self):
+        """
+        Different parameters get different templates.
+        """
+        keys = set([self.cache.key(self.env),
+                    self.cache.key(self.env, system_side_packages=True),
+                    self.cache.key(self.env, requirements=["nose"])])
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(self.cache.key(self.env), self.cache.key(self.env))
+
+    def test_key_requirement_file(self):
+        """
+        Editing a requirement file, also a nested one, changes the key.
+        """
+        with open(self.get_path("req.txt"), 'w') as f:
+            f.write("-r nested.txt\nnose\n")
+        with open(self.get_path("nested.txt"), 'w') as f:
+            f.write("six\n")
+        with commands.cd(self.tmpdir):
+            key = self.cache.key(self.env, requirements=["-r", "req.txt"])
+            with open(self.get_path("nested.txt"), 'w') as f:
+                f.write("six==1.0\n")
+            self.assertNotEqual(key, self.cache.key(self.env, requirements=["-r", "req.txt"]))
+
+    def test_relative_requirement_file(self):
+        """
+        Requirement files are found relative to the current directory.
+        """
+        wheels = self.get_path("wheels")
+        os.mkdir(wheels)
+        make_wheel(wheels, "cishdemo", "1.0")
+        os.mkdir(self.get_path("project"))
+        with open(self.get_path("project/req.txt"), 'w') as f:
+            f.write("--no-index\n--find-links {0}\ncishdemo\n".format(wheels))
+        with commands.cd(self.get_path("project")):
+            venv = self.env.virtualenv("env", cache=self.cache, requirements=["-r", "req.txt"])
+        venv.python("-c", "import cishdemo")
+
+    def test_evict(self):
+        """
+        The least recently used templates are evicted first.
+        """
+        self.cache.max_size = 250
+        for i, name in enumerate(["a", "b", "c"]):
+            self.create_entry(name, 100, mtime=1000 + i)
+        self.cache.evict()
+        commands.rm_wait()
+        self.assertEqual(sorted(os.listdir(self.get_path("cache"))), ["b", "c"])
+
+    def test_evict_keep(self):
+        """
+        The template in use is never evicted.
+        """
+        self.cache.max_size = 50
+        self.create_entry("a", 100, mtime=1000)
+        self.create_entry("b", 100, mtime=2000)
+        self.cache.evict(keep=self.get_path("cache/a"))
+        commands.rm_wait()
+        self.assertEqual(os.listdir(self.get_path("cache")), ["a"])
+
+    def create_entry(self, name, size, mtime):
+        """
+        Creates a fake template in the cache.
+        """
+        entry = self.get_path("cache/" + name)
+        os.makedirs(os.path.join(entry, "venv"))
+        metafile = os.path.join(entry, "meta.json")
+        with open(metafile, 'w') as f:
+            json.dump({"size": size}, f)
+        os.utime(metafile, (mtime, mtime))
+
+    def get_path(self, path):
+        """
+        Returns the absolute path to a file relative to the temporary directory.
+        """
+        return os.path.join(self.tmpdir, path.replace("/", os.sep))
@@ -0,0 +1,133 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import glob
+import time
+import shutil
+import tempfile
+import subprocess
+import sys
+
+from cish import pyenv
+from cish import commands
+from cish import venvpool
+
+
+class TestVenvPool(unittest.TestCase):
+    """
+    Unit-tests for :class:`venvpool.VenvPool`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.env = pyenv.interpeter_pyenv()
+        self.pool = venvpool.VenvPool(self.env, size=1, root=self.tmpdir)
+
+    def tearDown(self):
+        self.pool.close()
+        commands.rm_wait()
+        shutil.rmtree(self.tmpdir)
+
+    def site_packages(self, venv):
+        pattern = os.path.join(venv.path, "lib", "python*", "site-packages")
+        return (glob.glob(pattern) + [os.path.join(venv.path, "Lib", "site-packages")])[0]
+
+    def test_lease(self):
+        """
+        Leased environments have their own python.
+        """
+        with self.pool.lease(timeout=120) as env:
+            python = env.find_executable("python")
+            self.assertTrue(python.startswith(self.tmpdir))
+            subprocess.check_call([python, "-c", "pass"])
+
+    def test_reset(self):
+        """
+        Files added while leased are removed when the environment is returned.
+        """
+        lease = self.pool.lease(timeout=120)
+        site_packages = self.site_packages(lease)
+        added = os.path.join(site_packages, "cish_pool_added")
+        os.mkdir(added)
+        with open(os.path.join(added, "__init__.py"), "w") as f:
+            f.write("")
+        lease.release()
+
+        lease = self.pool.lease(timeout=120)
+        self.assertEqual(site_packages, self.site_packages(lease))
+        self.assertFalse(os.path.exists(added))
+        lease.release()
+
+    def test_modified_replaced(self):
+        """
+        Environments whose baseline files changed are discarded.
+        """
+        lease = self.pool.lease(timeout=120)
+        path = lease.path
+        scripts = os.path.dirname(lease.env.find_executable("python"))
+        victim = sorted(name for name in os.listdir(scripts)
+                        if name.startswith("activate"))[0]
+        with open(os.path.join(scripts, victim), "a") as f:
+            f.write("# modified\n")
+        lease.release()
+
+        with self.pool.lease(timeout=120) as env:
+            self.assertNotEqual(path, os.path.dirname(os.path.dirname(env.find_executable("python"))))
+        commands.rm_wait()
+        self.assertFalse(os.path.exists(path))
+
+    def test_deleted_at_exit(self):
+        """
+        Shared pools are completely deleted when the interpreter exits.
+        """
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("from cish import pyenv, venvpool\n"
+                "pool = venvpool.get_pool(pyenv.interpeter_pyenv(), size=1)\n"
+                "with pool.lease(timeout=120) as env:\n"
+                "    pass\n")
+        tmp = os.path.join(self.tmpdir, "tmp")
+        os.mkdir(tmp)
+        subprocess.check_call([sys.executable, "-c", code], cwd=root,
+                              env=dict(os.environ, TMPDIR=tmp))
+        self.assertEqual([], os.listdir(tmp))
+
+    def test_refill(self):
+        """
+        The pool refills in the background after a lease.
+        """
+        lease = self.pool.lease(timeout=120)
+        for _ in range(1200):
+            if self.pool.ready:
+                break
+            time.sleep(0.1)
+        self.assertEqual(1, self.pool.ready)
+        lease.release()
@@ -0,0 +1,161 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import io
+import sys
+import contextlib
+import os.path
+import shutil
+import tempfile
+import zipfile
+import time
+
+from cish import pyenv
+from cish import commands
+from cish import wheelhouse
+
+
+def make_wheel(directory, name, version):
+    """
+    Writes a minimal pure-python wheel with a module `name`.
+    """
+    dist_info = "{0}-{1}.dist-info".format(name, version)
+    files = {
+        "{0}.py".format(name): "VERSION = {0!r}\n".format(version),
+        dist_info + "/METADATA": "Metadata-Version: 2.1\nName: {0}\nVersion: {1}\n".format(name, version),
+        dist_info + "/WHEEL": "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    record = "".join("{0},,\n".format(path) for path in files) + dist_info + "/RECORD,,\n"
+    files[dist_info + "/RECORD"] = record
+    path = os.path.join(directory, "{0}-{1}-py3-none-any.whl".format(name, version))
+    with zipfile.ZipFile(path, "w") as z:
+        for arcname, content in files.items():
+            z.writestr(arcname, content)
+    return path
+
+
+class TestWheelhouse(unittest.TestCase):
+    """
+    Unit-tests for :class:`wheelhouse.Wheelhouse`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.sources = os.path.join(self.tmpdir, "sources")
+        os.mkdir(self.sources)
+        self.house = wheelhouse.Wheelhouse(os.path.join(self.tmpdir, "house"))
+        self.env = pyenv.interpeter_pyenv()
+        self.env.wheelhouse = self.house
+
+    def tearDown(self):
+        commands.rm_wait()
+        shutil.rmtree(self.tmpdir)
+
+    def venv(self, name):
+        return self.env.virtualenv(os.path.join(self.tmpdir, name))
+
+    def test_offline_after_first_install(self):
+        """
+        Wheels collected once are installed without the original source.
+        """
+        make_wheel(self.sources, "cishdemo", "1.0")
+        venv = self.venv("a")
+        venv.pip("install", "--no-index", "--find-links", self.sources, "cishdemo")
+        directory = self.house.directory(venv)
+        self.assertEqual(["cishdemo-1.0-py3-none-any.whl"],
+                         [n for n in os.listdir(directory) if n.endswith(".whl")])
+
+        shutil.rmtree(self.sources)
+        venv = self.venv("b")
+        venv.pip("install", "--no-index", "cishdemo")
+        venv.python("-c", "import cishdemo; assert cishdemo.VERSION == '1.0'")
+
+    def test_output_streamed(self):
+        """
+        The output of both installation attempts is passed on.
+        """
+        make_wheel(self.sources, "cishdemo", "1.0")
+        venv = self.venv("a")
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+        with contextlib.redirect_stdout(stdout):
+            venv.pip("install", "--no-index", "--find-links", self.sources, "cishdemo")
+        stdout.flush()
+        text = stdout.buffer.getvalue().decode("utf-8")
+        self.assertIn("No matching distribution found for cishdemo", text)
+        self.assertIn("Successfully installed cishdemo-1.0", text)
+
+    def test_build_requirements(self):
+        """
+        Build requirements are read from `pyproject.toml`.
+        """
+        self.assertIn("wheel", wheelhouse._build_requirements(self.sources))
+        with open(os.path.join(self.sources, "pyproject.toml"), "w") as f:
+            f.write('[build-system]\nrequires = ["flit_core>=3.2"]\n')
+        if sys.version_info >= (3, 11):
+            self.assertEqual(["flit_core>=3.2"], wheelhouse._build_requirements(self.sources))
+
+    def test_parallel_collect(self):
+        """
+        Several packages are collected in one go.
+        """
+        make_wheel(self.sources, "cishdemo", "1.0")
+        make_wheel(self.sources, "cishother", "2.0")
+        venv = self.venv("a")
+        venv.pip("install", "--no-index", "--find-links", self.sources, "cishdemo", "cishother")
+        venv.python("-c", "import cishdemo, cishother")
+        self.assertEqual(2, len(os.listdir(self.house.directory(venv))))
+
+    def test_touch(self):
+        """
+        Installing from the wheelhouse marks wheels as used.
+        """
+        make_wheel(self.sources, "cishdemo", "1.0")
+        venv = self.venv("a")
+        venv.pip("install", "--no-index", "--find-links", self.sources, "cishdemo")
+        path = os.path.join(self.house.directory(venv), "cishdemo-1.0-py3-none-any.whl")
+        os.utime(path, (0, 0))
+        venv = self.venv("b")
+        venv.pip("install", "--no-index", "cishdemo")
+        self.assertGreater(os.path.getmtime(path), time.time() - 3600)
+
+    def test_cleanup(self):
+        """
+        The least recently used wheels are deleted first.
+        """
+        directory = os.path.join(self.house.root, "cp00-any")
+        os.makedirs(directory)
+        old = make_wheel(directory, "old", "1.0")
+        new = make_wheel(directory, "new", "1.0")
+        os.utime(old, (1000, 1000))
+        self.house.max_size = os.path.getsize(new)
+        self.house.cleanup()
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
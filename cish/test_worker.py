@@ -0,0 +1,143 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import unittest
+import os.path
+import sys
+import time
+import shutil
+import tempfile
+
+from cish import pyenv
+from cish import commands
+from cish import worker
+
+
+class TestWorker(unittest.TestCase):
+    """
+    Unit-tests for :class:`worker.Worker`.
+    """
+
+    def setUp(self):
+        self.env = pyenv.interpeter_pyenv()
+        self.worker = worker.Worker(self.env.find_executable("python"))
+
+    def tearDown(self):
+        self.worker.close()
+
+    def test_run(self):
+        """
+        Printed output is returned.
+        """
+        self.assertEqual(self.worker.run("print(1 + 2)"), "3\n")
+
+    def test_fresh_namespace(self):
+        """
+        Each snippet runs in its own namespace.
+        """
+        self.worker.run("x = 1")
+        self.assertRaises(worker.WorkerError, self.worker.run, "print(x)")
+
+    def test_call(self):
+        """
+        Functions can be called by name.
+        """
+        self.assertEqual(self.worker.call("os.path:join", "a", "b"), os.path.join("a", "b"))
+        self.assertEqual(self.worker.call("json:dumps", [1], sort_keys=True), "[1]")
+
+    def test_error(self):
+        """
+        Exceptions are raised with the remote traceback.
+        """
+        try:
+            self.worker.run("raise KeyError('missing')")
+            self.fail("expected WorkerError")
+        except worker.WorkerError as e:
+            self.assertIn("missing", str(e))
+        self.assertEqual(self.worker.run("print('still alive')"), "still alive\n")
+
+    def test_stray_output(self):
+        """
+        Output written directly to the file descriptor does not break the protocol.
+        """
+        self.worker.run("import os; os.write(1, b'noise')")
+        self.assertEqual(self.worker.call("math:sqrt", 4), 2.0)
+
+    def test_working_directory(self):
+        """
+        Requests run in the directory set with `cish.cd`.
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with commands.cd(tmpdir):
+                self.assertEqual(os.path.realpath(self.worker.run("import os; print(os.getcwd())").strip()),
+                                 os.path.realpath(tmpdir))
+                self.assertEqual(os.path.realpath(self.worker.call("os:getcwd")),
+                                 os.path.realpath(tmpdir))
+            self.assertEqual(os.path.realpath(self.worker.call("os:getcwd")),
+                             os.path.realpath(os.getcwd()))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_crash_restart(self):
+        """
+        A crashed worker is restarted on the next request.
+        """
+        self.assertRaises(worker.WorkerError, self.worker.run, "import os; os._exit(1)")
+        self.assertEqual(self.worker.run("print('back')"), "back\n")
+
+    def test_idle_timeout(self):
+        """
+        The worker is stopped after the idle timeout and restarted on demand.
+        """
+        self.worker.idle_timeout = 0.2
+        self.worker.run("pass")
+        self.assertTrue(self.worker.alive)
+        time.sleep(0.6)
+        self.assertFalse(self.worker.alive)
+        self.assertEqual(self.worker.run("print(1)"), "1\n")
+
+    def test_fast(self):
+        """
+        Requests to a running worker are much cheaper than starting python.
+        """
+        self.worker.run("pass")
+        start = time.time()
+        for _ in range(100):
+            self.worker.run("pass")
+        self.assertTrue((time.time() - start) / 100 < 0.01)
+
+    def test_pyenv_worker(self):
+        """
+        Environments share one worker per interpreter.
+        """
+        self.assertIs(self.env.worker(), pyenv.interpeter_pyenv().worker())
+        self.assertEqual(self.env.worker().call("sys:getrecursionlimit"),
+                         sys.getrecursionlimit())
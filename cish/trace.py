@@ -0,0 +1,311 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sys
+import time
+import atexit
+import functools
+import threading
+
+
+_recorder = None
+_local = threading.local()
+_atexit_registered = False
+
+
+class Record(object):
+    """
+    Timing and resource usage of one command or file system operation.
+
+    `start` and `duration` are in seconds, `start` is relative to the
+    moment recording was enabled. `user_time`, `system_time` (seconds) and
+    `max_rss` (bytes) describe the child process and are `None` for
+    operations that don't start one or on platforms without `os.wait4`.
+    """
+
+    def __init__(self, kind, name, args, env, cwd):
+        self.kind = kind
+        self.name = name
+        self.args = args
+        self.env = env
+        self.cwd = cwd
+        self.thread = threading.current_thread().ident
+        self.start = None
+        self.duration = None
+        self.returncode = None
+        self.user_time = None
+        self.system_time = None
+        self.max_rss = None
+
+
+class _Recorder(object):
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.records = []
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+
+class _Span(object):
+    """
+    Context manager measuring the wall time of the code it encloses.
+    Child processes waited for with :func:`wait` inside the span add their
+    resource usage to the record.
+    """
+
+    def __init__(self, recorder, record):
+        self.recorder = recorder
+        self.record = record
+
+    def __enter__(self):
+        self.outer = getattr(_local, "record", None)
+        _local.record = self.record
+        self.record.start = time.perf_counter() - self.recorder.origin
+        return self.record
+
+    def __exit__(self, type_, value, traceback):
+        self.record.duration = time.perf_counter() - self.recorder.origin - self.record.start
+        _local.record = self.outer
+        if self.record.returncode is None and value is not None:
+            self.record.returncode = getattr(value, "returncode", None)
+        self.recorder.add(self.record)
+        return False
+
+
+class _NoSpan(object):
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, type_, value, traceback):
+        return False
+
+_no_span = _NoSpan()
+
+
+def enable(summary=False, trace_file=None):
+    """
+    Starts recording all commands invoked through :class:`PyEnv` and all
+    calls to :func:`cish.rm`, :func:`cish.mkdirs` and :meth:`PyEnv.virtualenv`.
+    Records made before are discarded.
+
+    :param summary: Print :func:`summary` to stderr when the
+        interpreter exits.
+
+    :param trace_file: Write the records in the Chrome trace-event format
+        to this file when the interpreter exits. It can be loaded with
+        `chrome://tracing` or Perfetto.
+    """
+    global _recorder, _atexit_registered
+    _recorder = _Recorder()
+    _recorder.summary = summary
+    from cish import commands
+    _recorder.trace_file = commands.abspath(trace_file) if trace_file else None
+    if not _atexit_registered:
+        atexit.register(_at_exit)
+        _atexit_registered = True
+
+
+def disable():
+    """
+    Stops recording. Returns the records made so far.
+    """
+    global _recorder
+    result = records()
+    _recorder = None
+    return result
+
+
+def enabled():
+    return _recorder is not None
+
+
+def records():
+    """
+    Returns a list with the :class:`Record` instances made so far.
+    """
+    if _recorder is None:
+        return []
+    with _recorder.lock:
+        return list(_recorder.records)
+
+
+def span(kind, name, args=(), env=None):
+    """
+    Returns a context manager that records the code it encloses.
+    Does nothing if recording is disabled.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return _no_span
+    from cish import commands
+    return _Span(recorder, Record(kind, name, list(args),
+                                  repr(env) if env is not None else None,
+                                  commands.pwd()))
+
+
+def traced(kind, method=False):
+    """
+    Decorator recording each call of a function taking paths as arguments.
+
+    :param method: The function is a method of :class:`PyEnv`. The
+        instance is recorded as environment.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            env, paths = (args[0], args[1:]) if method else (None, args)
+            with span(kind, kind, [str(p) for p in paths], env):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wait(process):
+    """
+    Waits for a `subprocess.Popen` process to finish. While recording, the
+    exit code and the resource usage of the child are added to the
+    current record.
+
+    :returns: The exit code.
+    """
+    record = getattr(_local, "record", None) if _recorder is not None else None
+    if record is None:
+        return process.wait()
+
+    if hasattr(os, "wait4") and process.returncode is None:
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = _exitcode(status)
+        record.user_time = rusage.ru_utime
+        record.system_time = rusage.ru_stime
+        # kilobytes on linux, bytes on osx.
+        record.max_rss = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    else:
+        process.wait()
+    record.returncode = process.returncode
+    return process.returncode
+
+
+def _exitcode(status):
+    """
+    Converts a status returned by `os.wait4` into an exit code like
+    `subprocess` reports it, negative for a signal.
+    """
+    if hasattr(os, "waitstatus_to_exitcode"):
+        return os.waitstatus_to_exitcode(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def chrome_trace(items=None):
+    """
+    Converts records to the Chrome trace-event format.
+
+    :returns: `dict` that can be serialized to JSON.
+    """
+    if items is None:
+        items = records()
+    pid = os.getpid()
+    events = []
+    for r in items:
+        events.append({
+            "name": r.name,
+            "cat": r.kind,
+            "ph": "X",
+            "ts": r.start * 1e6,
+            "dur": r.duration * 1e6,
+            "pid": pid,
+            "tid": r.thread,
+            "args": {
+                "args": r.args,
+                "env": r.env,
+                "cwd": r.cwd,
+                "returncode": r.returncode,
+                "user_time": r.user_time,
+                "system_time": r.system_time,
+                "max_rss": r.max_rss,
+            }
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export_chrome_trace(path, items=None):
+    """
+    Writes records to a file in the Chrome trace-event format.
+    """
+    with open(path, 'w') as f:
+        import json
+        json.dump(chrome_trace(items), f)
+
+
+def summary(items=None):
+    """
+    Returns a table of the records, slowest first.
+    """
+    if items is None:
+        items = records()
+
+    def seconds(value):
+        return "-" if value is None else "{0:.3f}".format(value)
+
+    rows = [("wall", "user", "sys", "rss MB", "exit", "command")]
+    for r in sorted(items, key=lambda r: -r.duration):
+        rows.append((seconds(r.duration),
+                     seconds(r.user_time),
+                     seconds(r.system_time),
+                     "-" if r.max_rss is None else "{0:.1f}".format(r.max_rss / 1024.0**2),
+                     "-" if r.returncode is None else str(r.returncode),
+                     " ".join([r.name] + r.args)))
+    rows.append((seconds(sum(r.duration for r in items)), "", "", "", "",
+                 "total ({n} records)".format(n=len(items))))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(5)]
+    lines = []
+    for row in rows:
+        cells = [cell.rjust(width) for cell, width in zip(row, widths)]
+        lines.append("  ".join(cells + [row[5]]))
+    return "\n".join(lines)
+
+
+def _at_exit():
+    if _recorder is None:
+        return
+    if _recorder.trace_file:
+        export_chrome_trace(_recorder.trace_file)
+    if _recorder.summary:
+        sys.stderr.write(summary() + "\n")
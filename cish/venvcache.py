@@ -0,0 +1,299 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import subprocess
+import hashlib
+import json
+import uuid
+
+from cish import commands
+from cish import probe
+
+
+class VenvCache(object):
+    """
+    Cache of pristine virtual environments.
+
+    Creating a virtual environment with the `virtualenv` tool is slow. The
+    cache creates one template per combination of interpreter, interpreter
+    version, `system_side_packages` and requirements, and produces new
+    environments by cloning the template. Files are cloned with reflinks
+    where the file system supports them, and hard linked otherwise (unless
+    disabled). Paths to the template in the scripts and `pyvenv.cfg` are
+    rewritten to point to the clone.
+
+    Templates that were not used for the longest time are evicted once the
+    cache grows beyond `max_size` bytes.
+
+    Usually used through :meth:`PyEnv.virtualenv`::
+
+        cache = cish.VenvCache()
+        venv = cish.default.virtualenv("env", cache=cache, requirements=["nose"])
+    """
+
+    def __init__(self, root=None, max_size=2 * 1024**3, hardlink=True):
+        """
+        :param root: Directory in which the templates are stored. Defaults to
+            `cish/venvs` inside the user's cache directory.
+
+        :param max_size: Maximal total size of the templates in bytes.
+
+        :param hardlink: Use hard links if reflinks are not supported. The
+            files in the clones then share their content with the template and
+            must not be modified in place. Tools like `pip` replace files
+            rather than editing them, so this is usually safe.
+        """
+        if root is None:
+            root = os.path.join(commands._cache_dir(), "venvs")
+        self.root = commands.abspath(root)
+        self.max_size = max_size
+        self.hardlink = hardlink
+
+
+    def key(self, env, system_side_packages=False, requirements=None):
+        """
+        Returns the key of the template for the given parameters.
+
+        Requirement and constraint files (`-r`, `-c`), including the
+        ones they refer to, are part of the key with their content, so
+        editing them produces a new template. Relative paths are resolved
+        against :func:`cish.pwd`.
+        """
+        python = os.path.realpath(env.find_executable("python"))
+        info = probe.interpreter_info(python)
+        content = json.dumps([python,
+                              info.implementation,
+                              info.version,
+                              bool(system_side_packages),
+                              list(requirements or []),
+                              _requirement_files(requirements or [], commands.pwd())])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+    def template(self, env, system_side_packages=False, requirements=None):
+        """
+        Returns the path to the template for the given parameters,
+        creating it if it does not exist yet.
+        """
+        entry = os.path.join(self.root, self.key(env, system_side_packages, requirements))
+        template = os.path.join(entry, "venv")
+        if not os.path.isdir(template):
+            self._create(entry, env, system_side_packages, requirements)
+        os.utime(os.path.join(entry, "meta.json"), None)
+        return template
+
+
+    def clone(self, env, path, system_side_packages=False, requirements=None):
+        """
+        Creates a virtual environment at `path` by cloning the template for the
+        given parameters. `path` must not exist.
+
+        :returns: Absolute path of the new virtual environment.
+        """
+        path = commands.abspath(path)
+        template = self.template(env, system_side_packages, requirements)
+        _clone_tree(template, path, self.hardlink)
+        self.evict(keep=os.path.dirname(template))
+        return path
+
+
+    def evict(self, keep=None):
+        """
+        Deletes the least recently used templates until the total size
+        is within `max_size`.
+
+        :param keep: Path of a template entry that must not be deleted.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            entry = os.path.join(self.root, name)
+            metafile = os.path.join(entry, "meta.json")
+            if not os.path.isfile(metafile):
+                continue
+            with open(metafile, 'r') as f:
+                size = json.load(f)["size"]
+            entries.append((os.path.getmtime(metafile), entry, size))
+            total += size
+
+        for _, entry, size in sorted(entries):
+            if total <= self.max_size:
+                break
+            if entry == keep:
+                continue
+            commands.rm(entry, defer=True)
+            total -= size
+
+
+    def _create(self, entry, env, system_side_packages, requirements):
+        """
+        Creates the template in a temporary directory and moves it into
+        place, so that concurrent jobs never see a half-created template.
+        """
+        commands.mkdirs(self.root)
+        tmp = os.path.join(self.root, "tmp-" + uuid.uuid4().hex)
+        try:
+            commands.mkdirs(tmp)
+            args = [env.find_executable("virtualenv"), "venv"]
+            if system_side_packages:
+                args.append("--system-site-packages")
+            subprocess.check_call(args, cwd=tmp)
+
+            if requirements:
+                # like a venv created without cache: relative paths resolve
+                # against cish.pwd() and the wheelhouse is used.
+                from cish import pyenv
+                venv = pyenv.from_virtualenv(os.path.join(tmp, "venv"))
+                venv.wheelhouse = env.wheelhouse
+                venv.pip("install", *requirements)
+
+            # the template is moved, so its own path must be replaced as well.
+            _replace_prefix(os.path.join(tmp, "venv"), os.path.join(tmp, "venv"),
+                            os.path.join(entry, "venv"))
+
+            with open(os.path.join(tmp, "meta.json"), 'w') as f:
+                json.dump({"size": _tree_size(tmp)}, f)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                if not os.path.isdir(entry):
+                    raise
+                # created concurrently by someone else.
+        finally:
+            commands.rm(tmp)
+
+
+def _requirement_files(args, base):
+    """
+    Returns `[path, sha256]` of the requirement and constraint files
+    referenced by the `pip install` arguments, following references
+    inside the files. Missing files are listed with `None`.
+    """
+    result = []
+    seen = set()
+
+    def visit(args, base):
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            name, _, value = arg.partition("=")
+            if name not in ("-r", "--requirement", "-c", "--constraint"):
+                continue
+            if not value:
+                if not args:
+                    break
+                value = args.pop(0)
+            path = os.path.normpath(os.path.join(base, value))
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except (IOError, OSError):
+                result.append([path, None])
+                continue
+            result.append([path, hashlib.sha256(data).hexdigest()])
+            nested = []
+            for line in data.decode("utf-8", "replace").splitlines():
+                nested.extend(line.split("#", 1)[0].split())
+            visit(nested, os.path.dirname(path))
+
+    visit(args, base)
+    return result
+
+
+def _clone_tree(src, dst, hardlink):
+    """
+    Clones the template `src` to `dst` and fixes up the paths.
+    """
+    for dirpath, dirnames, filenames in os.walk(src):
+        target_dir = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(target_dir)
+        for name in dirnames + filenames:
+            source = os.path.join(dirpath, name)
+            target = os.path.join(target_dir, name)
+            if os.path.islink(source):
+                link = os.readlink(source)
+                if os.path.isabs(link) and _is_inside(link, src):
+                    link = os.path.join(dst, os.path.relpath(link, src))
+                os.symlink(link, target)
+                if name in dirnames:
+                    dirnames.remove(name)
+            elif name in filenames:
+                commands._clone_file(source, target, hardlink)
+    _replace_prefix(dst, src, dst)
+
+
+def _replace_prefix(venv, old, new):
+    """
+    Replaces `old` with `new` in the scripts and configuration files
+    of the virtual environment at `venv`.
+
+    The files are replaced rather than modified, as they might be
+    hard links to the template.
+    """
+    old = old.encode("utf-8")
+    new = new.encode("utf-8")
+    candidates = [os.path.join(venv, "pyvenv.cfg")]
+    for scripts in ["bin", "Scripts"]:
+        scripts = os.path.join(venv, scripts)
+        if os.path.isdir(scripts):
+            candidates.extend(os.path.join(scripts, name) for name in os.listdir(scripts))
+
+    for candidate in candidates:
+        if os.path.islink(candidate) or not os.path.isfile(candidate):
+            continue
+        with open(candidate, 'rb') as f:
+            content = f.read()
+        if old not in content:
+            continue
+        mode = os.stat(candidate).st_mode
+        os.remove(candidate)
+        with open(candidate, 'wb') as f:
+            f.write(content.replace(old, new))
+        os.chmod(candidate, mode)
+
+
+def _is_inside(path, directory):
+    directory = os.path.join(directory, "")
+    return path.startswith(directory)
+
+
+def _tree_size(path):
+    """
+    Total size in bytes of the files in the given directory.
+    """
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            total += os.lstat(os.path.join(dirpath, name)).st_size
+    return total
@@ -0,0 +1,329 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import glob
+import threading
+import tempfile
+import atexit
+import itertools
+
+from cish import commands
+
+
+class Lease(object):
+    """
+    A virtual environment taken from a :class:`VenvPool`. `env` is its
+    :class:`PyEnv`. Give it back with :meth:`release` or by using the
+    lease as a context manager::
+
+        with pool.lease() as venv:
+            venv.pip("install", ".")
+            venv.nosetests()
+    """
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+        self.env = slot.env
+        self.path = slot.path
+
+    def release(self):
+        """
+        Returns the environment to the pool. Must not be used afterwards.
+        """
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool._release(slot)
+
+    def __enter__(self):
+        return self.env
+
+    def __exit__(self, type_, value, traceback):
+        self.release()
+        return False
+
+
+class _Slot(object):
+
+    def __init__(self, path, env, manifest, size):
+        self.path = path
+        self.env = env
+        self.manifest = manifest
+        self.size = size
+
+
+class VenvPool(object):
+    """
+    Pool of ready-to-use virtual environments of an interpreter.
+
+    A background thread creates environments with :meth:`PyEnv.virtualenv`
+    and records the content of their `site-packages` and scripts
+    directories. A returned environment is reset to that state by deleting
+    everything that was added. Environments in which recorded files were
+    changed or removed are discarded and replaced by new ones.
+
+    The pool keeps `size` environments ready, but never more than fit into
+    `max_size` bytes including the leased ones.
+
+    Usually used through :meth:`PyEnv.lease_venv`.
+    """
+
+    def __init__(self, env, size=2, requirements=None, system_side_packages=False,
+                 cache=None, root=None, max_size=None):
+        """
+        :param env: Environment whose interpreter the virtual environments use.
+
+        :param size: Number of environments kept ready.
+
+        :param requirements: Packages installed into each environment.
+            They are part of the recorded baseline.
+
+        :param system_side_packages: See :meth:`PyEnv.virtualenv`.
+
+        :param cache: Optional :class:`cish.VenvCache` used to create the environments.
+
+        :param root: Directory for the environments. Defaults to a new
+            temporary directory that is deleted by :meth:`close`.
+
+        :param max_size: Disk budget in bytes for all environments of the pool.
+        """
+        self.env = env
+        self.size = size
+        self.requirements = list(requirements or [])
+        self.system_side_packages = system_side_packages
+        self.cache = cache
+        self.max_size = max_size
+        self._own_root = root is None
+        self.root = tempfile.mkdtemp(prefix="cish-pool-") if root is None else commands.abspath(root)
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._ready = []
+        self._leased = 0
+        self._creating = 0
+        self._venv_size = None
+        self._error = None
+        self._closed = False
+        self._counter = itertools.count()
+        self._thread = threading.Thread(target=self._refill)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def lease(self, timeout=None):
+        """
+        Takes a ready environment from the pool, waiting for one to be
+        created if necessary.
+
+        :raises RuntimeError: if the pool is closed, or creating an
+            environment failed.
+        """
+        with self._lock:
+            while not self._ready:
+                if self._closed:
+                    raise RuntimeError("Pool is closed.")
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise RuntimeError("Creating a virtual environment failed: {e}".format(e=error))
+                if not self._changed.wait(timeout):
+                    raise RuntimeError("No virtual environment ready within {t}s.".format(t=timeout))
+            slot = self._ready.pop(0)
+            self._leased += 1
+            self._changed.notify_all()
+        return Lease(self, slot)
+
+
+    @property
+    def ready(self):
+        """
+        Number of environments ready to be leased.
+        """
+        with self._lock:
+            return len(self._ready)
+
+
+    def close(self, defer=True):
+        """
+        Stops refilling and deletes the ready environments (and the
+        root directory if it was created by the pool).
+
+        :param defer: Delete in the background, see :func:`cish.rm`.
+        """
+        with self._lock:
+            self._closed = True
+            ready, self._ready = self._ready, []
+            self._changed.notify_all()
+        self._thread.join()
+        for slot in ready:
+            commands.rm(slot.path, defer=defer)
+        if self._own_root:
+            commands.rm(self.root, defer=defer)
+
+
+    def _target(self):
+        """
+        Number of environments that should exist (ready, leased or being
+        created) given the size and the disk budget.
+        """
+        target = self.size + self._leased
+        if self.max_size is not None and self._venv_size:
+            target = min(target, max(1, self.max_size // self._venv_size))
+        return target
+
+
+    def _refill(self):
+        while True:
+            with self._lock:
+                while not self._closed and (
+                        self._error is not None or
+                        len(self._ready) >= self.size or
+                        len(self._ready) + self._leased + self._creating >= self._target()):
+                    self._changed.wait()
+                if self._closed:
+                    return
+                self._creating += 1
+            try:
+                slot = self._create()
+            except Exception as e:
+                with self._lock:
+                    self._creating -= 1
+                    self._error = e
+                    self._changed.notify_all()
+                continue
+            with self._lock:
+                self._creating -= 1
+                self._venv_size = slot.size
+                if self._closed:
+                    commands.rm(slot.path, defer=True)
+                else:
+                    self._ready.append(slot)
+                self._changed.notify_all()
+
+
+    def _create(self):
+        path = os.path.join(self.root, "venv-{0}".format(next(self._counter)))
+        env = self.env.virtualenv(path, self.system_side_packages,
+                                  self.requirements or None, self.cache)
+        manifest = _manifest(path)
+        size = sum(entry[0] for entry in manifest.values() if entry is not None)
+        return _Slot(path, env, manifest, size)
+
+
+    def _release(self, slot):
+        if self._closed or not _reset(slot.path, slot.manifest):
+            commands.rm(slot.path, defer=True)
+            slot = None
+        with self._lock:
+            self._leased -= 1
+            if slot is not None:
+                self._ready.append(slot)
+            self._changed.notify_all()
+
+
+def _tracked_dirs(path):
+    """
+    Directories of a virtual environment that installations modify.
+    """
+    patterns = ["lib/python*/site-packages", "lib64/python*/site-packages",
+                "Lib/site-packages", "bin", "Scripts"]
+    dirs = []
+    for pattern in patterns:
+        for match in glob.glob(os.path.join(path, pattern.replace("/", os.sep))):
+            real = os.path.realpath(match)
+            if os.path.isdir(match) and real not in [os.path.realpath(d) for d in dirs]:
+                dirs.append(match)
+    return dirs
+
+
+def _manifest(path):
+    """
+    Records the files and directories of the tracked directories.
+
+    :returns: `dict` mapping relative paths to `(size, mtime)` for
+        files and `None` for directories.
+    """
+    manifest = {}
+    for tracked in _tracked_dirs(path):
+        for dirpath, dirnames, filenames in os.walk(tracked):
+            manifest[os.path.relpath(dirpath, path)] = None
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                st = os.lstat(full)
+                manifest[os.path.relpath(full, path)] = (st.st_size, st.st_mtime_ns)
+    return manifest
+
+
+def _reset(path, manifest):
+    """
+    Deletes everything not in the manifest.
+
+    :returns: `False` if files of the manifest were changed or removed,
+        so that the environment cannot be reset.
+    """
+    current = _manifest(path)
+    for relpath, entry in manifest.items():
+        if current.get(relpath, False) != entry:
+            return False
+    extra = sorted(relpath for relpath in current if relpath not in manifest)
+    for relpath in extra:
+        full = os.path.join(path, relpath)
+        if os.path.lexists(full):
+            commands.rm(full)
+    return True
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(env, size=2, requirements=None, system_side_packages=False, cache=None, max_size=None):
+    """
+    Returns the shared pool for the given interpreter and baseline,
+    creating it on first use.
+    """
+    key = (commands.abspath(env.find_executable("python")),
+           tuple(requirements or []), bool(system_side_packages))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = VenvPool(env, size, requirements, system_side_packages,
+                                          cache, max_size=max_size)
+        return pool
+
+
+@atexit.register
+def _close_pools():
+    # atexit handlers registered from here on would not run, so don't
+    # leave anything to the deleter's handler.
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close(defer=False)
+        _pools.clear()
+    commands.rm_wait()
@@ -0,0 +1,272 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os.path
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cish import commands
+from cish import capture
+from cish import batch
+
+
+#: Options passed on to `pip wheel` when wheels are collected.
+_WHEEL_OPTIONS = {
+    "-i", "--index-url", "--extra-index-url", "-f", "--find-links", "--no-index",
+    "--no-binary", "--only-binary", "--prefer-binary", "--pre", "--trusted-host",
+    "--no-build-isolation", "--no-deps", "--cache-dir", "--no-cache-dir",
+    "--proxy", "--timeout", "--retries", "--cert", "--client-cert",
+}
+
+#: Options that select where packages come from. Installations from the
+#: wheelhouse ignore them.
+_INDEX_OPTIONS = {
+    "-i", "--index-url", "--extra-index-url", "-f", "--find-links", "--no-index",
+}
+
+_PROCESSING = re.compile(r"^Processing (.+\.whl)\s*$", re.MULTILINE)
+
+
+class Wheelhouse(object):
+    """
+    Local directory of wheels shared by all environments.
+
+    Installations first try to get by with the wheels already in the
+    wheelhouse, without contacting any index (`pip install --no-index
+    --find-links`). Only if that fails, the wheels of the requested
+    packages and their dependencies are built or downloaded with
+    `pip wheel`, one package per process in parallel, and the
+    installation is repeated from the wheelhouse.
+
+    Wheels are stored in one directory per ABI and platform tag of the
+    interpreter. Once the wheelhouse grows beyond `max_size` bytes, the
+    wheels that were not used for the longest time are deleted.
+
+    Usually used by setting :attr:`PyEnv.wheelhouse`, after which
+    `env.pip("install", ...)` goes through the wheelhouse::
+
+        env.wheelhouse = cish.Wheelhouse()
+        venv = env.virtualenv("env", requirements=["nose"])
+    """
+
+    def __init__(self, root=None, max_size=1024**3, workers=4):
+        """
+        :param root: Directory of the wheelhouse. Defaults to `cish/wheels`
+            inside the user's cache directory.
+
+        :param max_size: Maximal total size of the wheels in bytes.
+
+        :param workers: Number of `pip wheel` processes run in parallel.
+        """
+        if root is None:
+            root = os.path.join(commands._cache_dir(), "wheels")
+        self.root = commands.abspath(root)
+        self.max_size = max_size
+        self.workers = workers
+
+
+    def directory(self, env):
+        """
+        Returns the directory with the wheels for the interpreter of `env`.
+        """
+        info = env.info
+        return os.path.join(self.root, "{abi}-{platform}".format(
+            abi=info.abi_tag, platform=info.platform_tag))
+
+
+    def install(self, env, *args):
+        """
+        Installs packages into `env` from the wheelhouse, collecting
+        missing wheels first.
+
+        :param args: Arguments for `pip install`, without `install`.
+
+        :raises subprocess.CalledProcessError: if the installation fails.
+        """
+        directory = self.directory(env)
+        commands.mkdirs(directory)
+        pip = env.find_executable("pip")
+        options, values = batch._split(args)
+        options = list(_filter_options(options, exclude=_INDEX_OPTIONS))
+        argv = [pip, "install", "--no-index", "--find-links", directory] + options + [
+            arg for value in values for arg in value]
+
+        earlier = ""
+        output = capture.call(argv, tee=_Echo(), check=False)
+        if output.returncode:
+            with output:
+                earlier = output.read().decode(errors="replace")
+            self.collect(env, *args)
+            output = capture.call(argv, tee=_Echo(), check=False)
+        with output:
+            text = output.read().decode(errors="replace")
+        if output.returncode:
+            raise subprocess.CalledProcessError(output.returncode, argv, output=earlier + text)
+        self._touch(directory, text)
+
+
+    def collect(self, env, *args):
+        """
+        Builds or downloads the wheels needed to install the given
+        packages into the wheelhouse, one package per `pip wheel`
+        process.
+
+        For local projects, the wheels of their build requirements are
+        collected as well, so that they can be installed (also editable)
+        from the wheelhouse without an index.
+
+        :param args: Arguments for `pip install`, without `install`.
+        """
+        directory = self.directory(env)
+        commands.mkdirs(directory)
+        pip = env.find_executable("pip")
+        options, values = batch._split(args)
+        options = list(_filter_options(options, include=_WHEEL_OPTIONS))
+        constraints = [arg for value in values if value[0] in ("-c", "--constraint") for arg in value]
+        targets = [_strip_editable(value) for value in values
+                   if value[0] not in ("-c", "--constraint")]
+        for target in list(targets):
+            if len(target) == 1 and os.path.isdir(commands.abspath(target[0])):
+                for requirement in _build_requirements(commands.abspath(target[0])):
+                    if (requirement,) not in targets:
+                        targets.append((requirement,))
+
+        def build(target):
+            tmpdir = tempfile.mkdtemp(prefix=".cish-wheels-", dir=directory)
+            try:
+                capture.call([pip, "wheel", "--wheel-dir", tmpdir, "--find-links", directory] +
+                             options + constraints + list(target))
+                for name in os.listdir(tmpdir):
+                    os.replace(os.path.join(tmpdir, name), os.path.join(directory, name))
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for future in [executor.submit(build, target) for target in targets]:
+                future.result()
+        self.cleanup()
+
+
+    def cleanup(self):
+        """
+        Deletes the least recently used wheels until the wheelhouse is
+        no larger than `max_size`.
+        """
+        wheels = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".whl"):
+                    path = os.path.join(dirpath, name)
+                    st = os.stat(path)
+                    wheels.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in wheels)
+        for _, size, path in sorted(wheels):
+            if total <= self.max_size:
+                break
+            os.unlink(path)
+            total -= size
+
+
+    def _touch(self, directory, text):
+        """
+        Marks the wheels pip installed from `directory` as recently used.
+        """
+        now = time.time()
+        for match in _PROCESSING.finditer(text):
+            path = os.path.join(directory, os.path.basename(match.group(1)))
+            if os.path.exists(path):
+                os.utime(path, (now, now))
+
+
+class _Echo(object):
+    """
+    Binary file object passing the output of pip on to `sys.stdout`.
+    """
+
+    def write(self, data):
+        sys.stdout.flush()
+        stream = getattr(sys.stdout, "buffer", None)
+        if stream is None:
+            sys.stdout.write(data.decode(errors="replace"))
+            sys.stdout.flush()
+        else:
+            stream.write(data)
+            stream.flush()
+
+
+def _strip_editable(value):
+    """
+    Turns an editable requirement into the path or URL of the project.
+    """
+    if value[0] in ("-e", "--editable"):
+        return value[1:]
+    if value[0].startswith(("-e=", "--editable=")):
+        return (value[0].split("=", 1)[1],)
+    return value
+
+
+def _build_requirements(path):
+    """
+    Returns the build requirements of the project in the directory
+    `path`, as declared in its `pyproject.toml`. Projects without one
+    are built with setuptools.
+    """
+    default = ["setuptools>=40.8.0", "wheel"]
+    try:
+        import tomllib
+    except ImportError:
+        return default
+    try:
+        with open(os.path.join(path, "pyproject.toml"), "rb") as f:
+            return list(tomllib.load(f)["build-system"]["requires"])
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return default
+
+
+def _filter_options(options, include=None, exclude=()):
+    """
+    Selects options of `pip install` (with their values) by name.
+    """
+    options = list(options)
+    while options:
+        option = options.pop(0)
+        name = option.split("=", 1)[0]
+        value = []
+        if name in batch._WITH_VALUE and "=" not in option and options:
+            value = [options.pop(0)]
+        if (include is None or name in include) and name not in exclude:
+            yield option
+            for v in value:
+                yield v
@@ -0,0 +1,277 @@
+# Copyright (c) 2014, Stefan C. Mueller
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import struct
+import json
+import threading
+import subprocess
+import atexit
+
+from cish import commands
+
+
+class WorkerError(Exception):
+    """
+    Raised if code executed by a :class:`Worker` fails or the worker
+    process crashes. For failures inside the worker the message contains
+    the traceback from the worker process.
+    """
+
+
+#: Code executed by the worker process. Kept compatible with old interpreters.
+_WORKER_SOURCE = r'''
+import sys, os, json, struct, traceback, importlib
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+def main():
+    requests = os.fdopen(os.dup(0), 'rb')
+    responses = os.fdopen(os.dup(1), 'wb')
+    # output of the executed code must not end up in the protocol stream.
+    os.dup2(2, 1)
+    while True:
+        header = requests.read(4)
+        if len(header) < 4:
+            return
+        length, = struct.unpack('>I', header)
+        request = json.loads(requests.read(length).decode('utf-8'))
+        try:
+            os.chdir(request['cwd'])
+            if request['op'] == 'run':
+                stdout = sys.stdout
+                sys.stdout = StringIO()
+                try:
+                    namespace = {'__name__': '__cish_worker__'}
+                    exec(compile(request['code'], '<cish-worker>', 'exec'), namespace)
+                    result = sys.stdout.getvalue()
+                finally:
+                    sys.stdout = stdout
+            else:
+                module, _, name = request['target'].partition(':')
+                obj = importlib.import_module(module)
+                for attr in name.split('.'):
+                    obj = getattr(obj, attr)
+                result = obj(*request['args'], **request['kwargs'])
+            response = json.dumps({'ok': True, 'result': result})
+        except BaseException:
+            response = json.dumps({'ok': False, 'error': traceback.format_exc()})
+        data = response.encode('utf-8')
+        responses.write(struct.pack('>I', len(data)) + data)
+        responses.flush()
+
+main()
+'''
+
+
+class Worker(object):
+    """
+    Long-lived python process executing snippets of code.
+
+    Starting an interpreter takes tens of milliseconds, a request to a
+    running worker takes well below a millisecond. Requests and responses
+    are JSON messages with a length prefix, sent over the worker's
+    stdin and stdout.
+
+    Each request runs in the current directory of the calling thread,
+    see :func:`cish.pwd`.
+
+    The worker is started on the first request and stopped after being
+    idle for `idle_timeout` seconds. If it crashed, it is restarted on the
+    next request.
+
+    Usually obtained from :meth:`PyEnv.worker`::
+
+        version = env.worker().run("import sys; print(sys.version)")
+        path = env.worker().call("os.path:join", "a", "b")
+    """
+
+    def __init__(self, python, idle_timeout=60):
+        self.python = python
+        self.idle_timeout = idle_timeout
+        self._process = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+
+    def run(self, code):
+        """
+        Executes python code in a fresh namespace.
+
+        :returns: Everything the code printed to `sys.stdout`.
+
+        :raises WorkerError: if the code raises an exception.
+        """
+        return self._request({"op": "run", "code": code})
+
+
+    def call(self, target, *args, **kwargs):
+        """
+        Calls a function in the worker.
+
+        :param target: Function to call as `"module:function"`, for example
+            `"os.path:join"` or `"pkg.mod:Class.method"`.
+
+        Arguments and the return value must be JSON serializable.
+
+        :returns: The return value of the function.
+
+        :raises WorkerError: if the function raises an exception.
+        """
+        return self._request({"op": "call", "target": target,
+                              "args": list(args), "kwargs": kwargs})
+
+
+    def close(self):
+        """
+        Stops the worker process. A later request starts a new one.
+        """
+        with self._lock:
+            self._stop()
+
+
+    @property
+    def alive(self):
+        """
+        `True` if the worker process is running.
+        """
+        return self._process is not None and self._process.poll() is None
+
+
+    def _request(self, request):
+        request["cwd"] = commands.pwd()
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            if not self.alive:
+                self._start()
+            try:
+                _write_frame(self._process.stdin, request)
+                response = _read_frame(self._process.stdout)
+            except (IOError, OSError, EOFError) as e:
+                self._stop()
+                raise WorkerError("Worker process {python} crashed: {e}".format(
+                    python=self.python, e=e))
+            finally:
+                if self.idle_timeout is not None and self._process is not None:
+                    self._timer = threading.Timer(self.idle_timeout, self._idle)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if not response["ok"]:
+            raise WorkerError(response["error"])
+        return response["result"]
+
+
+    def _start(self):
+        self._stop()
+        self._process = subprocess.Popen([self.python, "-c", _WORKER_SOURCE],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+    def _stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        process, self._process = self._process, None
+        if process is None:
+            return
+        process.stdin.close()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+    def _idle(self):
+        if self._lock.acquire(False):
+            try:
+                self._stop()
+            finally:
+                self._lock.release()
+
+
+def _write_frame(f, message):
+    """
+    Writes a JSON message with a 4 byte length prefix.
+    """
+    data = json.dumps(message).encode("utf-8")
+    f.write(struct.pack(">I", len(data)) + data)
+    f.flush()
+
+
+def _read_frame(f, max_length=None):
+    """
+    Reads a message written by :func:`_write_frame`.
+
+    :param max_length: Largest message in bytes that is accepted.
+
+    :raises EOFError: if the stream ended.
+
+    :raises ValueError: if the message is larger than `max_length`.
+    """
+    header = _read_exactly(f, 4)
+    length, = struct.unpack(">I", header)
+    if max_length is not None and length > max_length:
+        raise ValueError("Message of {n} bytes exceeds the limit of {m} bytes.".format(
+            n=length, m=max_length))
+    return json.loads(_read_exactly(f, length).decode("utf-8"))
+
+
+def _read_exactly(f, n):
+    data = f.read(n)
+    if len(data) < n:
+        raise EOFError("Stream ended unexpectedly.")
+    return data
+
+
+_workers = {}
+_workers_lock = threading.Lock()
+
+def get_worker(python, idle_timeout=60):
+    """
+    Returns the shared worker of the given interpreter.
+    """
+    key = commands.abspath(python)
+    with _workers_lock:
+        worker = _workers.get(key)
+        if worker is None:
+            worker = _workers[key] = Worker(key, idle_timeout)
+        worker.idle_timeout = idle_timeout
+        return worker
+
+
+@atexit.register
+def _close_workers():
+    with _workers_lock:
+        for worker in _workers.values():
+            worker.close()
@@ -29,8 +29,42 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-from setuptools import setup
+from setuptools import setup, Command
 import os.path
+import sys
+
+
+class Benchmark(Command):
+    """
+    Runs the benchmarks in `cish.benchmarks`.
+    """
+    description = "run the benchmarks"
+    user_options = [
+        ("output=", "o", "write the results to this JSON file"),
+        ("baseline=", "b", "compare with the results in this JSON file"),
+        ("repeat=", "r", "samples per benchmark"),
+        ("files=", "f", "files in file system benchmarks"),
+    ]
+
+    def initialize_options(self):
+        self.output = None
+        self.baseline = None
+        self.repeat = None
+        self.files = None
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        from cish import benchmarks
+        argv = []
+        for option in ("output", "baseline", "repeat", "files"):
+            value = getattr(self, option)
+            if value is not None:
+                argv += ["--" + option, str(value)]
+        if benchmarks.main(argv):
+            sys.exit(1)
+
 
 if os.path.exists('README.rst'):
     with open('README.rst') as f:
@@ -46,5 +80,7 @@ setup(name='cish',
       author_email='scm@smurn.org',
       url='https://github.com/smurn/cish',
       packages=['cish'],
+      python_requires='>=3.7',
       install_requires = ['virtualenv'],
+      cmdclass = {'benchmark': Benchmark},
      )